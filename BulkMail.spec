@@ -9,7 +9,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('style.css', '.'), ('MessageScreen.css', '.')],
-    hiddenimports=['textual.widgets._tab_pane', 'reportlab.graphics.barcode.code128', 'reportlab.graphics.barcode.code93', 'reportlab.graphics.barcode.code39', 'reportlab.graphics.barcode.usps', 'reportlab.graphics.barcode.usps4s', 'reportlab.graphics.barcode.ecc200datamatrix'],
+    hiddenimports=['textual.widgets._tab_pane', 'pandas', 'markdown', 'markdown.extensions.tables', 'exchangelib', 'exchangelib.errors', 'exchangelib.protocol', 'xhtml2pdf.pisa', 'pypdf', 'reportlab.graphics.barcode.code128', 'reportlab.graphics.barcode.code93', 'reportlab.graphics.barcode.code39', 'reportlab.graphics.barcode.usps', 'reportlab.graphics.barcode.usps4s', 'reportlab.graphics.barcode.ecc200datamatrix'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
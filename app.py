@@ -1,16 +1,33 @@
+import asyncio
 import os
-from dataclasses import dataclass
 from os.path import realpath
-import re
 import configparser
+import multiprocessing
+import time
 from datetime import datetime
 
 from textual.reactive import reactive
 from textual.screen import ModalScreen
 
 from tablewrapper import TableWrapper, DataRow
-
-from textual import on
+from template import CompiledTemplate
+from sender import Email, Sender, sender_from_config
+from engine import AsyncSendEngine, SendJob
+from jobs import JobProgress
+from filters import HELP as FILTER_HELP
+from session import AccountManager
+from throttle import throttle_from_config
+from export import StreamingPdfExport, PerRecipientPdfExport, SEPARATOR, write_pdf
+from rendering import HtmlTemplate, markdown_to_html
+from ingest import is_table, read_header, read_batches, used_columns
+from tablecache import table_cache_from_config
+from stats import Stats, activate, deactivate, settings_report, timed
+from preview import PreviewCache, PreviewDocument, split_blocks
+from lazy import warm_up
+from mailing import AddressCheck, find_mail_option, split_subject, hidden_message, recipient_message
+
+from markdown_it import MarkdownIt
+from textual import on, work
 from textual.app import App, ComposeResult
 from textual.widgets import (
     Header,
@@ -24,21 +41,19 @@ from textual.widgets import (
     DirectoryTree,
     Static,
     Button, Label,
-    OptionList
+    OptionList,
+    ProgressBar
 )
 from textual.containers import Container, VerticalScroll, Horizontal
 from textual.validation import Number, Regex
-import pandas as pd
-from exchangelib import DELEGATE, Account, Credentials, Message, HTMLBody
-import markdown
-from markdown.extensions.tables import TableExtension
-from xhtml2pdf import pisa
+from textual.worker import get_current_worker
 from textual_textarea import TextArea
 
 help_text = """
 # Usage
 1. Press the `o`-Key (or select "Open File" in the Footer at the bottom) to open files.
-2. Select a Table File (XLSX, CSV).
+2. Select a Table File (XLSX, CSV, Parquet, Feather).
+    - large tables are loaded in the background, rows show up while the rest is read
     - if no usable file can be found, press "Open Folder" to open the current directory in the file explorer
         move your files to this directory and try again
 3. Filter the table
@@ -47,10 +62,13 @@ help_text = """
     - Selecting a column in the dropdown and typing in the input field to filter the table
         (e.g. select "Name" and type "John" to only show rows with "John" in the "Name" column)
         (numbers can be filtered with "<" or ">" e.g. "<100" to only show numbers smaller than 100)
+        (ranges, "!=", contains, regular expressions and several columns can be combined, see below)
 4. Press the `o`-Key again to open a template file (MD, TXT).
     - The first line of the template can be a subject (e.g. "subject: Hello World")
     - Move between the different recipients with the `<<` and `>>` buttons (or type in the input field)
     - 0 is the empty template which will not be sent
+    - only the parts of the preview that differ between recipients are redrawn, the next and previous
+      recipients are prepared in the background
 5. Put in your credentials in the "Settings" tab (full Email Address and Password)
 6. If not automatically selected, select the column with the email addresses in the dropdown
 7. Press the "Send All" Button to send all emails
@@ -58,34 +76,32 @@ help_text = """
 * Press the "Send Preview" Button to send the current preview to your email address
 * Press the "Export All" Button to export all emails to a PDF file
 * Press the "Export Preview" Button to export the current preview to a PDF file
-
+* Press the "Export Each" Button to export one PDF per email into a new folder, with an index.csv listing
+  the files. Files are named after the email column, or the column set as `filename_column` in the
+  `[export]` section of `.settings.ini`
+* Sending and exporting run in the background, the progress dialog shows emails/s and the remaining time
+  and can cancel the job after the current batch
+* The "Stats" tab shows the time spent per stage (reading, rendering, sending, PDF conversion) and the peak
+  memory of the last job. Every job also writes a JSON report to `.job_reports`
+
+### Filter
+""" + FILTER_HELP + """
 ### Editor
 
 The editor supports markdown and has a list with all columns of the table.
 You can insert a column by clicking on it in the list.
 Column Names are surrounded by double square brackets (e.g. [[Name]]).
 CTRL+S to save the template.
+CTRL+P shows a live preview of the current recipient next to the editor, it follows your changes as you type.
 
 """
 
 
-class Sidebar(Container):
-    pass
-
-
-@dataclass
-class Email:
-    address: str
-    subject: str
-    message: str
+EMPTY_TEMPLATE = "*This is the empty template which will not be sent.*   \n\n"
 
 
-def find_mail_option(options: list):
-    mail_list = ["mail", " adress", "address"]
-    for option in options:
-        for mail in mail_list:
-            if mail in option.lower():
-                return option
+class Sidebar(Container):
+    pass
 
 
 class BulkMail(App, inherit_bindings=False):
@@ -94,9 +110,22 @@ class BulkMail(App, inherit_bindings=False):
     filter_column = None
     all_none = False
     template = "## Preview"
+    compiled_template = None
+    html_template = None
     preview_number = 0
+    preview_cache = None
+    preview_timer = None
+    last_preview = 0.0
+    live_timer = None
+    live_shown = None
     email_credential = None
     password_credential = None
+    loading_table = False
+    progress_screen = None
+    account_manager = None
+    table_cache = None
+    session_stats = None
+    job_stats = None
     config = configparser.ConfigParser()
 
     def compose(self) -> ComposeResult:
@@ -106,7 +135,7 @@ class BulkMail(App, inherit_bindings=False):
             yield Static("Open File")
             with Container():
                 yield DirectoryTree(self.tree_path, id="tree")
-            yield Static("Table Formats: XLSX, CSV")
+            yield Static("Table Formats: XLSX, CSV, Parquet, Feather")
             yield Static("Template Formats: MD, TXT")
             yield Button("Open Folder", id="open")
         self.tabs = TabbedContent()
@@ -124,7 +153,7 @@ class BulkMail(App, inherit_bindings=False):
                     self.subject_input = Input(placeholder="Subject", id="subject")
                     yield self.subject_input
                     with VerticalScroll(id="preview_scroll", classes=""):
-                        self.preview = Markdown("## Preview")
+                        self.preview = PreviewDocument("## Preview")
                         yield self.preview
                 with TabPane("Table", id="table"):
                     with VerticalScroll(id="table_scroll", classes=""):
@@ -143,8 +172,13 @@ class BulkMail(App, inherit_bindings=False):
                 with TabPane("Editor", id="editor"):
                     self.fields = OptionList()
                     yield self.fields
-                    self.editor_input = TextArea(language="markdown", theme="github-dark")
-                    yield self.editor_input
+                    with Horizontal(id="editor_container"):
+                        self.editor_input = TextArea(language="markdown", theme="github-dark")
+                        yield self.editor_input
+                        self.live_scroll = VerticalScroll(id="live_scroll", classes="-hidden")
+                        with self.live_scroll:
+                            self.live_preview = PreviewDocument()
+                            yield self.live_preview
                 with TabPane("Settings", id="settings"):
                     yield Label("Exchange Credentials")
                     self.email_validator = Regex(regex=r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$",
@@ -157,6 +191,16 @@ class BulkMail(App, inherit_bindings=False):
                     yield self.password_credentials_input
                     self.save_button = Button("Save", id="save", classes="settings")
                     yield self.save_button
+                with TabPane("Stats", id="stats"):
+                    with VerticalScroll(id="stats_scroll"):
+                        self.job_stats_label = Static("No job yet", classes="stats")
+                        yield self.job_stats_label
+                        self.job_stats_table = DataTable(classes="stats")
+                        yield self.job_stats_table
+                        self.session_stats_label = Static("", classes="stats")
+                        yield self.session_stats_label
+                        self.session_stats_table = DataTable(classes="stats")
+                        yield self.session_stats_table
                 with TabPane("Help", id="help"):
                     yield Markdown(help_text)
             with Container(classes="horizontal bottom", id="bottom_container"):
@@ -170,6 +214,8 @@ class BulkMail(App, inherit_bindings=False):
                 yield self.export_all_button
                 self.export_preview_button = Button("Export Preview", id="export_preview", classes="send-buttons")
                 yield self.export_preview_button
+                self.export_each_button = Button("Export Each", id="export_each", classes="send-buttons")
+                yield self.export_each_button
             yield Footer()
         self.load_credentials()
 
@@ -188,18 +234,80 @@ class BulkMail(App, inherit_bindings=False):
                 id="dialog",
             )
 
+    class ProgressScreen(ModalScreen):
+        CSS_PATH = "MessageScreen.css"
+
+        def __init__(self, title: str, total: int):
+            super().__init__()
+            self.title_label = Static(title, classes="progress")
+            self.progress_bar = ProgressBar(total=total, show_eta=False)
+            self.stats_label = Static("", classes="progress")
+            self.progress = None
+            self.mounted = False
+
+        def compose(self) -> ComposeResult:
+            yield Container(
+                self.title_label,
+                self.progress_bar,
+                self.stats_label,
+                Horizontal(
+                    Button("Cancel", variant="error", id="cancel_job"),
+                    classes="buttons"
+                ),
+                id="dialog",
+            )
+
+        def on_mount(self):
+            self.mounted = True
+            if self.progress is not None:
+                self.update_progress(self.progress)
+
+        def update_progress(self, progress: JobProgress):
+            self.progress = progress
+            if self.mounted:
+                self.progress_bar.update(total=progress.total, progress=progress.done)
+                self.stats_label.update(str(progress))
+
+        def update_title(self, title: str):
+            self.title_label.update(title)
+
     @on(Button.Pressed, "#ok")
     def ok_button_pressed(self, event: Button.Pressed) -> None:
         self.app.pop_screen()
+        self.start_job("Sending emails", len(self.datatable.store.sendable()))
         self.send_all_mails()
 
     @on(Button.Pressed, "#cancel")
     def cancel_button_pressed(self, event: Button.Pressed) -> None:
         self.app.pop_screen()
 
+    @on(Button.Pressed, "#cancel_job")
+    def cancel_job_pressed(self, event: Button.Pressed) -> None:
+        self.workers.cancel_group(self, "jobs")
+        if self.progress_screen is not None:
+            self.progress_screen.update_title("Cancelling after the current batch...")
+
+    def start_job(self, title: str, total: int):
+        self.progress_screen = self.ProgressScreen(title, total)
+        self.push_screen(self.progress_screen)
+
+    def update_job(self, progress: JobProgress, title: str = None):
+        if self.progress_screen is not None:
+            self.progress_screen.update_progress(progress)
+            if title is not None:
+                self.progress_screen.update_title(title)
+
+    def finish_job(self, message: str, severity: str = "information"):
+        if self.progress_screen is not None:
+            self.progress_screen.dismiss()
+            self.progress_screen = None
+        self.notify(message, severity=severity)
+
     def load_credentials(self):
+        self.config.read(".settings.ini")
+        self.account_manager = AccountManager(max_connections=throttle_from_config(self.config).max_workers)
+        self.table_cache = table_cache_from_config(self.config)
         try:
-            self.config.read(".settings.ini")
             self.email_credential = self.config["credentials"]["email"]
             self.email_credentials_input.value = self.email_credential
             self.password_credential = self.config["credentials"]["password"]
@@ -208,14 +316,73 @@ class BulkMail(App, inherit_bindings=False):
             pass
 
     def on_mount(self):
+        self.session_stats = activate(Stats())
+        self.preview_cache = PreviewCache(self.config.getint("preview", "cache", fallback=256))
+        self.job_stats_table.add_columns(*Stats.COLUMNS)
+        self.session_stats_table.add_columns(*Stats.COLUMNS)
+        self.set_interval(1, self.refresh_stats)
         self.bind("q", "quit", description="Quit")
         self.bind("o", "toggle_sidebar", description="Open File")
         self.bind("d", "toggle_dark", description="Toggle Dark mode")
+        self.bind("ctrl+p", "toggle_live_preview", description="Live Preview")
+        if self.config.getboolean("preview", "live", fallback=False):
+            self.action_toggle_live_preview()
+        if self.config.getboolean("startup", "warm_up", fallback=True):
+            # a moment after the first paint, so the imports do not hold the GIL while the UI builds up
+            self.set_timer(0.5, warm_up)
 
     def action_toggle_dark(self) -> None:
         """An action to toggle dark mode."""
         self.dark = not self.dark
 
+    def action_toggle_live_preview(self) -> None:
+        if self.live_timer is None:
+            self.live_scroll.remove_class("-hidden")
+            self.live_shown = None
+            self.live_timer = self.set_interval(self.config.getfloat("preview", "delay", fallback=0.1),
+                                                self.refresh_live_preview)
+        else:
+            self.live_scroll.add_class("-hidden")
+            self.live_timer.stop()
+            self.live_timer = None
+        # the editor does not redraw its text when it gets narrower or wider
+        text_input = self.editor_input.text_input
+        self.call_after_refresh(text_input.update, text_input._content)
+
+    def begin_stats(self, job: str, **info) -> Stats:
+        self.job_stats = activate(Stats(job))
+        self.job_stats.info.update(info)
+        return self.job_stats
+
+    def end_stats(self, stats: Stats, **counts):
+        """Stop recording into the job's stats and write its report, in the job's thread or the app's."""
+        deactivate(stats)
+        stats.finish(**counts)
+        directory = self.config.get("stats", "reports", fallback=".job_reports")
+        if directory:
+            try:
+                stats.write(directory, settings_report(self.config))
+            except OSError as e:
+                stats.info["report_error"] = str(e)
+
+    def refresh_stats(self):
+        if self.tabs.active != "stats":
+            return
+        for stats, label, table, title in (
+                (self.job_stats, self.job_stats_label, self.job_stats_table, "Last job"),
+                (self.session_stats, self.session_stats_label, self.session_stats_table, "Since the app started")):
+            if stats is None:
+                continue
+            stats.sample_memory()
+            text = f"{title}: {stats}"
+            if stats.report_path is not None:
+                text += f"\nReport: {stats.report_path}"
+            elif "report_error" in stats.info:
+                text += f"\nReport not written: {stats.info['report_error']}"
+            label.update(text)
+            table.clear()
+            table.add_rows(stats.rows())
+
     def action_switch_tab(self, tab_id: str):
         self.tabs.active = tab_id
 
@@ -223,9 +390,12 @@ class BulkMail(App, inherit_bindings=False):
     def tab_activated(self, event: TabbedContent.TabActivated):
         if event.tab.id == "editor":
             self.editor_input.focus()
+        if event.tab.id == "stats":
+            self.refresh_stats()
         if event.tab.id == "preview":
             if self.editor_input.text != self.template:
                 self.template = self.editor_input.text
+                self.compiled_template = None
                 self.set_preview()
 
     @on(OptionList.OptionSelected)
@@ -242,12 +412,45 @@ class BulkMail(App, inherit_bindings=False):
         if event.value is not None:
             if self.filter_column is not None:
                 self.datatable.style_column(self.filter_column, style=None)
-            self.filter_column = self.datatable.column_list[self.datatable.header.index(event.value)]
+            self.filter_column = self.datatable.column_list[self.datatable.header_index[event.value]]
             self.datatable.style_column(self.filter_column, style=f"blue")
 
+    @on(Select.Changed, "#email")
+    def email_changed(self, event: Select.Changed) -> None:
+        if self.datatable.width is None:
+            return
+        if event.value not in self.datatable.header_index:
+            self.datatable.set_email_column(None)
+        else:
+            self.check_emails(event.value)
+
+    @work(thread=True, exclusive=True, group="check")
+    def check_emails(self, header: str):
+        worker = get_current_worker()
+        store = self.datatable.store
+        check = AddressCheck()
+        check.extend(store.column_data[store.schema.header_index[header]])
+        self.call_from_thread(self.emails_checked, worker, store, header, check)
+
+    def emails_checked(self, worker, store, header: str, check: AddressCheck):
+        if worker.is_cancelled or store is not self.datatable.store:
+            return
+        self.datatable.set_email_column(header, check)
+        if not self.loading_table:
+            self.notify_addresses()
+
+    def notify_addresses(self):
+        counts = self.datatable.status_counts()
+        if counts["invalid"] or counts["duplicate"]:
+            self.notify(f"{counts['invalid']} invalid and {counts['duplicate']} duplicate email addresses, "
+                        f"they will not be sent. See the Status column.", severity="warning")
+
     @on(Input.Submitted, "#filter")
     def input_submitted(self, event: Input.Submitted) -> None:
-        self.datatable.filter(self.filter_select.value, self.filter_input.value)
+        try:
+            self.datatable.filter(self.filter_select.value, self.filter_input.value)
+        except ValueError as e:
+            self.notify(str(e), severity="error")
 
     def action_toggle_sidebar(self) -> None:
         sidebar = self.sidebar
@@ -266,60 +469,182 @@ class BulkMail(App, inherit_bindings=False):
 
     @on(Button.Pressed, "#all_none")
     def all_none(self, event: Button.Pressed) -> None:
-        if self.all_none:
-            for row in self.datatable.row_list:
-                self.datatable.hide_row(row)
-        else:
-            for row in self.datatable.row_list:
-                self.datatable.show_row(row)
+        self.datatable.set_all_hidden(self.all_none)
         self.all_none = not self.all_none
 
     @on(DirectoryTree.FileSelected)
     def file_selected(self, event: DirectoryTree.FileSelected) -> None:
         if str(event.path).endswith(".md") or str(event.path).endswith(".txt"):
             with open(event.path) as f:
-                self.template = f.read()
-                if self.template.startswith("subject:"):
-                    self.subject_input.value = self.template.splitlines()[0].replace("subject:", "").strip()
-                    self.template = "\n".join(self.template.splitlines()[1:])
+                subject, self.template = split_subject(f.read())
+                if subject is not None:
+                    self.subject_input.value = subject
             self.action_switch_tab("preview")
-        elif str(event.path).endswith(".xlsx") or str(event.path).endswith(".csv"):
-            if str(event.path).endswith(".xlsx"):
-                df = pd.read_excel(event.path, sheet_name=0)
-            elif str(event.path).endswith(".csv"):
-                df = pd.read_csv(event.path)
+        elif is_table(event.path):
             self.datatable.clear(columns=True)
-            self.datatable.load_dataframe(df)
+            # the old table's column, the new table has its own
+            self.filter_column = None
+            self.loading_table = True
+            self.validator.maximum = 0
             self.action_switch_tab("table")
-            self.filter_select.set_options(((h, h) for h in self.datatable.header))
-            self.email_select.set_options(((h, h) for h in self.datatable.header))
-            self.fields.clear_options()
-            self.fields.add_options([h for h in self.datatable.header])
-            if mail_option := find_mail_option(self.datatable.header):
-                self.email_select.value = mail_option
-            self.validator.maximum = len(self.datatable)
+            self.load_table(str(event.path), self.template)
         else:
             return
+        self.compiled_template = None
         self.editor_input.text = self.template
         self.set_preview()
         self.action_toggle_sidebar()
 
+    @work(thread=True, exclusive=True, group="load")
+    def load_table(self, path: str, template: str):
+        worker = get_current_worker()
+        name = os.path.basename(path)
+        stats = self.begin_stats("load", file=name)
+        try:
+            columns = None
+            if self.config.getboolean("loading", "template_columns_only", fallback=False):
+                header = read_header(path)
+                columns = used_columns(header, template, find_mail_option(header))
+            use_cache = self.config.getboolean("cache", "enabled", fallback=True)
+            batches = (self.table_cache.read_batches if use_cache else read_batches)(
+                path, columns, first=self.config.getint("loading", "first_rows", fallback=1000),
+                chunk_size=self.config.getint("loading", "chunk_size", fallback=10000)
+            )
+            for batch in batches:
+                if worker.is_cancelled:
+                    self.end_stats(stats, cancelled=1)
+                    return
+                self.call_from_thread(self.table_batch_loaded, worker, batch, f"Loading {name}")
+        except Exception as e:
+            self.end_stats(stats, failed=1)
+            self.call_from_thread(self.table_load_failed, worker, f"Could not load {name}: {e}")
+            return
+        self.call_from_thread(self.table_batch_loaded, worker, None, name)
+        self.end_stats(stats, rows=len(self.datatable), columns=len(self.datatable.header))
+
+    def table_load_failed(self, worker, message: str):
+        if not worker.is_cancelled:
+            self.loading_table = False
+        self.notify(message, severity="error")
+
+    def table_batch_loaded(self, worker, batch, status: str):
+        if worker.is_cancelled:
+            # a newer file was selected, this batch belongs to the old one
+            return
+        if batch is not None:
+            first = self.datatable.width is None
+            self.datatable.append_dataframe(batch)
+            if first:
+                self.table_header_loaded()
+        self.validator.maximum = len(self.datatable)
+        self.sub_title = f"{status}: {len(self.datatable)} rows"
+        if batch is None:
+            self.loading_table = False
+            self.notify_addresses()
+
+    def table_header_loaded(self):
+        self.filter_select.set_options(((h, h) for h in self.datatable.header))
+        self.email_select.set_options(((h, h) for h in self.datatable.header))
+        self.fields.clear_options()
+        self.fields.add_options([h for h in self.datatable.header])
+        if mail_option := find_mail_option(self.datatable.header):
+            self.email_select.value = mail_option
+        if self.email_select.value in self.datatable.header_index:
+            # the value may not have changed, a new table needs checking anyway
+            self.check_emails(self.email_select.value)
+        self.compiled_template = None
+        self.set_preview()
+
     def set_preview(self) -> None:
+        if self.preview_timer is not None:
+            self.preview_timer.stop()
+            self.preview_timer = None
+        self.last_preview = time.monotonic()
         if self.preview_number == 0:
-            preview_text = "*This is the empty template which will not be sent.*   \n\n"
-            self.preview.update(preview_text + self.template)
+            self.preview.update(EMPTY_TEMPLATE + self.template)
         elif self.preview_number <= len(self.datatable):
-            row = self.datatable[self.preview_number - 1]
-            self.preview.update(self.create_message_from_template(self.template, row))
+            compiled = self.get_compiled_template(self.template)
+            version = self.preview_cache.use(compiled)
+            number = self.preview_number
+            self.preview.show(self.preview_blocks(version, compiled, number, self.datatable[number - 1]))
+            # rows are views of the table's store, the worker keeps reading the table they were taken from
+            count = self.config.getint("preview", "prefetch", fallback=2)
+            neighbours = [(other, self.datatable[other - 1]) for distance in range(1, count + 1)
+                          for other in (number + distance, number - distance) if 1 <= other <= len(self.datatable)]
+            self.prefetch_previews(version, compiled, neighbours)
+
+    def schedule_preview(self) -> None:
+        """Render the preview now, or with the latest number once [preview] delay passed since the last one."""
+        if self.preview_timer is not None:
+            return
+        wait = self.last_preview + self.config.getfloat("preview", "delay", fallback=0.1) - time.monotonic()
+        if wait <= 0:
+            self.set_preview()
+        else:
+            self.preview_timer = self.set_timer(wait, self.set_preview)
+
+    def preview_blocks(self, version: int, compiled: CompiledTemplate, number: int, row: DataRow,
+                       parser=None) -> list:
+        """The blocks of recipient `number`, from the preview cache or rendered, in any thread."""
+        key = (version, number, row.hidden)
+        blocks = self.preview_cache.get(key)
+        if blocks is None:
+            with timed("preview"):
+                message = compiled.render(row.values)
+                blocks = split_blocks(hidden_message(message) if row.hidden else message, parser)
+            self.preview_cache.put(key, blocks)
+        return blocks
+
+    @work(thread=True, exclusive=True, group="prefetch")
+    def prefetch_previews(self, version: int, compiled: CompiledTemplate, rows: list):
+        worker = get_current_worker()
+        parser = MarkdownIt("gfm-like")
+        for number, row in rows:
+            if worker.is_cancelled:
+                return
+            self.preview_blocks(version, compiled, number, row, parser)
+
+    def refresh_live_preview(self):
+        if self.tabs.active != "editor":
+            return
+        number = self.preview_number if self.preview_number <= len(self.datatable) else 0
+        row = self.datatable[number - 1] if number else None
+        shown = (self.editor_input.text, number, len(self.datatable), row is not None and row.hidden)
+        if shown == self.live_shown:
+            return
+        self.live_shown = shown
+        self.render_live_preview(shown[0], row)
+
+    @work(thread=True, exclusive=True, group="live")
+    def render_live_preview(self, template: str, row: DataRow | None):
+        worker = get_current_worker()
+        if row is None:
+            text = EMPTY_TEMPLATE + template
+        else:
+            message = CompiledTemplate(template, row.header).render(row.values)
+            text = hidden_message(message) if row.hidden else message
+        with timed("preview"):
+            blocks = split_blocks(text)
+        self.call_from_thread(self.live_preview_rendered, worker, blocks)
+
+    def live_preview_rendered(self, worker, blocks: list):
+        if not worker.is_cancelled:
+            self.live_preview.show(blocks)
+
+    def get_compiled_template(self, template: str) -> CompiledTemplate:
+        if self.compiled_template is None or self.compiled_template.source is not template:
+            self.compiled_template = CompiledTemplate(template, self.datatable.header)
+        return self.compiled_template
+
+    def get_html_template(self, template: str) -> HtmlTemplate:
+        compiled = self.get_compiled_template(template)
+        if self.html_template is None or self.html_template.compiled is not compiled:
+            self.html_template = HtmlTemplate(compiled)
+        return self.html_template
 
     def create_message_from_template(self, template: str, row: DataRow) -> str:
-        message = template
-        for key, value in zip(self.datatable.header, row.values):
-            message = message.replace(f"[[{key}]]", str(value))
-        if row.hidden:
-            hidden_message = "*This message is excluded by filter and will not be sent. Check the table.*"
-            message = hidden_message + "   \n\n" + message + "   \n\n" + hidden_message
-        return message
+        message = self.get_compiled_template(template).render(row.values)
+        return hidden_message(message) if row.hidden else message
 
     @on(Input.Submitted, "#preview-selector")
     def preview_submitted(self, event: Input.Submitted) -> None:
@@ -331,14 +656,14 @@ class BulkMail(App, inherit_bindings=False):
     def previous_pressed(self, event: Button.Pressed) -> None:
         self.preview_number = self.preview_number - 1 if self.preview_number > 0 else 0
         self.preview_input.value = str(self.preview_number)
-        self.set_preview()
+        self.schedule_preview()
 
     @on(Button.Pressed, "#next")
     def next_pressed(self, event: Button.Pressed) -> None:
         self.preview_number = self.preview_number + 1 if self.preview_number < len(self.datatable) else len(
             self.datatable)
         self.preview_input.value = str(self.preview_number)
-        self.set_preview()
+        self.schedule_preview()
 
     @on(Button.Pressed, "#save")
     def save_pressed(self, event: Button.Pressed) -> None:
@@ -349,6 +674,8 @@ class BulkMail(App, inherit_bindings=False):
         self.save_credentials()
 
     def save_credentials(self):
+        if self.email_credential is not None:
+            self.account_manager.invalidate(self.email_credential)
         self.email_credential = self.email_credentials_input.value
         self.password_credential = self.password_credentials_input.value
         self.config["credentials"] = {"email": self.email_credential,
@@ -362,41 +689,95 @@ class BulkMail(App, inherit_bindings=False):
         if self.mail_pre_check():
             return
         message_screen = self.MessageScreen()
-        message_screen.message = "Are you sure you want to send " + str(self.datatable.count_non_hidden()) + " emails?"
+        message_screen.message = "Are you sure you want to send " + str(len(self.datatable.store.sendable())) + " emails?"
         self.push_screen(message_screen)
 
-    def send_all_mails(self):
-        self.notify("Sending " + str(self.datatable.count_non_hidden()) + " emails...")
-        emails = []
-        regex = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')
-        for row in self.datatable.row_list:
-            if row.hidden is False:
-                email_address = row[self.email_select.value]
-                if re.fullmatch(regex, email_address):
-                    message = self.create_message_from_template(self.template, row)
-                    message = markdown.markdown(message, extensions=[TableExtension()])
-                    mail = Email(address=row[self.email_select.value], subject=self.subject_input.value,
-                                 message=message)
-                    emails.append(mail)
-                else:
-                    self.notify(f"Skipped invalid Email {email_address}")
-        sent_successfully = self.send_emails(emails)
-        self.notify(f"{sent_successfully} emails sent successfully.\n{len(emails) - sent_successfully} emails failed.")
+    @work(exclusive=True, group="jobs")
+    async def send_all_mails(self):
+        subject = self.subject_input.value
+        email_column = self.email_select.value
+        html_template = self.get_html_template(self.template)
+        job = None
+        excluded = 0
+        error = None
+        try:
+            if self.datatable.email_column != email_column:
+                # the check started when the column was chosen is still running
+                check = AddressCheck()
+                await asyncio.to_thread(check.extend, self.datatable.store.column_data[
+                    self.datatable.header_index[email_column]])
+                self.datatable.set_email_column(email_column, check)
+            progress = JobProgress(len(self.datatable.store.sendable()))
+            self.update_job(progress)
+
+            def chunk_done(result, done, total):
+                if progress.update(done):
+                    self.update_job(progress)
+
+            # finding the Exchange server can take a while
+            sender = await asyncio.to_thread(self.create_sender, chunk_done)
+            job = SendJob(self.datatable.store, email_column, subject, html_template, sender)
+            excluded = self.datatable.count_non_hidden() - job.total
+            stats = self.begin_stats("send", subject=subject, transport=sender.transport.name)
+            try:
+                await job.send()
+            finally:
+                self.account_manager.check_errors(self.email_credential, sender.errors)
+                self.end_stats(stats, excluded=excluded, **job.counts())
+        except Exception as e:
+            # a failed login or autodiscover ends the job, not the app
+            error = e
+        finally:
+            # also when cancelled, the progress screen has to go
+            message = "No emails sent." if job is None else self.send_summary(job.engine, job.total, excluded)
+            if error is not None:
+                self.finish_job(f"Sending failed: {error}\n{message}", severity="error")
+            else:
+                self.finish_job(message)
+
+    @staticmethod
+    def send_summary(engine: AsyncSendEngine, total: int, excluded: int) -> str:
+        sender = engine.sender
+        failed = len(sender.failures)
+        cancelled = total - sender.skipped - sender.sent - failed
+        message = f"{sender.sent} emails sent successfully ({engine.throughput:.1f} emails/s).\n{failed} emails failed."
+        if sender.skipped:
+            message += f"\n{sender.skipped} emails skipped, the send journal has them as sent already."
+        if excluded:
+            message += f"\n{excluded} rows skipped for an invalid or duplicate email address."
+        if cancelled:
+            message += f"\n{cancelled} emails cancelled."
+        return message
 
     @on(Button.Pressed, "#send_preview")
     def send_preview_pressed(self, event: Button.Pressed) -> None:
         if self.mail_pre_check():
             return
         self.notify("Sending Preview to " + self.email_credential + "...")
-        row = self.datatable[self.preview_number - 1]
-        message = self.create_message_from_template(self.template, row)
-        message = markdown.markdown(message, extensions=[TableExtension()])
-        mail = Email(address=self.email_credential, subject=self.subject_input.value, message=message)
-        sent_sucessfully = self.send_emails([mail])
-        if sent_sucessfully == 1:
-            self.notify("Preview sent sucessfully!")
+        self.send_preview()
+
+    @work(thread=True, exclusive=True, group="jobs")
+    def send_preview(self):
+        try:
+            row = self.datatable[self.preview_number - 1]
+            message = markdown_to_html(self.create_message_from_template(self.template, row))
+            mail = Email(address=self.email_credential, subject=self.subject_input.value, message=message)
+            sender = self.send_emails([mail])
+        except Exception as e:
+            # a failed login or autodiscover, the app keeps running
+            self.call_from_thread(self.notify, f"Sending the preview failed: {e}", severity="error")
+            return
+        if sender.sent == 1:
+            self.call_from_thread(self.notify, "Preview sent sucessfully!")
+        else:
+            error = sender.failures[0][1] if sender.failures else "cancelled"
+            self.call_from_thread(self.notify, f"Sending the preview failed: {error}", severity="error")
 
     def mail_pre_check(self):
+        if self.loading_table:
+            # a job would only see the rows read so far, while more are appended
+            self.notify("The table is still loading, please wait until it is complete")
+            return True
         if self.email_select.value is None or self.email_select.value == "":
             self.notify("Please select an email column")
             return True
@@ -408,60 +789,134 @@ class BulkMail(App, inherit_bindings=False):
             return True
         return False
 
-    def send_emails(self, emails: list) -> int:
-        credentials = Credentials(username=self.email_credential, password=self.password_credential)
-        exchange_account = Account(
-            primary_smtp_address=self.email_credential, credentials=credentials,
-            autodiscover=True, access_type=DELEGATE
-        )
-
-        message_ids = []
-        for email in emails:
-            message = Message(
-                account=exchange_account,
-                folder=exchange_account.drafts,
-                subject=email.subject,
-                body=HTMLBody(email.message),
-                to_recipients=[email.address]
-            ).save()
-            message_ids.append((message.id, message.changekey))
+    def create_sender(self, progress=None) -> Sender:
+        return sender_from_config(self.config, self.email_credential, self.password_credential,
+                                  self.account_manager.get_account, progress)
 
-        result = exchange_account.bulk_send(ids=message_ids)
-        return result.count(True)
+    def send_emails(self, emails: list, progress=None) -> Sender:
+        sender = self.create_sender(progress)
+        sender.send(emails)
+        self.account_manager.check_errors(self.email_credential, sender.errors)
+        return sender
 
     @on(Button.Pressed, "#export_preview")
     def export_preview_pressed(self, event: Button.Pressed) -> None:
         if self.mail_pre_check():
             return
+        self.start_job("Exporting preview", 1)
+        self.export_preview()
+
+    @work(thread=True, exclusive=True, group="jobs")
+    def export_preview(self):
         filename = datetime.now().strftime("%Y%m%d-%H%M_") + self.subject_input.value + ".pdf"
-        if self.preview_number > 0:
-            row = self.datatable[self.preview_number - 1]
-            message = self.create_message_from_template(self.template, row)
-            message = f"**Recipient:** *{row[self.email_select.value]}*\n\n" + message
-        else:
-            message = f"**Preview**\n\n" + self.template
-        message = markdown.markdown(message, extensions=[TableExtension()])
-        with open(filename, "w+b") as f:
-            pisa_status = pisa.CreatePDF(message + "<hr>", dest=f)
-        self.notify("Exported to " + filename)
+        try:
+            if self.preview_number > 0:
+                row = self.datatable[self.preview_number - 1]
+                message = next(self.recipient_messages([row]))
+            else:
+                message = f"**Preview**\n\n" + self.template
+            if not write_pdf(markdown_to_html(message) + "<hr>", filename):
+                raise ValueError("the message could not be converted to PDF")
+        except Exception as e:
+            self.call_from_thread(self.finish_job, f"Could not export {filename}: {e}", "error")
+            return
+        self.call_from_thread(self.finish_job, "Exported to " + filename)
+
+    def recipient_messages(self, rows):
+        for row in rows:
+            with timed("render"):
+                message = self.create_message_from_template(self.template, row)
+            yield recipient_message(row[self.email_select.value], message)
 
     @on(Button.Pressed, "#export_all")
     def export_all_pressed(self, event: Button.Pressed) -> None:
         if self.mail_pre_check():
             return
+        self.start_job("Exporting emails", self.datatable.count_non_hidden())
+        self.export_all()
+
+    @work(thread=True, exclusive=True, group="jobs")
+    def export_all(self):
+        worker = get_current_worker()
         filename = datetime.now().strftime("%Y%m%d-%H%M_") + self.subject_input.value + ".pdf"
-        messages = f"{self.datatable.count_non_hidden()}/{len(self.datatable)} Emails\n<hr>\n\n"
-        for row in self.datatable.row_list:
-            if row.hidden is False:
-                message = self.create_message_from_template(self.template, row)
-                message = f"**Recipient:** *{row[self.email_select.value]}*\n\n" + message
-                messages += markdown.markdown(message, extensions=[TableExtension()]) + "\n<hr>\n\n"
+        rows = list(self.datatable.visible_rows())
+        progress = JobProgress(len(rows), unit="messages")
+
+        def chunk_written(done):
+            if progress.update(done):
+                title = "Merging PDF..." if done == progress.total else None
+                self.call_from_thread(self.update_job, progress, title)
+
+        exporter = StreamingPdfExport(
+            chunk_size=self.config.getint("export", "chunk_size", fallback=50),
+            workers=self.config.getint("export", "workers", fallback=os.cpu_count() or 1),
+            progress=chunk_written,
+            cancelled=lambda: worker.is_cancelled,
+        )
+        stats = self.begin_stats("export", file=filename)
+        try:
+            exported = exporter.export(self.recipient_messages(rows), filename,
+                                       preface=f"{len(rows)}/{len(self.datatable)} Emails{SEPARATOR}")
+        except Exception as e:
+            # e.g. a subject that is no valid file name, the app keeps running
+            self.call_from_thread(self.finish_job, f"Could not export {filename}: {e}", "error")
+            return
+        finally:
+            self.end_stats(stats, messages=len(rows), exported=progress.done)
+        if exported is None:
+            self.call_from_thread(self.finish_job, "Export cancelled, no file written.")
+            return
+        self.call_from_thread(self.finish_job, f"{exported}/{len(self.datatable)} Emails exported to {filename}")
 
-        with open(filename, "w+b") as f:
-            pisa_status = pisa.CreatePDF(messages, dest=f)
-        self.notify(f"{self.datatable.count_non_hidden()}/{len(self.datatable)} Emails exported to {filename}")
+    @on(Button.Pressed, "#export_each")
+    def export_each_pressed(self, event: Button.Pressed) -> None:
+        if self.mail_pre_check():
+            return
+        filename_column = self.config.get("export", "filename_column", fallback=self.email_select.value)
+        if filename_column not in self.datatable.header_index:
+            self.notify(f"Column {filename_column} not found in table")
+            return
+        self.start_job("Exporting one PDF per email", self.datatable.count_non_hidden())
+        self.export_each(filename_column)
+
+    @work(thread=True, exclusive=True, group="jobs")
+    def export_each(self, filename_column: str):
+        worker = get_current_worker()
+        directory = datetime.now().strftime("%Y%m%d-%H%M_") + self.subject_input.value
+        rows = list(self.datatable.visible_rows())
+        progress = JobProgress(len(rows), unit="files")
+
+        def file_written(done):
+            if progress.update(done):
+                self.call_from_thread(self.update_job, progress)
+
+        def messages():
+            for row, message in zip(rows, self.recipient_messages(rows)):
+                yield row[filename_column], row[self.email_select.value], message
+
+        exporter = PerRecipientPdfExport(
+            workers=self.config.getint("export", "workers", fallback=os.cpu_count() or 1),
+            progress=file_written,
+            cancelled=lambda: worker.is_cancelled,
+        )
+        stats = self.begin_stats("export_each", directory=directory)
+        try:
+            manifest = exporter.export(messages(), directory)
+        except Exception as e:
+            self.call_from_thread(self.finish_job, f"Could not export to {directory}: {e}", "error")
+            return
+        finally:
+            self.end_stats(stats, messages=len(rows), exported=progress.done)
+        if manifest is None:
+            self.call_from_thread(self.finish_job, f"Export cancelled, {progress.done} files written to {directory}")
+            return
+        message = f"{len(manifest)} PDFs exported to {directory} ({progress.rate:.1f} files/s)"
+        if exporter.failed:
+            message += f"\n{len(exporter.failed)} messages could not be converted and are not in {exporter.MANIFEST}."
+        self.call_from_thread(self.finish_job, message, "warning" if exporter.failed else "information")
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     app = BulkMail()
     app.run()
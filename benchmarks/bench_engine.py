@@ -0,0 +1,86 @@
+"""Rendering and sending one after the other (the old send path) versus the asyncio engine overlapping them.
+
+Rows whose values are not plain words go through markdown one by one, like names with special characters
+do. The account is the in-process FakeAccount. Run from the repository root:
+
+    python benchmarks/bench_engine.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from engine import AsyncSendEngine
+from fake_exchange import FakeAccount
+from journal import row_identity
+from rendering import HtmlTemplate
+from sender import Email, Sender
+from template import CompiledTemplate
+from transports import EwsTransport
+
+ROWS = 5_000
+BATCH_SIZE = 50
+WORKERS = 4
+ROUND_TRIP = 0.05
+PER_ITEM = 0.001
+TEMPLATE = """Hello [[first_name]] [[last_name]]!
+
+Your grades are:
+
+| subject | grade |
+|---------|-------|
+| maths   | [[maths]] |
+| physics | [[physics]] |
+
+""" + "Some static text that does not change between recipients.\n\n" * 10 + "Your *Teacher*!"
+HEADER = ["email", "first_name", "last_name", "maths", "physics"]
+
+
+def make_rows() -> list:
+    # every other name needs markdown, the rest take the substitution shortcut
+    return [[f"user{i}@example.org", f"Name{i}" if i % 2 else f"*Name* #{i}", f"Last{i}", i % 6 + 1, i % 5 + 1]
+            for i in range(ROWS)]
+
+
+def email_maker(html: HtmlTemplate):
+    def make_email(values: list) -> Email:
+        return Email(values[0], "Grades", html.render(values), key=row_identity("Grades", values[0], values))
+    return make_email
+
+
+def sender() -> Sender:
+    return Sender(EwsTransport(FakeAccount(ROUND_TRIP, PER_ITEM)), batch_size=BATCH_SIZE, workers=WORKERS)
+
+
+def sequential(rows: list, make_email) -> tuple:
+    start = time.perf_counter()
+    emails = [make_email(values) for values in rows]
+    rendered = time.perf_counter() - start
+    sent = sender().send(emails)
+    return sent, time.perf_counter() - start, rendered
+
+
+def engine(rows: list, make_email) -> tuple:
+    start = time.perf_counter()
+    send_engine = AsyncSendEngine(sender(), make_email)
+    sent = asyncio.run(send_engine.send(rows, len(rows)))
+    return sent, time.perf_counter() - start, send_engine.render_time
+
+
+def main():
+    rows = make_rows()
+    compiled = CompiledTemplate(TEMPLATE, HEADER)
+    print(f"{ROWS} emails, {BATCH_SIZE} per batch x {WORKERS} workers, "
+          f"{ROUND_TRIP * 1000:.0f} ms + {PER_ITEM * 1000:.0f} ms per email round trips")
+    for name, run in (("render, then send", sequential), ("asyncio engine", engine)):
+        # a fresh template each time, so the markdown cache starts cold
+        sent, elapsed, rendered = run(rows, email_maker(HtmlTemplate(compiled)))
+        assert sent == ROWS
+        print(f"{name:>18}: {elapsed:6.2f}s, {sent / elapsed:6.0f} emails/s (rendering {rendered:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
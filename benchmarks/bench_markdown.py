@@ -0,0 +1,42 @@
+"""Markdown conversion timings: markdown.markdown per row, the shared MarkdownRenderer and HtmlTemplate.
+
+Run from the repository root:
+
+    python benchmarks/bench_markdown.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import markdown
+from markdown.extensions.tables import TableExtension
+
+from rendering import HtmlTemplate, MarkdownRenderer
+from template import CompiledTemplate
+
+ROWS = 5_000
+HEADER = ["first_name", "last_name", "email", "grades"]
+TEMPLATE = open(os.path.join(os.path.dirname(__file__), "..", "templates", "grades_template.md")).read()
+
+
+def timed(name: str, render, rows: list):
+    start = time.perf_counter()
+    for values in rows:
+        render(values)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>28}: {elapsed:.3f}s ({len(rows) / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    rows = [[f"First{r}", f"Last{r}", f"user{r}@example.com", str(r % 5 + 1)] for r in range(ROWS)]
+    compiled = CompiledTemplate(TEMPLATE, HEADER)
+    print(f"{ROWS} rows")
+    timed("markdown.markdown", lambda v: markdown.markdown(compiled.render(v), extensions=[TableExtension()]), rows)
+    renderer = MarkdownRenderer()
+    timed("MarkdownRenderer", lambda v: renderer.convert(compiled.render(v)), rows)
+    html_template = HtmlTemplate(compiled, MarkdownRenderer())
+    timed("HtmlTemplate", html_template.render, rows)
+    # flipping back and forth through the preview hits the LRU cache
+    timed("MarkdownRenderer, repeated", lambda v: renderer.convert(compiled.render(v)), rows[:500] * 10)
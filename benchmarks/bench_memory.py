@@ -0,0 +1,85 @@
+"""Memory of the row representation on a 100k x 40 sheet: one dataclass per row versus the shared RowStore.
+
+The DataFrame is built first and not counted, only what each layout allocates on top of it.
+Run from the repository root:
+
+    python benchmarks/bench_memory.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from pandas import DataFrame
+
+from rowstore import RowStore, TableSchema
+
+ROWS = 100_000
+COLUMNS = 40
+
+
+@dataclass
+class LegacyRow:
+    """The row type before the RowStore: values plus header and column keys copied into every row."""
+    values: list
+    header: list = field(default_factory=list)
+    column_keys: list = field(default_factory=list)
+    row_key: object = None
+    row_index: int = None
+    hidden: bool = False
+
+
+def synthetic(rows: int, columns: int) -> DataFrame:
+    data = {}
+    for c in range(columns):
+        if c % 4 == 0:
+            data[f"col{c}"] = np.arange(rows) * c
+        else:
+            data[f"col{c}"] = [f"r{r % 1000}c{c}" for r in range(rows)]
+    return DataFrame(data)
+
+
+def legacy_rows(df: DataFrame) -> list:
+    header = list(df.columns)
+    keys = [object() for _ in header]
+    rows = []
+    for index, values in enumerate(df.values.tolist()):
+        # the header and column_keys properties built a fresh list for every row
+        rows.append(LegacyRow(values, list(header), list(keys), row_index=index))
+    return rows
+
+
+def store_rows(df: DataFrame) -> RowStore:
+    return RowStore(df, TableSchema(df.columns, [object() for _ in df.columns]))
+
+
+def store_views(df: DataFrame) -> tuple:
+    store = store_rows(df)
+    return store, list(store.rows())
+
+
+def measure(name: str, build, df: DataFrame):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build(df)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {current / 2 ** 20:9.1f} MiB kept {peak / 2 ** 20:9.1f} MiB peak {elapsed:7.2f}s")
+    del result
+
+
+def main():
+    df = synthetic(ROWS, COLUMNS)
+    print(f"{ROWS} rows x {COLUMNS} columns")
+    measure("dataclass per row", legacy_rows, df)
+    measure("RowStore", store_rows, df)
+    measure("RowStore + a view per row", store_views, df)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Send timings against FakeAccount: the old one-save-per-message loop versus a Sender over EwsTransport.
+
+Run from the repository root:
+
+    python benchmarks/bench_send.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_exchange import FakeAccount
+from sender import Email, Sender
+from transports import EwsTransport
+
+EMAILS = 1_000
+ROUND_TRIP = 0.01
+
+
+def sequential(account: FakeAccount, emails: list) -> int:
+    ids = []
+    for email in emails:
+        draft = account.bulk_create(folder=account.drafts, items=[EwsTransport.build_message([email])])[0]
+        ids.append((draft.id, draft.changekey))
+    return account.bulk_send(ids=ids).count(True)
+
+
+if __name__ == "__main__":
+    emails = [Email(f"user{i}@example.com", "Subject", f"<p>Hello {i}</p>") for i in range(EMAILS)]
+    print(f"{EMAILS} emails, {ROUND_TRIP * 1000:.0f} ms round trip")
+
+    account = FakeAccount(round_trip=ROUND_TRIP)
+    start = time.perf_counter()
+    sent = sequential(account, emails)
+    elapsed = time.perf_counter() - start
+    print(f"{'sequential':>22}: {sent} sent in {elapsed:.2f}s ({account.calls} calls)")
+
+    for batch_size, workers in [(50, 1), (50, 4), (100, 8)]:
+        account = FakeAccount(round_trip=ROUND_TRIP)
+        start = time.perf_counter()
+        sent = Sender(EwsTransport(account), batch_size=batch_size, workers=workers).send(emails)
+        elapsed = time.perf_counter() - start
+        print(f"{f'batch {batch_size} x {workers} workers':>22}: {sent} sent in {elapsed:.2f}s ({account.calls} calls)")
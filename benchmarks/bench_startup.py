@@ -0,0 +1,80 @@
+"""Cold start: import time of app.py by module (like `python -X importtime`) and time to first paint.
+
+Every measurement runs in a fresh interpreter. Run from the repository root:
+
+    python benchmarks/bench_startup.py
+"""
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNS = 5
+TOP = 15
+
+FIRST_PAINT = """
+import os, sys, time
+sys.path.insert(0, os.getcwd())
+from app import BulkMail
+
+class Probe(BulkMail):
+    CSS_PATH = os.path.join(os.getcwd(), "style.css")
+    painted_at = None
+
+    def on_mount(self):
+        super().on_mount()
+        self.call_after_refresh(self.painted)
+
+    def painted(self):
+        self.painted_at = time.time()
+        self.exit()
+
+probe = Probe()
+probe.run(headless=True)
+# textual captures stdout while it runs
+print(probe.painted_at)
+"""
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_report():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            cwd=ROOT, capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if match := IMPORTTIME.match(line):
+            modules.append((int(match.group(2)), len(match.group(3)), match.group(4)))
+    total = next(cumulative for cumulative, _, name in modules if name == "app")
+    print(f"import app: {total / 1000:.0f} ms, slowest modules imported by app.py directly:")
+    direct = sorted((m for m in modules if m[1] == 3), reverse=True)[:TOP]
+    for cumulative, _, name in direct:
+        print(f"  {name:<24} {cumulative / 1000:7.1f} ms")
+    heavy = [name for name in ("pandas", "exchangelib", "xhtml2pdf", "pypdf", "markdown")
+             if any(m[2] == name for m in modules)]
+    print(f"heavy modules imported at startup: {', '.join(heavy) or 'none'}")
+
+
+def first_paint(script: str) -> float:
+    start = time.time()
+    result = subprocess.run([sys.executable, script], cwd=ROOT, capture_output=True, text=True)
+    return float(result.stdout.strip().splitlines()[-1]) - start
+
+
+def main():
+    import_report()
+    # textual needs the app class to be defined in a file
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "first_paint.py")
+        with open(script, "w") as f:
+            f.write(FIRST_PAINT)
+        times = sorted(first_paint(script) for _ in range(RUNS))
+    print(f"time to first paint: median {times[RUNS // 2] * 1000:.0f} ms, "
+          f"best {times[0] * 1000:.0f} ms ({RUNS} runs, interpreter start included)")
+
+
+if __name__ == "__main__":
+    main()
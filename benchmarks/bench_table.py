@@ -0,0 +1,91 @@
+"""Load, lookup, filter and All/None timings for TableWrapper, with every row materialized,
+and the load time of a large table in the default paged mode.
+
+Run from the repository root:
+
+    python benchmarks/bench_table.py
+
+The time per row should stay roughly constant as the row count grows.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+from textual.app import App
+
+from filters import build_mask
+from tablewrapper import TableWrapper
+
+SIZES = [1_000, 5_000, 20_000]
+COLUMNS = 8
+
+
+def make_dataframe(rows: int, columns: int = COLUMNS) -> pd.DataFrame:
+    return pd.DataFrame({f"col{c}": [f"r{r}c{c}" for r in range(rows)] for c in range(columns)})
+
+
+def bench(rows: int):
+    df = make_dataframe(rows)
+    table = TableWrapper(page_size=0)
+
+    start = time.perf_counter()
+    table.load_dataframe(df)
+    load = time.perf_counter() - start
+
+    keys = list(table.row_keys)
+    start = time.perf_counter()
+    for key in keys:
+        row = table.get_by_key(key)
+        row["col3"]
+    lookup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table.filter("col0", "~r1")
+    filtering = time.perf_counter() - start
+
+    start = time.perf_counter()
+    table.set_all_hidden(True)
+    table.set_all_hidden(False)
+    all_none = (time.perf_counter() - start) / 2
+    return load, lookup, filtering, all_none
+
+
+def bench_virtual(rows: int = 200_000):
+    df = make_dataframe(rows)
+    table = TableWrapper()
+    start = time.perf_counter()
+    table.load_dataframe(df)
+    elapsed = time.perf_counter() - start
+    return f"virtual load of {rows} rows: {elapsed * 1000:.1f} ms ({table.materialized} rows materialized)"
+
+
+def bench_mask(rows: int = 100_000):
+    df = make_dataframe(rows)
+    df["number"] = range(rows)
+    start = time.perf_counter()
+    mask = build_mask(df, "number:1000..50000 & col1:~c1 | col2:/r9+c2$/", "col0")
+    elapsed = time.perf_counter() - start
+    print(f"filter mask for {rows} rows: {elapsed * 1000:.1f} ms ({mask.sum()} shown)")
+
+
+async def main():
+    # DataTable needs an active app to measure cells; textual captures stdout while it runs
+    results = []
+    async with App().run_test():
+        for rows in SIZES:
+            results.append((rows, *bench(rows)))
+        virtual = bench_virtual()
+    print(f"{'rows':>8} {'load s':>10} {'load us/row':>12} {'lookup s':>10} {'lookup us/row':>14} {'filter s':>9} {'all/none s':>11}")
+    for rows, load, lookup, filtering, all_none in results:
+        print(f"{rows:>8} {load:>10.3f} {load / rows * 1e6:>12.1f} {lookup:>10.4f} {lookup / rows * 1e6:>14.2f}"
+              f" {filtering:>9.3f} {all_none:>11.3f}")
+    print(virtual)
+    bench_mask()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,51 @@
+"""Loading an XLSX file: pandas.read_excel, the streaming reader, and a hit in the parsed-table cache.
+
+Run from the repository root:
+
+    python benchmarks/bench_table_cache.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from ingest import read_batches
+from tablecache import TableCache
+
+ROWS = 50_000
+COLUMNS = 10
+
+
+def timed(fn) -> tuple:
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "synthetic.xlsx")
+        df = pd.DataFrame({f"col{c}": np.arange(ROWS) * c if c % 2 else [f"r{r}c{c}" for r in range(ROWS)]
+                           for c in range(COLUMNS)})
+        df.to_excel(path, index=False)
+        cache = TableCache(os.path.join(directory, "cache"))
+        print(f"{ROWS} rows x {COLUMNS} columns")
+
+        elapsed, _ = timed(lambda: pd.read_excel(path, sheet_name=0))
+        print(f"pandas.read_excel          {elapsed:7.2f}s")
+        elapsed, _ = timed(lambda: list(read_batches(path)))
+        print(f"streaming reader           {elapsed:7.2f}s")
+        elapsed, _ = timed(lambda: list(cache.read_batches(path)))
+        print(f"cache miss (read + store)  {elapsed:7.2f}s")
+        elapsed, batches = timed(lambda: list(cache.read_batches(path)))
+        print(f"cache hit                  {elapsed:7.2f}s  ({cache.entries()[0][2].rsplit('.', 1)[1]})")
+        assert pd.concat(batches, ignore_index=True).equals(pd.read_excel(path, sheet_name=0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Template rendering timings: per-column str.replace versus CompiledTemplate.
+
+Run from the repository root:
+
+    python benchmarks/bench_template.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from template import CompiledTemplate
+
+ROWS = 50_000
+WIDTHS = [10, 60, 120]
+TEMPLATE = """subject: Your grades!
+Hello [[col1]] [[col2]]!
+
+Your grades are:
+**[[col3]]**
+
+""" + "Some static text that does not change between recipients.\n" * 20 + "Your Teacher!"
+
+
+def replace_render(template: str, header: list, values: list) -> str:
+    message = template
+    for key, value in zip(header, values):
+        message = message.replace(f"[[{key}]]", str(value))
+    return message
+
+
+def bench(width: int):
+    header = [f"col{c}" for c in range(width)]
+    rows = [[f"r{r}c{c}" for c in range(width)] for r in range(ROWS)]
+
+    start = time.perf_counter()
+    for values in rows:
+        replace_render(TEMPLATE, header, values)
+    replace = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = CompiledTemplate(TEMPLATE, header)
+    for values in rows:
+        compiled.render(values)
+    compiled_time = time.perf_counter() - start
+    return replace, compiled_time
+
+
+if __name__ == "__main__":
+    print(f"{ROWS} rows")
+    print(f"{'columns':>8} {'replace s':>10} {'compiled s':>11} {'speedup':>8}")
+    for width in WIDTHS:
+        replace, compiled = bench(width)
+        print(f"{width:>8} {replace:>10.3f} {compiled:>11.3f} {replace / compiled:>7.1f}x")
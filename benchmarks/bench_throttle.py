@@ -0,0 +1,40 @@
+"""Sending into a throttling server: fixed batches versus the adaptive throttle, and the rate cap.
+
+ThrottlingAccount answers requests over its budget with ErrorServerBusy and a back-off hint.
+Run from the repository root:
+
+    python benchmarks/bench_throttle.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_exchange import ThrottlingAccount
+from sender import Email, Sender
+from throttle import AdaptiveThrottle
+from transports import EwsTransport
+
+EMAILS = 2_000
+SERVER = dict(round_trip=0.02, per_item=0.0005, max_concurrent=3, items_per_second=400, back_off=0.3)
+
+
+def run(name: str, throttle: AdaptiveThrottle, retries: int = 3):
+    account = ThrottlingAccount(**SERVER)
+    emails = [Email(f"user{i}@example.com", "Subject", f"<p>Hello {i}</p>") for i in range(EMAILS)]
+    sender = Sender(EwsTransport(account), retries=retries, backoff=0.5, throttle=throttle)
+    start = time.perf_counter()
+    sent = sender.send(emails)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>28}: {sent}/{EMAILS} sent in {elapsed:5.2f}s ({sent / elapsed * 60:7.0f}/min), "
+          f"{account.throttled} throttled of {account.calls} calls, ended at {throttle}")
+
+
+if __name__ == "__main__":
+    print(f"{EMAILS} emails, server: {SERVER}")
+    run("fixed 100 x 8", AdaptiveThrottle(100, 8, max_workers=8, adaptive=False))
+    run("adaptive from 100 x 8", AdaptiveThrottle(100, 8, max_workers=8))
+    run("adaptive from 10 x 1", AdaptiveThrottle(10, 1, max_workers=8))
+    run("adaptive, 9000/min cap", AdaptiveThrottle(100, 8, max_workers=8, max_per_minute=9000))
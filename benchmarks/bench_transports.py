@@ -0,0 +1,154 @@
+"""Send throughput of the transports: .eml files, mbox, and SMTP against a local aiosmtpd server.
+
+SMTP runs once with a new connection per email and then with the connections kept open, with and
+without PIPELINING. The server is reached through a proxy that adds network latency, because on
+loopback round trips cost nothing. Needs aiosmtpd for the SMTP part. Run from the repository root:
+
+    python benchmarks/bench_transports.py
+"""
+import os
+import queue
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sender import Email, Sender
+from transports import FileTransport, SmtpTransport
+
+EMAILS = 1_000
+BATCH_SIZE = 50
+WORKERS = 4
+LATENCY = 0.002  # one way, so 4 ms per round trip
+BODY = "<p>Hello {}!</p>" + "<p>Your grades are <strong>5</strong>.</p>" * 20
+
+
+class LatencyProxy:
+    """Forwards TCP connections on `port` to `target`, delaying data by `delay` seconds in each direction."""
+
+    def __init__(self, target: int, delay: float):
+        self.target = target
+        self.delay = delay
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            client, _ = self.server.accept()
+            upstream = socket.create_connection(("127.0.0.1", self.target))
+            for sock in (client, upstream):
+                # forward every write when it is due, Nagle would add delays of its own
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, sink in ((client, upstream), (upstream, client)):
+                pending = queue.Queue()
+                threading.Thread(target=self.read, args=(source, pending), daemon=True).start()
+                threading.Thread(target=self.write, args=(sink, pending), daemon=True).start()
+
+    def read(self, source: socket.socket, pending: queue.Queue):
+        while True:
+            try:
+                data = source.recv(65536)
+            except OSError:
+                data = b""
+            pending.put((time.monotonic() + self.delay, data))
+            if not data:
+                return
+
+    @staticmethod
+    def write(sink: socket.socket, pending: queue.Queue):
+        while True:
+            due, data = pending.get()
+            time.sleep(max(0.0, due - time.monotonic()))
+            try:
+                if not data:
+                    sink.shutdown(socket.SHUT_WR)
+                    return
+                sink.sendall(data)
+            except OSError:
+                return
+
+
+class Counter:
+    def __init__(self, pipelining: bool):
+        self.pipelining = pipelining
+        self.messages = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        if self.pipelining:
+            responses.insert(-1, "250-PIPELINING")
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 OK"
+
+
+class ConnectionPerEmail(SmtpTransport):
+    """What a plain smtplib loop does: connect, say EHLO and log in for every email."""
+
+    def send(self, emails: list) -> list:
+        for email in emails:
+            smtp = self.connect()
+            self.deliver(smtp, [email])
+            smtp.quit()
+        return [True] * len(emails)
+
+
+def free_port() -> int:
+    with socket.create_server(("127.0.0.1", 0)) as s:
+        return s.getsockname()[1]
+
+
+def run(transport, emails: list) -> float:
+    start = time.perf_counter()
+    sender = Sender(transport, batch_size=BATCH_SIZE, workers=WORKERS)
+    sent = sender.send(emails)
+    elapsed = time.perf_counter() - start
+    assert sent == len(emails), sender.errors[:1]
+    return elapsed
+
+
+def report(name: str, emails: list, elapsed: float, extra: str = ""):
+    print(f"{name:>34}: {len(emails) / elapsed:8.0f} emails/s ({elapsed:.2f}s){extra}")
+
+
+def smtp(emails: list):
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        print("aiosmtpd is not installed, skipping SMTP (pip install aiosmtpd)")
+        return
+    print(f"SMTP with {LATENCY * 2000:.0f} ms round trips, {BATCH_SIZE} emails x {WORKERS} workers:")
+    for name, pipelining, transport_class, count in (
+            ("new connection per email", False, ConnectionPerEmail, EMAILS // 10),
+            ("connections kept open", False, SmtpTransport, EMAILS),
+            ("connections kept open, pipelined", True, SmtpTransport, EMAILS)):
+        handler = Counter(pipelining)
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        try:
+            proxy = LatencyProxy(controller.port, LATENCY)
+            transport = transport_class("127.0.0.1", proxy.port, security="none", sender="bench@example.org")
+            elapsed = run(transport, emails[:count])
+            report(name, emails[:count], elapsed, f", {transport.connections} connections")
+            assert handler.messages == count
+        finally:
+            controller.stop()
+
+
+def main():
+    emails = [Email(f"user{i}@example.org", "Benchmark", BODY.format(i), key=f"{i:08d}") for i in range(EMAILS)]
+    print(f"{EMAILS} emails, {len(BODY)} characters each")
+    with tempfile.TemporaryDirectory() as directory:
+        report("eml files", emails, run(FileTransport(os.path.join(directory, "outbox")), emails))
+        report("mbox", emails, run(FileTransport(os.path.join(directory, "outbox.mbox"), "mbox"), emails))
+    smtp(emails)
+
+
+if __name__ == "__main__":
+    main()
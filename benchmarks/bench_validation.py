@@ -0,0 +1,63 @@
+"""Email address checks: the regex per row at send time versus the address check pass on load.
+
+Run from the repository root:
+
+    python benchmarks/bench_validation.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from mailing import is_valid_email
+from rowstore import RowStore
+
+ROWS = 500_000
+BATCH = 10_000
+
+
+def make_table() -> pd.DataFrame:
+    # one bad address in 50, one duplicate in 20
+    addresses = [f"bad address {i}" if i % 50 == 0 else f"user{i - i % 20 if i % 20 == 1 else i}@example.org"
+                 for i in range(ROWS)]
+    return pd.DataFrame({"name": [f"Name {i}" for i in range(ROWS)], "email": addresses})
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    df = make_table()
+    store = RowStore(df)
+
+    def per_row():
+        return [row for row in store.visible_rows() if is_valid_email(row["email"])]
+    valid, elapsed = timed(per_row)
+    print(f"regex per row while sending:  {elapsed:6.2f}s, {len(valid)} valid, duplicates not found")
+
+    changed, elapsed = timed(store.check_emails, 1)
+    print(f"AddressCheck of the column:   {elapsed:6.2f}s")
+
+    def incremental():
+        loading = RowStore(df.iloc[:0])
+        loading.check_emails(1)
+        for start in range(0, ROWS, BATCH):
+            loading.append(df.iloc[start:start + BATCH])
+        return loading
+    loading, elapsed = timed(incremental)
+    assert np.array_equal(loading.status, store.status)
+    print(f"  while loading, {BATCH} rows at a time: {elapsed:6.2f}s")
+
+    sendable, elapsed = timed(store.sendable)
+    print(f"rows to send from the status: {elapsed * 1000:6.1f} ms, {len(sendable)} valid and unique")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""In-process stand-in for an exchangelib Account.
+
+Every bulk call sleeps for a fixed round trip plus a per-item cost, which is enough to compare
+sending strategies without a server. Drafts and sent messages are kept in memory for inspection.
+"""
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+from exchangelib.errors import ErrorServerBusy
+
+
+class FakeAccount:
+    def __init__(self, round_trip: float = 0.05, per_item: float = 0.001, fail_every: int = 0):
+        self.round_trip = round_trip
+        self.per_item = per_item
+        self.fail_every = fail_every
+        self.drafts = SimpleNamespace(name="Drafts")
+        self.draft_items = {}
+        self.sent_items = []
+        self.calls = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _round_trip(self, items: int):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.round_trip + self.per_item * items)
+
+    def bulk_create(self, folder, items, **kwargs):
+        items = list(items)
+        self._round_trip(len(items))
+        results = []
+        for item in items:
+            with self._lock:
+                n = next(self._ids)
+                if self.fail_every and n % self.fail_every == self.fail_every - 1:
+                    results.append(ValueError(f"Fake failure for item {n}"))
+                    continue
+                self.draft_items[str(n)] = item
+            results.append(SimpleNamespace(id=str(n), changekey="ck"))
+        return results
+
+    def bulk_send(self, ids, **kwargs):
+        ids = list(ids)
+        self._round_trip(len(ids))
+        results = []
+        with self._lock:
+            for item_id, _ in ids:
+                self.sent_items.append(self.draft_items.pop(item_id))
+                results.append(True)
+        return results
+
+
+class ThrottlingAccount(FakeAccount):
+    """A FakeAccount with an EWS style throttling budget.
+
+    At most `max_concurrent` requests are served at once and items are admitted at `items_per_second`
+    (a token bucket holding one second worth of items). Anything over budget is answered with
+    ErrorServerBusy carrying a `back_off` hint, like Exchange does.
+    """
+
+    def __init__(self, round_trip: float = 0.05, per_item: float = 0.001, max_concurrent: int = 4,
+                 items_per_second: float = 500, back_off: float = 0.5):
+        super().__init__(round_trip, per_item)
+        self.max_concurrent = max_concurrent
+        self.items_per_second = items_per_second
+        self.back_off = back_off
+        self.active = 0
+        self.tokens = items_per_second
+        self.refilled = time.monotonic()
+        self.throttled = 0
+
+    def _admit(self, items: int):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.items_per_second, self.tokens + (now - self.refilled) * self.items_per_second)
+            self.refilled = now
+            if self.active >= self.max_concurrent or self.tokens < items:
+                self.throttled += 1
+                self.calls += 1
+                raise ErrorServerBusy("The server cannot service this request right now. Try again later.",
+                                      back_off=self.back_off)
+            self.tokens -= items
+            self.active += 1
+
+    def _release(self):
+        with self._lock:
+            self.active -= 1
+
+    def bulk_create(self, folder, items, **kwargs):
+        items = list(items)
+        self._admit(len(items))
+        try:
+            return super().bulk_create(folder, items, **kwargs)
+        finally:
+            self._release()
+
+    def bulk_send(self, ids, **kwargs):
+        ids = list(ids)
+        self._admit(len(ids))
+        try:
+            return super().bulk_send(ids, **kwargs)
+        finally:
+            self._release()
@@ -0,0 +1,165 @@
+"""Local fake EWS and SMTP servers, so the real exchangelib and smtplib code paths can be measured.
+
+FakeEwsServer answers the SOAP calls a mailing makes (GetFolder for the drafts folder, CreateItem and
+SendItem) over HTTP on localhost, exchangelib serializes and parses everything as it would for Exchange.
+FakeSmtpServer speaks enough ESMTP, with PIPELINING, for smtplib and SmtpTransport. Both count what they
+received and can add a delay per request or email. Only the standard library is needed.
+"""
+import asyncio
+import itertools
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EWS_VERSION = {"build": "15.1.2507.6", "api_version": "Exchange2016"}
+ENVELOPE = ('<?xml version="1.0" encoding="utf-8"?>'
+            '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/"><s:Header>'
+            '<h:ServerVersionInfo xmlns:h="http://schemas.microsoft.com/exchange/services/2006/types" '
+            'MajorVersion="15" MinorVersion="1" MajorBuildNumber="2507" MinorBuildNumber="6" Version="V2017_07_11"/>'
+            '</s:Header><s:Body>{}</s:Body></s:Envelope>')
+NAMESPACES = ('xmlns:m="http://schemas.microsoft.com/exchange/services/2006/messages" '
+              'xmlns:t="http://schemas.microsoft.com/exchange/services/2006/types"')
+OPERATION = re.compile(r"<s:Body><m:(\w+)")
+
+
+def success(operation: str, content: str = "") -> str:
+    return (f'<m:{operation}ResponseMessage ResponseClass="Success"><m:ResponseCode>NoError</m:ResponseCode>'
+            f'{content}</m:{operation}ResponseMessage>')
+
+
+class FakeEwsServer:
+    """EWS endpoint on localhost, every request takes `round_trip` plus `per_item` seconds per item."""
+
+    def __init__(self, round_trip: float = 0.0, per_item: float = 0.0):
+        self.round_trip = round_trip
+        self.per_item = per_item
+        self.created = 0
+        self.sent = 0
+        self.requests = 0
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/EWS/Exchange.asmx"
+
+    def endpoint(self, email: str) -> dict:
+        """The section session.AccountManager caches for `email`, to connect without autodiscover."""
+        return {"primary_smtp_address": email, "service_endpoint": self.url, "auth_type": "basic", **EWS_VERSION}
+
+    def start(self) -> "FakeEwsServer":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+                data = fake.respond(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, body: str) -> str:
+        operation = OPERATION.search(body).group(1)
+        if operation == "GetFolder":
+            messages = [success(operation, f'<m:Folders><t:Folder><t:FolderId Id="{name}" ChangeKey="ck"/>'
+                                           f'<t:DisplayName>{name}</t:DisplayName><t:FolderClass>IPF.Note</t:FolderClass>'
+                                           f'<t:TotalCount>0</t:TotalCount><t:ChildFolderCount>0</t:ChildFolderCount>'
+                                           f'<t:UnreadCount>0</t:UnreadCount></t:Folder></m:Folders>')
+                        for name in re.findall(r'DistinguishedFolderId Id="(\w+)"', body)]
+        elif operation == "CreateItem":
+            items = body.count("<t:Message>") + body.count("<t:Message ")
+            with self.lock:
+                ids = [next(self.ids) for _ in range(items)]
+                self.created += items
+            messages = [success(operation, f'<m:Items><t:Message><t:ItemId Id="item{i}" ChangeKey="ck"/>'
+                                           f'</t:Message></m:Items>') for i in ids]
+        elif operation == "SendItem":
+            items = body.count("<t:ItemId ")
+            with self.lock:
+                self.sent += items
+            messages = [success(operation)] * items
+        else:
+            raise ValueError(f"The fake EWS server does not know {operation}")
+        with self.lock:
+            self.requests += 1
+        if self.round_trip or self.per_item:
+            time.sleep(self.round_trip + self.per_item * len(messages))
+        return ENVELOPE.format(f'<m:{operation}Response {NAMESPACES}><m:ResponseMessages>{"".join(messages)}'
+                               f'</m:ResponseMessages></m:{operation}Response>')
+
+
+class FakeSmtpServer:
+    """ESMTP server on localhost without authentication or TLS, every email takes `delay` seconds."""
+
+    def __init__(self, delay: float = 0.0, pipelining: bool = True):
+        self.delay = delay
+        self.pipelining = pipelining
+        self.messages = 0
+        self.connections = 0
+        self.port = None
+        self.loop = None
+        self.server = None
+
+    def start(self) -> "FakeSmtpServer":
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, "127.0.0.1", 0), self.loop).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    def stop(self):
+        async def close():
+            self.server.close()
+            await self.server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        writer.write(b"220 fake ESMTP\r\n")
+        try:
+            while line := await reader.readline():
+                command = line[:4].upper()
+                if command == b"EHLO":
+                    reply = b"250-fake\r\n" + (b"250-PIPELINING\r\n" if self.pipelining else b"") + b"250 8BITMIME\r\n"
+                elif command == b"DATA":
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                    while await reader.readline() not in (b".\r\n", b""):
+                        pass
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.messages += 1
+                    reply = b"250 OK queued\r\n"
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    break
+                elif command in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                    reply = b"250 OK\r\n"
+                else:
+                    reply = b"502 Command not implemented\r\n"
+                writer.write(reply)
+                await writer.drain()
+        finally:
+            writer.close()
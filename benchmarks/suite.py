@@ -0,0 +1,281 @@
+"""Benchmark suite: synthetic tables of several sizes through every stage of a mailing.
+
+For every table size: reading the CSV (XLSX up to 10k rows, Parquet if pyarrow is installed), loading it
+into the TableWrapper in batches like the app does, the email check, filters, toggling single rows and
+All/None, and for every template kind (see synthetic.py) rendering the markdown, rendering the HTML the
+send path uses, and converting the whole message with markdown like the PDF export does.
+Then the app runs headless on a smaller table: loading it, stepping through the preview like holding `>>`,
+"Send All" over a fake EWS server through the real exchangelib, "Send All" over a fake SMTP server, and
+"Export All" to PDF (see fake_servers.py).
+
+Run from the repository root:
+
+    python benchmarks/suite.py                                # 1k x 5 and 10k x 20, about a minute
+    python benchmarks/suite.py --full                         # 1k to 500k rows, 5 to 100 columns
+    python benchmarks/suite.py --sizes 50000x30 --skip app
+    python benchmarks/suite.py --json after.json --compare before.json
+
+--compare prints the ratio to the times of an earlier --json run and marks cases more than --tolerance
+slower, so a regression in the table, render, send or export paths shows up.
+"""
+import argparse
+import asyncio
+import configparser
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from textual.app import App
+
+from fake_servers import FakeEwsServer, FakeSmtpServer
+from ingest import read_batches
+from mailing import split_subject
+from rendering import HtmlTemplate, MarkdownRenderer
+from synthetic import TEMPLATES, make_table, make_template, write_table
+from tablecache import has_pyarrow
+from tablewrapper import TableWrapper
+from template import CompiledTemplate
+
+QUICK = [(1_000, 5), (10_000, 20)]
+FULL = [(1_000, 5), (10_000, 20), (100_000, 50), (100_000, 100), (500_000, 20)]
+RENDER_ROWS = 20_000
+HTML_ROWS = 5_000
+MARKDOWN_ROWS = 2_000
+TOGGLES = 1_000
+PREVIEW_STEPS = 300
+KEY_REPEAT = 1 / 30
+PARTS = ("read", "table", "render", "app")
+
+
+class Results:
+    def __init__(self):
+        self.cases = []
+
+    def add(self, case: str, size: str, items: int, seconds: float, **details):
+        self.cases.append({"case": case, "size": size, "items": items, "seconds": round(seconds, 6), **details})
+        print(f"  {case:<18} {size:>11} {seconds:9.3f}s", file=sys.stderr, flush=True)
+
+    def measure(self, case: str, size: str, items: int, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.add(case, size, items, time.perf_counter() - start)
+        return result
+
+
+def bench_table(results: Results, rows: int, columns: int, directory: str, skip: list):
+    size = f"{rows}x{columns}"
+    df = make_table(rows, columns)
+    path = os.path.join(directory, f"{size}.csv")
+    write_table(df, path)
+    if "read" not in skip:
+        if rows <= 10_000:
+            write_table(df, path[:-4] + ".xlsx")
+            results.measure("read xlsx", size, rows, lambda: list(read_batches(path[:-4] + ".xlsx")))
+        if has_pyarrow():
+            write_table(df, path[:-4] + ".parquet")
+            results.measure("read parquet", size, rows, lambda: list(read_batches(path[:-4] + ".parquet")))
+    batches = results.measure("read csv", size, rows, lambda: list(read_batches(path)))
+
+    table = TableWrapper()
+
+    def load():
+        table.clear(columns=True)
+        for batch in batches:
+            table.append_dataframe(batch)
+
+    if "table" not in skip:
+        results.measure("table load", size, rows, load)
+        results.measure("check emails", size, rows, table.set_email_column, "email")
+        number = next((h for h in table.header if str(h).startswith("score")), "first_name")
+        results.measure("filter number", size, rows, table.filter, number, ">50")
+        results.measure("filter text", size, rows, table.filter, "first_name", "~an | last_name:/^M/")
+        results.measure("all/none", size, rows * 2, lambda: (table.set_all_hidden(True), table.set_all_hidden(False)))
+        toggles = min(rows, TOGGLES)
+        results.measure("row toggle", size, toggles,
+                        lambda: [table.toggle_hide_row(table[index]) for index in range(toggles)])
+    else:
+        load()
+    if "render" in skip:
+        return
+    header = list(table.header)
+    values = [table.store.row_values(index) for index in range(min(rows, RENDER_ROWS))]
+    for kind in TEMPLATES:
+        compiled = CompiledTemplate(split_subject(make_template(kind, header))[1], header)
+        messages = results.measure(f"render {kind}", size, len(values), lambda: [compiled.render(v) for v in values])
+        # a fresh renderer each time, so the markdown cache starts cold
+        html = HtmlTemplate(compiled, MarkdownRenderer())
+        results.measure(f"html {kind}", size, min(len(values), HTML_ROWS),
+                        lambda: [html.render(v) for v in values[:HTML_ROWS]])
+        renderer = MarkdownRenderer()
+        results.measure(f"markdown {kind}", size, min(len(messages), MARKDOWN_ROWS),
+                        lambda: [renderer.convert(m) for m in messages[:MARKDOWN_ROWS]])
+
+
+def write_settings(directory: str, email: str, ews: FakeEwsServer, smtp: FakeSmtpServer):
+    settings = configparser.ConfigParser()
+    settings.read_dict({
+        "credentials": {"email": email, "password": "secret"},
+        # without a journal the second send does not skip the emails the first one sent
+        "sending": {"journal": "", "transport": "ews"},
+        "smtp": {"host": "127.0.0.1", "port": str(smtp.port), "security": "none", "username": ""},
+        "cache": {"enabled": "false"},
+        "stats": {"reports": ""},
+        "startup": {"warm_up": "false"},
+    })
+    with open(os.path.join(directory, ".settings.ini"), "w") as f:
+        settings.write(f)
+    endpoints = configparser.ConfigParser(interpolation=None)
+    endpoints[email] = ews.endpoint(email)
+    with open(os.path.join(directory, ".exchange_cache.ini"), "w") as f:
+        endpoints.write(f)
+
+
+async def wait_for(pilot, condition):
+    while not condition():
+        await pilot.pause(0.01)
+
+
+async def bench_app(results: Results, rows: int, export_rows: int, latency: float, directory: str):
+    from app import BulkMail
+
+    size = f"{rows}x20"
+    path = os.path.join(directory, f"app_{size}.csv")
+    df = make_table(rows, 20)
+    write_table(df, path)
+    template = os.path.join(directory, "template.md")
+    with open(template, "w", encoding="utf-8") as f:
+        f.write(make_template("table", list(df.columns)))
+    ews = FakeEwsServer(round_trip=latency).start()
+    smtp = FakeSmtpServer().start()
+    write_settings(directory, "me@example.org", ews, smtp)
+    app = BulkMail()
+    try:
+        async with app.run_test() as pilot:
+            start = time.perf_counter()
+            app.file_selected(SimpleNamespace(path=path))
+            await wait_for(pilot, lambda: not app.loading_table and app.datatable.email_column == "email")
+            results.add("app load", size, rows, time.perf_counter() - start)
+            app.file_selected(SimpleNamespace(path=template))
+            await pilot.pause()
+            steps = min(rows, PREVIEW_STEPS)
+            start = time.perf_counter()
+            for _ in range(steps):
+                app.next_pressed(None)
+                await asyncio.sleep(KEY_REPEAT)
+            await wait_for(pilot, lambda: app.preview_timer is None and not app.preview.updating)
+            # beyond the time the key is held, how far the preview lags behind
+            results.add("app preview", size, steps, time.perf_counter() - start - steps * KEY_REPEAT)
+            sendable = len(app.datatable.store.sendable())
+            for transport in ("ews", "smtp"):
+                app.config.read_dict({"sending": {"transport": transport}})
+                start = time.perf_counter()
+                app.start_job("Sending emails", sendable)
+                app.send_all_mails()
+                await wait_for(pilot, lambda: app.progress_screen is None)
+                results.add(f"app send {transport}", size, sendable, time.perf_counter() - start,
+                            stages=app.job_stats.report()["stages"])
+            assert ews.sent == smtp.messages == sendable, (ews.sent, smtp.messages, sendable)
+            app.datatable.set_hidden_indices(range(export_rows, rows), True)
+            start = time.perf_counter()
+            app.start_job("Exporting emails", export_rows)
+            app.export_all()
+            await wait_for(pilot, lambda: app.progress_screen is None)
+            results.add("app export pdf", f"{export_rows}x20", export_rows, time.perf_counter() - start,
+                        stages=app.job_stats.report()["stages"])
+    finally:
+        ews.stop()
+        smtp.stop()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPOSITORY, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(cases: list, compare: dict, tolerance: float):
+    print(f"{'case':<18} {'size':>11} {'items':>8} {'seconds':>9} {'us/item':>10}"
+          + (f" {'before':>9} {'ratio':>6}" if compare else ""))
+    slower = 0
+    for case in cases:
+        line = (f"{case['case']:<18} {case['size']:>11} {case['items']:>8} {case['seconds']:>9.3f}"
+                f" {case['seconds'] / max(case['items'], 1) * 1e6:>10.1f}")
+        before = compare.get((case["case"], case["size"]))
+        if before is not None:
+            ratio = case["seconds"] / before if before > 0 else float("inf")
+            line += f" {before:>9.3f} {ratio:>6.2f}"
+            if ratio > 1 + tolerance:
+                line += "  slower"
+                slower += 1
+        print(line)
+    if compare:
+        print(f"{slower} cases more than {tolerance:.0%} slower")
+
+
+def parse_sizes(text: str) -> list:
+    sizes = []
+    for size in text.split(","):
+        rows, _, columns = size.partition("x")
+        sizes.append((int(rows), int(columns or 20)))
+    return sizes
+
+
+async def run(args, directory: str) -> Results:
+    results = Results()
+    if any(part not in args.skip for part in ("read", "table", "render")):
+        # DataTable needs an active app to measure cells
+        async with App().run_test():
+            for rows, columns in args.sizes:
+                bench_table(results, rows, columns, directory, args.skip)
+    if "app" not in args.skip:
+        await bench_app(results, args.app_rows, args.export_rows, args.latency, directory)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time table, render, send and export paths on synthetic data.")
+    parser.add_argument("--full", action="store_true", help="1k to 500k rows and 5 to 100 columns")
+    parser.add_argument("--sizes", type=parse_sizes, help="comma separated ROWSxCOLUMNS, e.g. 1000x5,50000x30")
+    parser.add_argument("--skip", action="append", default=[], choices=PARTS, help="leave out a part, repeatable (read leaves out XLSX and Parquet)")
+    parser.add_argument("--app-rows", type=int, help="rows the app sends (default: 2000, 20000 with --full)")
+    parser.add_argument("--export-rows", type=int, default=100, help="rows the app exports to PDF (default: 100)")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake EWS round trip in seconds (default: 0.02)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of an earlier --json run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="ratio above 1 marked slower (default: 0.25)")
+    args = parser.parse_args()
+    args.sizes = args.sizes or (FULL if args.full else QUICK)
+    args.app_rows = args.app_rows or (20_000 if args.full else 2_000)
+    compare = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare = {(case["case"], case["size"]): case["seconds"] for case in json.load(f)["cases"]}
+
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="bulkmail-bench-") as directory:
+        # the app reads and writes its settings and caches in the working directory
+        os.chdir(directory)
+        try:
+            results = asyncio.run(run(args, directory))
+        finally:
+            os.chdir(working_directory)
+    print_results(results.cases, compare, args.tolerance)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "python": platform.python_version(), "platform": platform.platform(),
+                       "cpus": os.cpu_count(), "cases": results.cases}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
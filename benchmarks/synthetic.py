@@ -0,0 +1,125 @@
+"""Synthetic tables and templates for the benchmarks, of any size.
+
+Tables have an email column (about 1% invalid and 1% repeated addresses), first and last names with
+accents and apostrophes, and numbers, grades, dates, groups and free text notes, some of them with
+markdown characters, up to the requested number of columns. Templates come in three kinds:
+
+- short: a greeting with two placeholders
+- table: a markdown table of up to ten columns between static paragraphs
+- rich: headings, lists, emphasis, a link and a quote around every column of the table
+
+To write a table and its templates for trying the app, run from the repository root:
+
+    python benchmarks/synthetic.py 100000 20 --format csv --output synthetic
+"""
+import argparse
+import os
+import sys
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Elif", "Felix", "Greta", "Hannes", "Ida", "Jonas", "Zoë", "Lukas",
+               "Marie", "Noah", "Olivia", "Paul", "René", "Sophie", "Tobias", "Ümit"]
+LAST_NAMES = ["Bauer", "Huber", "Gruber", "Wagner", "Müller", "Pichler", "Steiner", "Moser", "Mayer", "Hofer",
+              "O'Brien", "Leitner", "Berger", "Fuchs", "Eder", "Fischer", "Schmid", "Winkler", "Weber", "Schwarz"]
+GROUPS = ["1A", "1B", "2A", "2B", "3A", "3B", "4A", "4B"]
+NOTES = ["well done", "please see me after class", "needs to hand in the project", "*excellent* work",
+         "missed 3 lessons", "#1 in the class", "talk to your parents", "keep it up", "a_b testing group", ""]
+DATES = pd.date_range("2024-09-01", periods=300).strftime("%d.%m.%Y").to_numpy(dtype=object)
+KINDS = ("score", "grade", "date", "group", "note")
+TEMPLATES = ("short", "table", "rich")
+FORMATS = ("csv", "xlsx", "parquet", "feather")
+
+
+def ascii_names(names: np.ndarray) -> list:
+    # addresses have no accents or apostrophes, names are transliterated once per distinct name
+    ascii = {name: unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().replace("'", "").lower()
+             for name in set(names)}
+    return [ascii[name] for name in names]
+
+
+def make_table(rows: int, columns: int, seed: int = 0) -> pd.DataFrame:
+    """`rows` x `columns` table, at least three columns: email, first_name, last_name."""
+    rng = np.random.default_rng(seed)
+    first = np.array(FIRST_NAMES, dtype=object)[rng.integers(len(FIRST_NAMES), size=rows)]
+    last = np.array(LAST_NAMES, dtype=object)[rng.integers(len(LAST_NAMES), size=rows)]
+    emails = [f"{f}.{n}{i}@example.org" for i, (f, n) in enumerate(zip(ascii_names(first), ascii_names(last)))]
+    for i in range(0, rows, 100):
+        emails[i] = f"no address {i}"
+    for i in range(50, rows, 100):
+        emails[i] = emails[i - 1].upper()
+    data = {"email": emails, "first_name": first, "last_name": last}
+    for c in range(3, max(columns, 3)):
+        kind = KINDS[(c - 3) % len(KINDS)]
+        if kind == "score":
+            data[f"score{c}"] = rng.integers(0, 101, size=rows)
+        elif kind == "grade":
+            data[f"grade{c}"] = rng.integers(10, 51, size=rows) / 10
+        elif kind == "date":
+            data[f"date{c}"] = DATES[rng.integers(len(DATES), size=rows)]
+        elif kind == "group":
+            data[f"group{c}"] = np.array(GROUPS, dtype=object)[rng.integers(len(GROUPS), size=rows)]
+        else:
+            data[f"note{c}"] = np.array(NOTES, dtype=object)[rng.integers(len(NOTES), size=rows)]
+    return pd.DataFrame(data)
+
+
+def make_template(kind: str, header: list) -> str:
+    """A template of `kind` (see TEMPLATES) using the columns in `header`, with a subject line."""
+    fields = [str(h) for h in header if h != "email"]
+    if kind == "short":
+        return f"subject: Hello [[first_name]]\nHello [[first_name]] [[last_name]],\n\nthis is your report."
+    if kind == "table":
+        shown = fields[2:12] or fields
+        rows = "\n".join(f"| {name} | [[{name}]] |" for name in shown)
+        return ("subject: Your report\n## Report for [[first_name]] [[last_name]]\n\n"
+                "Here are your results of this term:\n\n| | |\n|---|---|\n" + rows + "\n\n"
+                + "Please check them and tell us about any mistakes until the end of the month.\n\n" * 5
+                + "Kind regards,  \n*The school office*")
+    if kind == "rich":
+        items = "\n".join(f"- **{name}:** [[{name}]]" for name in fields)
+        return ("subject: Everything about [[first_name]]\n# Dear [[first_name]] [[last_name]]\n\n"
+                "> This summary is created *automatically*, see the [school website](https://example.org).\n\n"
+                "## Your data\n\n" + items + "\n\n## What is next\n\n1. check the data\n2. answer this email\n"
+                "3. come to the meeting\n\n---\n\nKind regards,  \n***The school office***")
+    raise ValueError(f"Unknown template kind {kind!r}, use {', '.join(TEMPLATES)}")
+
+
+def write_table(df: pd.DataFrame, path: str):
+    kind = os.path.splitext(path)[1].lower()
+    if kind == ".csv":
+        df.to_csv(path, index=False)
+    elif kind == ".xlsx":
+        df.to_excel(path, index=False)
+    elif kind == ".parquet":
+        df.to_parquet(path, index=False)
+    elif kind == ".feather":
+        df.to_feather(path)
+    else:
+        raise ValueError(f"Unsupported table format {kind}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic table and one template of every kind.")
+    parser.add_argument("rows", type=int)
+    parser.add_argument("columns", type=int)
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--output", default="synthetic", help="directory (default: synthetic)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    os.makedirs(args.output, exist_ok=True)
+    df = make_table(args.rows, args.columns, args.seed)
+    table = os.path.join(args.output, f"table_{args.rows}x{args.columns}.{args.format}")
+    write_table(df, table)
+    print(table)
+    for kind in TEMPLATES:
+        template = os.path.join(args.output, f"template_{kind}.md")
+        with open(template, "w", encoding="utf-8") as f:
+            f.write(make_template(kind, list(df.columns)))
+        print(template)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
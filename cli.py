@@ -0,0 +1,242 @@
+"""Headless bulk mail: the same tables, templates, filters, sending and export as the app, without the UI.
+
+    python cli.py TABLE TEMPLATE [--filter EXPR] [--filter-column COL] [--email-column COL] dry-run
+    python cli.py TABLE TEMPLATE send [--yes] [--transport ews|smtp|file]
+    python cli.py TABLE TEMPLATE export [--output FILE | --each DIRECTORY]
+
+Settings (credentials, [sending], [smtp], [file], [export], [loading], [cache], [stats]) are read from .settings.ini.
+Every run writes a JSON report with the time spent per stage to [stats] reports (default .job_reports).
+"""
+import argparse
+import asyncio
+import configparser
+import multiprocessing
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from filters import build_mask
+from ingest import read_batches, read_header, used_columns
+from jobs import JobProgress
+from mailing import INVALID, find_mail_option, split_subject, recipient_message
+from rowstore import RowStore
+from stats import Stats, activate, deactivate, settings_report, timed
+from tablecache import table_cache_from_config
+from template import CompiledTemplate
+from transports import TRANSPORTS
+
+
+class Mailing:
+    """A table, filtered, and a template: everything a send or export needs."""
+
+    def __init__(self, args, config: configparser.ConfigParser, stats: Stats):
+        self.args = args
+        self.config = config
+        self.stats = stats
+        with open(args.template, encoding="utf-8") as f:
+            subject, self.template = split_subject(f.read())
+        self.subject = args.subject or subject or ""
+        self.store = RowStore(self.load_table())
+        header = self.store.schema.header
+        self.email_column = args.email_column or find_mail_option(header)
+        if self.email_column not in self.store.schema.header_index:
+            raise ValueError(f"Email column {self.email_column} not found in {header}")
+        if args.filter:
+            self.store.apply_mask(build_mask(self.store.df, args.filter, args.filter_column or self.email_column))
+        self.compiled = CompiledTemplate(self.template, header)
+        self.store.check_emails(self.store.schema.header_index[self.email_column])
+        self.recipients = [self.store[int(index)] for index in self.store.sendable()]
+        shown = np.flatnonzero(~self.store.hidden)
+        self.invalid = [self.store[int(index)] for index in shown[self.store.status[shown] == INVALID]]
+        self.duplicates = len(shown) - len(self.invalid) - len(self.recipients)
+
+    def load_table(self) -> pd.DataFrame:
+        path = self.args.table
+        columns = None
+        if self.config.getboolean("loading", "template_columns_only", fallback=False):
+            header = read_header(path)
+            with open(self.args.template, encoding="utf-8") as f:
+                columns = used_columns(header, f.read(), self.args.email_column or find_mail_option(header))
+        if self.args.no_cache or not self.config.getboolean("cache", "enabled", fallback=True):
+            batches = read_batches(path, columns)
+        else:
+            batches = table_cache_from_config(self.config).read_batches(path, columns)
+        return pd.concat(list(batches), ignore_index=True)
+
+    def message(self, row) -> str:
+        return self.compiled.render(row.values)
+
+    def recipient_messages(self, rows):
+        for row in rows:
+            with timed("render"):
+                message = self.message(row)
+            yield recipient_message(row[self.email_column], message)
+
+    def summary(self) -> str:
+        return f"{len(self.recipients)} recipients, {len(self.invalid)} invalid and {self.duplicates} duplicate " \
+               f"emails skipped, {len(self.store) - self.store.count_non_hidden()} rows filtered out of {len(self.store)}"
+
+
+def report(progress: JobProgress, done: int):
+    if progress.update(done):
+        end = "\n" if done >= progress.total else ""
+        print(f"\r{str(progress):<60}", end=end, file=sys.stderr, flush=True)
+
+
+def dry_run(mailing: Mailing, args) -> int:
+    print(mailing.summary())
+    for row in mailing.invalid:
+        print(f"invalid email in row {row.row_index + 1}: {row[mailing.email_column]}")
+    for row in mailing.recipients[:args.show]:
+        print(f"\n--- To: {row[mailing.email_column]} --- Subject: {mailing.subject}\n")
+        print(mailing.message(row))
+    return 0
+
+
+def send(mailing: Mailing, args) -> int:
+    from engine import SendJob
+    from rendering import HtmlTemplate
+    from sender import sender_from_config
+    from session import AccountManager
+    from throttle import throttle_from_config
+
+    config = mailing.config
+    if args.journal is not None:
+        config.read_dict({"sending": {"journal": args.journal}})
+    if args.transport is not None:
+        config.read_dict({"sending": {"transport": args.transport}})
+    email = args.email or config.get("credentials", "email", fallback=None)
+    password = os.environ.get("BULKMAIL_PASSWORD") or config.get("credentials", "password", fallback=None)
+    needs_login = config.get("sending", "transport", fallback="ews") != "file"
+    if needs_login and (not email or not password):
+        print("No credentials, set them in the app, .settings.ini or --email and BULKMAIL_PASSWORD", file=sys.stderr)
+        return 2
+    print(mailing.summary())
+    if not mailing.recipients:
+        return 0
+    if not args.yes:
+        if not sys.stdin.isatty():
+            print("Not asking for confirmation without a terminal, pass --yes", file=sys.stderr)
+            return 2
+        if input(f"Send {len(mailing.recipients)} emails as {email or 'nobody'}? [y/N] ").strip().lower() != "y":
+            return 1
+    account_manager = AccountManager(max_connections=throttle_from_config(config).max_workers)
+    progress = JobProgress(len(mailing.recipients))
+    sender = sender_from_config(config, email, password, account_manager.get_account,
+                                progress=lambda result, done, total: report(progress, done))
+    job = SendJob(mailing.store, mailing.email_column, mailing.subject, HtmlTemplate(mailing.compiled), sender)
+    try:
+        # Ctrl+C cancels the engine, which waits for the batches in flight
+        sent = asyncio.run(job.send())
+    finally:
+        account_manager.check_errors(email, sender.errors)
+    mailing.stats.set_counts(**job.counts())
+    failures = sender.failures
+    print(f"{sent} emails sent successfully, {len(failures)} failed, {sender.skipped} already sent before "
+          f"({job.engine.throughput:.1f} emails/s)")
+    for failed, error in failures:
+        print(f"failed: {failed.address}: {error}", file=sys.stderr)
+    return 0 if sent + sender.skipped == job.total else 1
+
+
+def export(mailing: Mailing, args) -> int:
+    from export import StreamingPdfExport, PerRecipientPdfExport, SEPARATOR
+
+    config = mailing.config
+    rows = mailing.recipients
+    workers = config.getint("export", "workers", fallback=os.cpu_count() or 1)
+    print(mailing.summary())
+    if args.each:
+        progress = JobProgress(len(rows), unit="files")
+        filename_column = config.get("export", "filename_column", fallback=mailing.email_column)
+        if filename_column not in mailing.store.schema.header_index:
+            filename_column = mailing.email_column
+        messages = ((row[filename_column], row[mailing.email_column], message)
+                    for row, message in zip(rows, mailing.recipient_messages(rows)))
+        exporter = PerRecipientPdfExport(workers=workers, progress=lambda done: report(progress, done))
+        manifest = exporter.export(messages, args.each)
+        mailing.stats.set_counts(messages=len(rows), exported=len(manifest), failed=len(exporter.failed))
+        print(f"{len(manifest)} PDFs exported to {args.each} ({progress.rate:.1f} files/s)")
+        for filename, recipient in exporter.failed:
+            print(f"failed: {recipient}: could not convert {filename}", file=sys.stderr)
+        return 1 if exporter.failed else 0
+    filename = args.output or datetime.now().strftime("%Y%m%d-%H%M_") + mailing.subject + ".pdf"
+    progress = JobProgress(len(rows), unit="messages")
+    exporter = StreamingPdfExport(
+        chunk_size=config.getint("export", "chunk_size", fallback=50),
+        workers=workers,
+        progress=lambda done: report(progress, done),
+    )
+    exported = exporter.export(mailing.recipient_messages(rows), filename,
+                               preface=f"{len(rows)}/{len(mailing.store)} Emails{SEPARATOR}")
+    mailing.stats.set_counts(messages=len(rows), exported=exported)
+    print(f"{exported}/{len(mailing.store)} Emails exported to {filename}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Send or export a bulk mail without the user interface.")
+    parser.add_argument("table", help="table file (XLSX, CSV, Parquet, Feather)")
+    parser.add_argument("template", help="template file (MD, TXT), an optional first line 'subject: ...'")
+    parser.add_argument("--filter", help="filter expression, same syntax as the filter field in the app")
+    parser.add_argument("--filter-column", help="column for filter terms without 'column:' (default: email column)")
+    parser.add_argument("--email-column", help="column with the email addresses (default: detected)")
+    parser.add_argument("--subject", help="subject, overrides the template's subject line")
+    parser.add_argument("--settings", default=".settings.ini", help="settings file (default: .settings.ini)")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the table, bypass the table cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("dry-run", help="show recipients and messages without sending")
+    command.add_argument("--show", type=int, default=1, help="number of messages to print (default: 1)")
+    command.set_defaults(run=dry_run)
+
+    command = commands.add_parser("send", help="send the emails")
+    command.add_argument("--email", help="sender account (default: credentials in the settings)")
+    command.add_argument("--yes", action="store_true", help="do not ask for confirmation")
+    command.add_argument("--transport", choices=TRANSPORTS,
+                         help="ews, smtp or file, where file writes .eml files (default: [sending] transport or ews)")
+    command.add_argument("--journal", help="send journal, rows it has as sent are skipped "
+                                           "(default: [sending] journal or .send_journal.jsonl, '' to disable)")
+    command.set_defaults(run=send)
+
+    command = commands.add_parser("export", help="export the emails to PDF")
+    target = command.add_mutually_exclusive_group()
+    target.add_argument("--output", help="PDF file (default: date and subject)")
+    target.add_argument("--each", metavar="DIRECTORY", help="one PDF per email into DIRECTORY, plus index.csv")
+    command.set_defaults(run=export)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    config = configparser.ConfigParser()
+    config.read(args.settings)
+    stats = activate(Stats(args.command))
+    try:
+        try:
+            mailing = Mailing(args, config, stats)
+        except (OSError, ValueError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        return args.run(mailing, args)
+    finally:
+        deactivate(stats)
+        write_report(stats.finish(), config)
+
+
+def write_report(stats: Stats, config: configparser.ConfigParser):
+    directory = config.get("stats", "reports", fallback=".job_reports")
+    if not directory:
+        return
+    try:
+        print(f"report: {stats.write(directory, settings_report(config))}", file=sys.stderr)
+    except OSError as e:
+        print(f"report not written: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from journal import row_identity
+from rendering import HtmlTemplate
+from sender import ChunkResult, Email, Sender
+from stats import record
+
+
+class AsyncSendEngine:
+    """Renders and sends a mailing on an asyncio event loop, the app's or asyncio.run's, without blocking it.
+
+    `make_email(row)` turns a row into an Email, or returns None for a row without a valid address. It runs
+    in a rendering thread, `render_batch` rows at a time, while the sender's transport sends earlier batches
+    from its worker threads, so rendering overlaps the network instead of coming before it. At most
+    `max_ahead` rendered emails wait to be sent. Throttling, retries, the journal and progress work as in
+    `Sender.send`, progress is reported on the event loop.
+    Cancelling the task lets the batches in flight finish and counts everything else as cancelled.
+    """
+
+    def __init__(self, sender: Sender, make_email, render_batch: int = 100, max_ahead: int = 2000):
+        self.sender = sender
+        self.make_email = make_email
+        self.render_batch = render_batch
+        self.max_ahead = max_ahead
+        self.invalid = []
+        self.rendered = 0
+        self.render_time = 0.0
+        self.send_time = 0.0
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Emails sent per second, from the first row rendered to the last batch sent."""
+        return self.sender.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def counts(self) -> dict:
+        """What the send did, for the job's stats."""
+        sender = self.sender
+        return {"sent": sender.sent, "failed": len(sender.failures), "skipped": sender.skipped,
+                "invalid": len(self.invalid), "emails_per_s": round(self.throughput, 1)}
+
+    def __str__(self):
+        return (f"{self.sender.sent} sent in {self.elapsed:.1f}s, {self.throughput:.1f} emails/s, "
+                f"rendering took {self.render_time:.1f}s, batches {self.send_time:.1f}s")
+
+    async def send(self, rows, total: int) -> int:
+        """Render and send the `total` rows `rows` yields, returns the number of emails sent."""
+        sender = self.sender
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.emails = []
+        self.queue = deque()
+        self.added = asyncio.Event()
+        self.taken = asyncio.Event()
+        self.pool = ThreadPoolExecutor(max_workers=sender.throttle.max_workers)
+        self.renderer = ThreadPoolExecutor(max_workers=1)
+        await loop.run_in_executor(None, sender.begin)
+        rendering = asyncio.ensure_future(self.render(iter(rows), total))
+        try:
+            pending = await self.send_round(self.queue, rendering, 0, total)
+            for attempt in range(1, sender.retries + 1):
+                if not pending or not await self.wait(attempt):
+                    break
+                pending = await self.send_round(deque(pending), None, attempt, total)
+        finally:
+            rendering.cancel()
+            self.renderer.shutdown(wait=False, cancel_futures=True)
+            self.pool.shutdown(wait=False)
+            await loop.run_in_executor(None, sender.end)
+            self.elapsed = time.perf_counter() - start
+        return sender.sent
+
+    async def render(self, rows, total: int):
+        loop = asyncio.get_running_loop()
+        while self.rendered < total:
+            while len(self.queue) >= self.max_ahead:
+                self.taken.clear()
+                await self.taken.wait()
+            emails, invalid = await loop.run_in_executor(self.renderer, self.render_rows, rows)
+            if not emails and not invalid:
+                break
+            self.rendered += len(emails) + len(invalid)
+            self.invalid.extend(invalid)
+            self.sender.done += len(invalid)
+            pending = self.sender.unsent(emails)
+            self.emails.extend(pending)
+            self.queue.extend(pending)
+            self.added.set()
+
+    def render_rows(self, rows) -> tuple:
+        start = time.perf_counter()
+        emails, invalid = [], []
+        for row in itertools.islice(rows, self.render_batch):
+            email = self.make_email(row)
+            if email is None:
+                invalid.append(row)
+            else:
+                emails.append(email)
+        elapsed = time.perf_counter() - start
+        self.render_time += elapsed
+        record("render", elapsed, len(emails) + len(invalid))
+        return emails, invalid
+
+    async def send_round(self, queue: deque, rendering: asyncio.Task | None, attempt: int, total: int) -> list:
+        """Like `Sender.send_round`, while `rendering` is still adding to `queue`."""
+        sender = self.sender
+        throttle = sender.throttle
+        loop = asyncio.get_running_loop()
+        emails = list(queue) if rendering is None else self.emails
+        running = set()
+        retry = []
+        sender.requeued = {}
+        index = 0
+        try:
+            while queue or running or (rendering is not None and not rendering.done()):
+                rendered = rendering is None or rendering.done()
+                # wait for full batches while rows are still being rendered
+                while queue and len(running) < throttle.workers and (rendered or len(queue) >= throttle.batch_size):
+                    chunk = [queue.popleft() for _ in range(min(throttle.batch_size, len(queue)))]
+                    if not await loop.run_in_executor(None, throttle.acquire, len(chunk), sender.cancelled):
+                        queue.extendleft(reversed(chunk))
+                        break
+                    running.add(loop.run_in_executor(self.pool, sender.send_chunk, index, chunk, attempt))
+                    index += 1
+                self.taken.set()
+                if sender.cancelled.is_set():
+                    if rendering is not None:
+                        rendering.cancel()
+                    if queue:
+                        sender.collect(ChunkResult(index, list(queue), attempt, cancelled=True), total)
+                        index += 1
+                        queue.clear()
+                    rendered = True
+                if not running and rendered:
+                    continue
+                self.added.clear()
+                waiting = set(running)
+                if not rendered:
+                    waiting |= {rendering, asyncio.ensure_future(self.added.wait())}
+                finished, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                for future in waiting - running:
+                    if future is not rendering:
+                        future.cancel()
+                if rendering is not None and rendering.done() and not rendering.cancelled():
+                    # raises if rendering failed
+                    rendering.result()
+                for future in finished & running:
+                    running.discard(future)
+                    result = future.result()
+                    self.send_time += result.latency
+                    sender.chunk_done(result, queue, retry, total)
+        except BaseException:
+            sender.cancel()
+            if rendering is not None:
+                rendering.cancel()
+            # the batches in flight cannot be stopped, wait for them to know what was sent
+            for result in await asyncio.gather(*running, return_exceptions=True):
+                if isinstance(result, ChunkResult):
+                    sender.collect(result, total)
+            if queue:
+                sender.collect(ChunkResult(index, list(queue), attempt, cancelled=True), total)
+                queue.clear()
+            raise
+        return sender.next_round(emails, retry, attempt)
+
+    async def wait(self, attempt: int) -> bool:
+        await asyncio.sleep(self.sender.retry_delay(attempt))
+        return not self.sender.cancelled.is_set()
+
+
+class SendJob:
+    """The sendable rows of a RowStore, as emails with `subject` and the body `html` renders, sent by `sender`.
+
+    The app and the command line send the same way through this. With Bcc sending, rows with the same body
+    are sent next to each other, so they end up in the same batches and go out as one message.
+    """
+
+    def __init__(self, store, email_column: str, subject: str, html: HtmlTemplate, sender: Sender):
+        self.store = store
+        self.email_column = email_column
+        self.subject = subject
+        self.html = html
+        self.rows = store.sendable()
+        if sender.transport.bcc > 1:
+            self.rows = store.grouped(self.rows, html.compiled.fields)
+        self.rendered = html.rendered
+        self.engine = AsyncSendEngine(sender, self.make_email)
+
+    @property
+    def total(self) -> int:
+        return len(self.rows)
+
+    def make_email(self, row) -> Email:
+        address = row[self.email_column]
+        return Email(address=address, subject=self.subject, message=self.html.render(row.values),
+                     key=row_identity(self.subject, address, row.values))
+
+    async def send(self) -> int:
+        """Render and send every row, returns the number of emails sent."""
+        return await self.engine.send((self.store[int(index)] for index in self.rows), self.total)
+
+    def counts(self) -> dict:
+        """What the send did, for the job's stats."""
+        return {"rows": self.total, "bodies": self.html.rendered - self.rendered, **self.engine.counts()}
@@ -0,0 +1,197 @@
+import csv
+import os
+import re
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Iterable, Iterator
+
+from lazy import LazyModule
+from rendering import markdown_to_html
+from stats import merge, run_recorded, timed
+
+pisa = LazyModule("xhtml2pdf.pisa")
+pypdf = LazyModule("pypdf")
+
+SEPARATOR = "\n<hr>\n\n"
+
+
+def write_pdf(html: str, filename: str) -> bool:
+    """False if xhtml2pdf reported an error, the file may be broken then."""
+    with timed("pdf convert"), open(filename, "w+b") as f:
+        pisa_status = pisa.CreatePDF(html, dest=f)
+    return not pisa_status.err
+
+
+def write_chunk(messages: list, filename: str, preface: str = "") -> str:
+    """Convert markdown messages to one PDF, separated by horizontal rules. Runs in a worker process."""
+    html = preface + "".join(markdown_to_html(m) + SEPARATOR for m in messages)
+    if not write_pdf(html, filename):
+        raise ValueError(f"Could not convert {len(messages)} messages to PDF")
+    return filename
+
+
+def merge_pdfs(parts: list, filename: str):
+    with timed("pdf merge", len(parts)):
+        writer = pypdf.PdfWriter()
+        for part in parts:
+            writer.append(part)
+        with open(filename, "wb") as f:
+            writer.write(f)
+
+
+def chunked_iter(items: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def create_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn behaves the same on Windows, macOS and Linux and does not fork the running TUI
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"))
+
+
+class PdfExport:
+    """Runs PDF conversions in order, in a process pool if `workers` is above one.
+
+    At most two tasks per worker are in flight, so memory is bounded by the task size, not by the number
+    of rows. `progress` is called with the number of messages written after every task and `cancelled` is
+    checked before a new task is started. Stages the worker processes time are merged into this process's
+    stats.
+    """
+
+    def __init__(self, workers: int = 1, progress=None, cancelled=None):
+        self.workers = max(1, workers)
+        self.progress = progress
+        self.cancelled = cancelled
+
+    def is_cancelled(self) -> bool:
+        return self.cancelled is not None and self.cancelled()
+
+    def run(self, tasks: Iterable[tuple]) -> Iterator:
+        """Takes (message count, function, *args) tuples and yields the function results in order."""
+        done = 0
+        with create_pool(self.workers) if self.workers > 1 else ThreadPoolExecutor(max_workers=1) as executor:
+            pending = deque()
+            for count, fn, *args in tasks:
+                if self.is_cancelled():
+                    return
+                if self.workers > 1:
+                    fn, args = run_recorded, (fn, *args)
+                pending.append((count, executor.submit(fn, *args)))
+                while len(pending) >= 2 * self.workers:
+                    done = yield from self._collect(pending, done)
+            while pending:
+                done = yield from self._collect(pending, done)
+
+    def _collect(self, pending: deque, done: int):
+        count, future = pending.popleft()
+        result = future.result()
+        if self.workers > 1:
+            result, recorded = result
+            merge(recorded)
+        yield result
+        done += count
+        if self.progress is not None:
+            self.progress(done)
+        return done
+
+
+class StreamingPdfExport(PdfExport):
+    """Writes a combined PDF from a stream of markdown messages without holding all of them at once.
+
+    Messages are taken `chunk_size` at a time, each chunk becomes a partial PDF and the partial files
+    are merged in order.
+    """
+
+    def __init__(self, chunk_size: int = 50, workers: int = 1, progress=None, cancelled=None):
+        if chunk_size < 1:
+            raise ValueError(f"Chunk size must be at least 1, got {chunk_size}")
+        super().__init__(workers, progress, cancelled)
+        self.chunk_size = chunk_size
+
+    def export(self, messages: Iterable[str], filename: str, preface: str = "") -> int | None:
+        """Returns the number of exported messages, or None if the export was cancelled."""
+        directory = tempfile.mkdtemp(prefix="bulkmail-")
+        counts = []
+
+        def tasks():
+            for index, chunk in enumerate(chunked_iter(messages, self.chunk_size)):
+                counts.append(len(chunk))
+                part = os.path.join(directory, f"{index:06d}.pdf")
+                yield len(chunk), write_chunk, chunk, part, preface if index == 0 else ""
+
+        try:
+            parts = list(self.run(tasks()))
+            if self.is_cancelled():
+                return None
+            merge_pdfs(parts, filename)
+            return sum(counts)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+class PerRecipientPdfExport(PdfExport):
+    """Writes one PDF per message into a directory, plus an index.csv manifest mapping files to recipients.
+
+    Messages that could not be converted get no file and no manifest row, they are kept in `failed`.
+    """
+
+    MANIFEST = "index.csv"
+
+    def export(self, messages: Iterable[tuple[str, str, str]], directory: str) -> list | None:
+        """Takes (file name, recipient, markdown message) tuples.
+
+        Returns the manifest rows as (file, recipient) tuples, or None if the export was cancelled.
+        """
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        used = set()
+        self.failed = []
+
+        def tasks():
+            for name, recipient, message in messages:
+                filename = unique_filename(safe_filename(name), used)
+                entries.append((filename, recipient))
+                yield 1, write_message_pdf, message, os.path.join(directory, filename)
+
+        written = [result is not None for result in self.run(tasks())]
+        if self.is_cancelled():
+            return None
+        manifest = [entry for entry, ok in zip(entries, written) if ok]
+        self.failed = [entry for entry, ok in zip(entries, written) if not ok]
+        with open(os.path.join(directory, self.MANIFEST), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["file", "recipient"])
+            writer.writerows(manifest)
+        return manifest
+
+
+def write_message_pdf(message: str, filename: str) -> str | None:
+    """The file written, None if the conversion failed, which leaves no file."""
+    if write_pdf(markdown_to_html(message), filename):
+        return filename
+    os.remove(filename)
+    return None
+
+
+def safe_filename(value) -> str:
+    name = re.sub(r"[^\w@.\- ]+", "_", str(value)).strip(" .")
+    return name or "message"
+
+
+def unique_filename(name: str, used: set) -> str:
+    filename = name + ".pdf"
+    number = 1
+    while filename.lower() in used:
+        number += 1
+        filename = f"{name}_{number}.pdf"
+    used.add(filename.lower())
+    return filename
@@ -0,0 +1,85 @@
+import re
+
+import numpy as np
+
+from lazy import LazyModule
+
+pd = LazyModule("pandas")
+
+HELP = """
+Filter expressions (the selected column is used unless a term starts with `column:`):
+- `John` exact match, `!=John` everything else
+- `<100`, `>100`, `<=100`, `>=100` numbers, `10..20` numbers in a range (inclusive)
+- `~ohn` contains (case insensitive), `/^J.*n$/` regular expression (without `&` and `|`)
+- `&` (and) and `|` (or) combine terms, e.g. `grades:<3 & class:4 | gender:Female`
+"""
+
+NUMBER = r"[-+]?\d+(?:[.,]\d+)?"
+COMPARISON = re.compile(rf"(<=|>=|<|>)\s*({NUMBER})")
+RANGE = re.compile(rf"({NUMBER})\s*\.\.\s*({NUMBER})")
+
+
+def to_number(text: str) -> float:
+    return float(text.replace(",", "."))
+
+
+def split_column(term: str, columns: list, default_column: str) -> tuple[str, str]:
+    name, separator, rest = term.partition(":")
+    if separator and name.strip() in columns:
+        return name.strip(), rest.strip()
+    return default_column, term
+
+
+def as_text(series: "pd.Series") -> "pd.Series":
+    """The cells as strings, empty cells (NaN in tables read from CSV or XLSX) as empty strings, not "nan"."""
+    return series.astype(str).where(series.notna(), "")
+
+
+def term_mask(series: "pd.Series", term: str) -> "pd.Series":
+    if match := COMPARISON.fullmatch(term):
+        numbers = pd.to_numeric(series, errors="coerce")
+        n = to_number(match.group(2))
+        return {"<": numbers < n, ">": numbers > n, "<=": numbers <= n, ">=": numbers >= n}[match.group(1)]
+    if match := RANGE.fullmatch(term):
+        numbers = pd.to_numeric(series, errors="coerce")
+        return numbers.between(to_number(match.group(1)), to_number(match.group(2)))
+    if term.startswith("!="):
+        return as_text(series) != term[2:].strip()
+    if term.startswith("~"):
+        return as_text(series).str.contains(term[1:].strip(), case=False, regex=False)
+    if len(term) > 1 and term.startswith("/") and term.endswith("/"):
+        try:
+            return as_text(series).str.contains(term[1:-1], regex=True)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression {term}: {e}")
+    if term.startswith(("<", ">")):
+        raise ValueError(f"Invalid number comparison {term}")
+    if term.startswith("=="):
+        term = term[2:].strip()
+    elif term.startswith("="):
+        term = term[1:].strip()
+    return as_text(series) == term
+
+
+def build_mask(df: "pd.DataFrame", expression: str, default_column: str) -> np.ndarray:
+    """Evaluate a filter expression on the whole DataFrame, returns a boolean array (True = shown).
+
+    An empty expression shows every row.
+    """
+    if not expression.strip():
+        return np.ones(len(df), dtype=bool)
+    columns = [str(c) for c in df.columns]
+    default_column = str(default_column)
+    mask = np.zeros(len(df), dtype=bool)
+    for group in expression.split("|"):
+        group_mask = np.ones(len(df), dtype=bool)
+        for term in group.split("&"):
+            if not term.strip():
+                raise ValueError(f"Empty filter term in {expression.strip()}")
+            column, term = split_column(term.strip(), columns, default_column)
+            if column not in columns:
+                raise ValueError(f"Column {column} not found in {columns}")
+            series = df.iloc[:, columns.index(column)]
+            group_mask &= term_mask(series, term).to_numpy(dtype=bool)
+        mask |= group_mask
+    return mask
@@ -0,0 +1,192 @@
+import os
+import time
+from itertools import chain, repeat
+from typing import Iterator
+
+from lazy import LazyModule
+from stats import record
+from template import FIELD_PATTERN
+
+pd = LazyModule("pandas")
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+TABLE_FORMATS = (".xlsx", ".csv", ".parquet", ".feather")
+
+
+def is_table(path) -> bool:
+    return str(path).lower().endswith(TABLE_FORMATS)
+
+
+def suffix(path) -> str:
+    return os.path.splitext(str(path))[1].lower()
+
+
+def require_pyarrow(path):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ValueError(f"Reading {suffix(path)} files needs pyarrow (pip install pyarrow)")
+
+
+def read_header(path) -> list:
+    """Column names of the first sheet, without reading the rows."""
+    kind = suffix(path)
+    if kind == ".csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    if kind == ".xlsx":
+        rows = xlsx_rows(path)
+        try:
+            return list(next(rows, []))
+        finally:
+            rows.close()
+    require_pyarrow(path)
+    if kind == ".parquet":
+        import pyarrow.parquet
+        return list(pyarrow.parquet.ParquetFile(path).schema_arrow.names)
+    if kind == ".feather":
+        import pyarrow.feather
+        return list(pyarrow.feather.read_table(path, memory_map=True).schema.names)
+    raise ValueError(f"Unsupported table format {kind}")
+
+
+def used_columns(header: list, template: str, email_column) -> list | None:
+    """The columns referenced by the template plus the email column, in table order.
+
+    Returns None (all columns) if the template does not reference any column of the table.
+    """
+    wanted = set(FIELD_PATTERN.findall(template or ""))
+    if not wanted & {str(h) for h in header}:
+        return None
+    wanted.add(str(email_column))
+    return [h for h in header if str(h) in wanted]
+
+
+def read_chunks(path, columns: list = None, chunk_size: int = 10_000, first: int = None) -> Iterator["pd.DataFrame"]:
+    """Read a table in DataFrames of at most `chunk_size` rows, the first one `first` rows.
+
+    `columns` limits the columns read.
+    """
+    kind = suffix(path)
+    sizes = chain([first or chunk_size], repeat(chunk_size))
+    if kind == ".csv":
+        # every chunk infers its own dtypes, concat widens them where chunks disagree
+        with pd.read_csv(path, usecols=columns, iterator=True) as reader:
+            for size in sizes:
+                try:
+                    yield reader.get_chunk(size)
+                except StopIteration:
+                    return
+    elif kind == ".xlsx":
+        yield from read_xlsx_chunks(path, columns, sizes)
+    elif kind == ".parquet":
+        require_pyarrow(path)
+        import pyarrow.parquet
+        yield from arrow_chunks(pyarrow.parquet.ParquetFile(path).iter_batches(columns=columns), sizes)
+    elif kind == ".feather":
+        require_pyarrow(path)
+        import pyarrow.feather
+        # memory mapped, batches are sliced from the file without reading it all first
+        table = pyarrow.feather.read_table(path, columns=columns, memory_map=True)
+        yield from arrow_chunks(table.to_batches(), sizes)
+    else:
+        raise ValueError(f"Unsupported table format {kind}")
+
+
+def arrow_chunks(batches, sizes: Iterator[int]) -> Iterator["pd.DataFrame"]:
+    import pyarrow
+    pending = []
+    pending_rows = 0
+    size = next(sizes)
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= size:
+            table = pyarrow.Table.from_batches(pending)
+            yield table.slice(0, size).to_pandas()
+            rest = table.slice(size)
+            pending = rest.to_batches()
+            pending_rows = rest.num_rows
+            size = next(sizes)
+    if pending_rows:
+        yield pyarrow.Table.from_batches(pending).to_pandas()
+
+
+def xlsx_rows(path):
+    if CalamineWorkbook is not None:
+        yield from CalamineWorkbook.from_path(str(path)).get_sheet_by_index(0).iter_rows()
+        return
+    from openpyxl import load_workbook
+    # read only mode streams the sheet instead of building every cell object up front
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def xlsx_value(value):
+    # excel stores every number as a float, read whole numbers back as int like pandas.read_excel does
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return None if value == "" else value
+
+
+def read_xlsx_chunks(path, columns: list = None, sizes: Iterator[int] = None) -> Iterator["pd.DataFrame"]:
+    sizes = sizes or repeat(10_000)
+    rows = xlsx_rows(path)
+    header = list(next(rows, []))
+    positions = list(range(len(header))) if columns is None else [header.index(c) for c in columns]
+    names = [header[i] for i in positions]
+    chunk = []
+    empty = True
+    size = next(sizes)
+    for row in rows:
+        if all(v is None or v == "" for v in row):
+            continue
+        chunk.append([xlsx_value(row[i]) if i < len(row) else None for i in positions])
+        if len(chunk) == size:
+            yield to_frame(chunk, names)
+            chunk = []
+            empty = False
+            size = next(sizes)
+    if chunk or empty:
+        yield to_frame(chunk, names)
+
+
+def to_frame(rows: list, columns: list) -> "pd.DataFrame":
+    return pd.DataFrame(rows, columns=columns).infer_objects()
+
+
+def timed_chunks(chunks: Iterator["pd.DataFrame"]) -> Iterator["pd.DataFrame"]:
+    """Record the time spent reading every chunk as the "read table" stage."""
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        record("read table", time.perf_counter() - start, len(chunk))
+        yield chunk
+
+
+def read_batches(path, columns: list = None, first: int = 1_000, chunk_size: int = 10_000) -> Iterator["pd.DataFrame"]:
+    """Yield the table in growing batches: `first` rows for a quick first screen, then doubling.
+
+    Appending doubling batches to the table keeps the total copying linear in the number of rows.
+    """
+    pending = []
+    pending_rows = 0
+    target = first
+    for chunk in timed_chunks(read_chunks(path, columns, chunk_size, first)):
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if pending_rows >= target:
+            yield pd.concat(pending, ignore_index=True) if len(pending) > 1 else pending[0]
+            target = pending_rows * 2
+            pending = []
+            pending_rows = 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
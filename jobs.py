@@ -0,0 +1,42 @@
+import time
+
+
+class JobProgress:
+    """Tracks a long running job and derives throughput and ETA from it."""
+
+    def __init__(self, total: int, unit: str = "emails", report_interval: float = 0.1):
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.report_interval = report_interval
+        self.start = time.perf_counter()
+        self.last_report = None
+
+    def update(self, done: int) -> bool:
+        """Set the number of finished items, returns True if enough time passed to show it."""
+        self.done = done
+        now = time.perf_counter()
+        if self.last_report is None or done >= self.total or now - self.last_report >= self.report_interval:
+            self.last_report = now
+            return True
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self) -> float:
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        rate = self.rate
+        if rate == 0:
+            return None
+        return (self.total - self.done) / rate
+
+    def __str__(self):
+        eta = "--:--" if self.eta is None else time.strftime("%M:%S", time.gmtime(self.eta))
+        return f"{self.done}/{self.total} {self.unit} · {self.rate:.1f} {self.unit}/s · ETA {eta}"
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from stats import timed
+
+DRAFT = "draft"
+SENT = "sent"
+FAILED = "failed"
+
+
+def row_identity(subject: str, address, values) -> str:
+    """Hash of what makes a row the same recipient of the same mailing: subject, address and row values."""
+    text = json.dumps([str(subject), str(address), *map(str, values)], ensure_ascii=False)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class SendJournal:
+    """Append-only record of every email's state, one JSON object per line.
+
+    The last line for a key wins: `draft` (with the draft's id and changekey), `sent` or `failed` (with the
+    error, and the draft's id if a draft was created but not sent). Reading the file back on the next run tells which
+    rows are done and which drafts already exist, so a re-run sends existing drafts instead of creating them
+    again and skips sent rows entirely.
+    A crash between the server sending a draft and the `sent` line being written leaves the row as `draft`,
+    sending that draft again fails because it is no longer in the drafts folder and the row is marked failed.
+    """
+
+    def __init__(self, path: str = ".send_journal.jsonl"):
+        self.path = path
+        self.states = {}
+        self.lock = threading.Lock()
+        self.read()
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a line cut off by a crash
+                    continue
+                self.states[entry["key"]] = entry
+
+    def record(self, entries: list):
+        """Append (key, state, address, extra fields) tuples with a single write and fsync."""
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        lines = []
+        with self.lock:
+            for key, state, address, extra in entries:
+                entry = {"key": key, "state": state, "address": str(address), "time": now, **extra}
+                previous = self.states.get(key)
+                if state != SENT and previous is not None and "id" in previous and "id" not in entry:
+                    # a draft stays known until it is sent
+                    entry["id"], entry["changekey"] = previous["id"], previous["changekey"]
+                self.states[key] = entry
+                lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            with timed("journal", len(lines)), open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def state(self, key: str) -> str | None:
+        entry = self.states.get(key)
+        return None if entry is None else entry["state"]
+
+    def is_sent(self, key: str) -> bool:
+        return self.state(key) == SENT
+
+    def draft(self, key: str) -> tuple | None:
+        """(id, changekey) of a draft created for this key and not sent yet."""
+        entry = self.states.get(key)
+        if entry is None or entry["state"] == SENT or "id" not in entry:
+            return None
+        return entry["id"], entry["changekey"]
+
+
+def journal_from_config(config) -> SendJournal | None:
+    """The journal at [sending] journal, None if it is set empty."""
+    path = config.get("sending", "journal", fallback=".send_journal.jsonl")
+    return SendJournal(path) if path else None
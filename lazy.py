@@ -0,0 +1,47 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule:
+    """Stands in for a module and imports it on the first attribute access.
+
+    `pd = LazyModule("pandas")` at the top of a file keeps `pd.DataFrame` working while pandas is only
+    imported when a table is actually read. Importing is thread safe, Python's import lock makes
+    concurrent first uses wait for one import.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+# imported by the first send, export or table, in the order they are usually needed
+HEAVY_MODULES = ["pandas", "markdown", "exchangelib", "xhtml2pdf.pisa", "pypdf"]
+
+
+def warm_up(modules: list = None) -> threading.Thread:
+    """Import heavy modules in a background thread, so the first real use does not wait for them."""
+
+    def run():
+        for name in modules or HEAVY_MODULES:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
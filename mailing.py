@@ -0,0 +1,91 @@
+import re
+
+import numpy as np
+
+from lazy import LazyModule
+from stats import timed
+
+pd = LazyModule("pandas")
+
+EMAIL_PATTERN = re.compile(r'([A-Za-z0-9]+[.-_])*[A-Za-z0-9]+@[A-Za-z0-9-]+(\.[A-Z|a-z]{2,})+')
+HIDDEN_NOTE = "*This message is excluded by filter and will not be sent. Check the table.*"
+
+# status of a row's address, UNCHECKED while no email column is chosen
+UNCHECKED, VALID, INVALID, DUPLICATE = 0, 1, 2, 3
+STATUS_LABELS = ("", "valid", "invalid", "duplicate")
+
+
+def find_mail_option(options: list):
+    mail_list = ["mail", " adress", "address"]
+    for option in options:
+        for mail in mail_list:
+            if mail in str(option).lower():
+                return option
+
+
+def is_valid_email(address) -> bool:
+    return EMAIL_PATTERN.fullmatch(str(address)) is not None
+
+
+class AddressCheck:
+    """Validity of the addresses in an email column, extended as rows are appended.
+
+    Addresses are matched against EMAIL_PATTERN with pandas string operations, once per row. Every address
+    gets a code, the same for addresses that only differ in case, so duplicates are found by comparing codes.
+    Which rows are duplicates depends on which rows are shown, `status` works it out for the hidden flags.
+    """
+
+    def __init__(self):
+        self.valid = np.zeros(0, dtype=bool)
+        self.codes = np.zeros(0, dtype=np.int64)
+        self.ids = {}  # lowercased address -> code
+
+    def __len__(self):
+        return len(self.valid)
+
+    def extend(self, values):
+        with timed("check emails", len(values)):
+            self._extend(values)
+
+    def _extend(self, values):
+        addresses = pd.Series(values, dtype=object).astype(str)
+        valid = addresses.str.fullmatch(EMAIL_PATTERN.pattern).to_numpy(dtype=bool)
+        ids = self.ids
+        codes = np.fromiter((ids.setdefault(a, len(ids)) for a in addresses.str.lower()),
+                            dtype=np.int64, count=len(addresses))
+        self.valid = np.concatenate([self.valid, valid])
+        self.codes = np.concatenate([self.codes, codes])
+
+    def status(self, hidden: np.ndarray, start: int = 0) -> np.ndarray:
+        """VALID or INVALID for the rows from `start` on, DUPLICATE for the shown ones whose address came up at
+        an earlier shown row, like `first_valid` leaves them out. The rows before `start` only count as earlier
+        rows, their status does not change when rows are appended."""
+        shown = self.valid & ~hidden
+        earlier = np.zeros(len(self.ids), dtype=bool)
+        earlier[self.codes[:start][shown[:start]]] = True
+        status = np.where(self.valid[start:], VALID, INVALID).astype(np.int8)
+        rows = np.flatnonzero(shown[start:])
+        codes = self.codes[start:][rows]
+        status[rows[earlier[codes] | pd.Series(codes).duplicated().to_numpy()]] = DUPLICATE
+        return status
+
+    def first_valid(self, indices: np.ndarray) -> np.ndarray:
+        """The `indices` of valid rows, without those whose address came up at an earlier one of them."""
+        indices = indices[self.valid[indices]]
+        return indices[~pd.Series(self.codes[indices]).duplicated().to_numpy()]
+
+
+def split_subject(template: str) -> tuple[str | None, str]:
+    """A first line "subject: ..." is the subject, the rest is the template."""
+    if template.startswith("subject:"):
+        lines = template.splitlines()
+        return lines[0].replace("subject:", "").strip(), "\n".join(lines[1:])
+    return None, template
+
+
+def hidden_message(message: str) -> str:
+    return HIDDEN_NOTE + "   \n\n" + message + "   \n\n" + HIDDEN_NOTE
+
+
+def recipient_message(address, message: str) -> str:
+    return f"**Recipient:** *{address}*\n\n" + message
@@ -0,0 +1,239 @@
+import re
+import threading
+from collections import OrderedDict, namedtuple
+
+from markdown_it import MarkdownIt
+from rich.style import Style
+from rich.text import Text
+from textual.widget import Widget
+from textual.widgets import Markdown
+# textual is pinned, these are the widgets Markdown shows inline text in
+from textual.widgets._markdown import MarkdownHeader, MarkdownParagraph, MarkdownTableContent
+
+# a top level markdown block: its source lines and the tokens Textual's Markdown builds its widgets from
+Block = namedtuple("Block", "source tokens")
+
+NEWLINES = re.compile(r"\r\n?|\n")
+
+
+def split_blocks(text: str, parser: MarkdownIt = None) -> list:
+    """The top level blocks of a markdown text, parsed once.
+
+    A text with link reference definitions stays a single block, its links need the definitions.
+    """
+    parser = parser or MarkdownIt("gfm-like")
+    env = {}
+    tokens = parser.parse(text, env)
+    if env.get("references"):
+        return [Block(text, tokens)]
+    # split like markdown-it does, so the line numbers in token.map match
+    lines = NEWLINES.split(text)
+    blocks = []
+    opened = None
+    for index, token in enumerate(tokens):
+        if token.level != 0:
+            continue
+        if token.nesting == 1:
+            opened = index
+            continue
+        first = index if token.nesting == 0 else opened
+        if tokens[first].map is None:
+            return [Block(text, tokens)]
+        begin, end = tokens[first].map
+        blocks.append(Block("\n".join(lines[begin:end]), tokens[first:index + 1]))
+    return blocks
+
+
+def structure(tokens: list) -> list:
+    """Everything about the tokens but their inline text, blocks with the same structure differ only in text."""
+    return [(t.type,) if t.type == "inline" else (t.type, t.tag, t.info, t.content) for t in tokens]
+
+
+def text_slots(widget: Widget):
+    """The widgets showing inline text below `widget` in document order, with the cell for tables."""
+    for child in widget.children:
+        if isinstance(child, MarkdownTableContent):
+            yield from ((child, (None, column)) for column in range(len(child.headers)))
+            for row, cells in enumerate(child.rows):
+                yield from ((child, (row, column)) for column in range(len(cells)))
+        elif isinstance(child, (MarkdownParagraph, MarkdownHeader)):
+            yield child, None
+        else:
+            yield from text_slots(child)
+
+
+class PreviewCache:
+    """Blocks of rendered previews by (template version, row number, hidden), least recently used dropped first.
+
+    `use` is called with the current template on the app's thread and returns its version, a new template
+    drops the previews of the old one. Previews rendered in the background for an old version are not stored.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.template = None
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def use(self, template) -> int:
+        with self.lock:
+            if template is not self.template:
+                self.template = template
+                self.version += 1
+                self.entries.clear()
+            return self.version
+
+    def get(self, key: tuple) -> list | None:
+        with self.lock:
+            blocks = self.entries.get(key)
+            if blocks is not None:
+                self.entries.move_to_end(key)
+            return blocks
+
+    def put(self, key: tuple, blocks: list):
+        with self.lock:
+            if key[0] != self.version:
+                return
+            self.entries[key] = blocks
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class PreviewBlock(Markdown):
+    """A Markdown widget for one Block, built from its tokens instead of parsing the source again."""
+
+    def __init__(self, block: Block):
+        # Markdown.update gets the tokens from parser_factory().parse()
+        super().__init__(block.source, parser_factory=lambda: self)
+        self.block = block
+
+    def parse(self, markdown: str) -> list:
+        return self.block.tokens
+
+    def show(self, block: Block):
+        """Show `block`, only setting the text that changed if it has the structure of the current one."""
+        old, self.block = self.block, block
+        if structure(old.tokens) == structure(block.tokens) and self.patch(old.tokens, block.tokens):
+            return None
+        return self.update(block.source)
+
+    def patch(self, old: list, new: list) -> bool:
+        slots = list(text_slots(self))
+        inline = [(o, n) for o, n in zip(old, new) if n.type == "inline"]
+        if len(slots) != len(inline):
+            return False
+        tables = set()
+        for (widget, cell), (o, n) in zip(slots, inline):
+            if o.content == n.content:
+                continue
+            if cell is None:
+                widget.set_content(self.inline_text(n))
+                continue
+            row, column = cell
+            if row is None:
+                widget.headers[column] = self.inline_text(n)
+            else:
+                widget.rows[row][column] = self.inline_text(n)
+            tables.add(widget)
+        for table in tables:
+            table.refresh(layout=True)
+        return True
+
+    def inline_text(self, token) -> Text:
+        # what Markdown.update makes of an inline token
+        styles = [Style()]
+        text = Text()
+        for child in token.children or ():
+            if child.type == "text":
+                text.append(child.content, styles[-1])
+            elif child.type == "hardbreak":
+                text.append("\n")
+            elif child.type == "softbreak":
+                text.append(" ", styles[-1])
+            elif child.type == "code_inline":
+                text.append(child.content, styles[-1] + self.get_component_rich_style("code_inline", partial=True))
+            elif child.type in ("em_open", "strong_open", "s_open"):
+                styles.append(styles[-1] + self.get_component_rich_style(child.type[:-5], partial=True))
+            elif child.type == "link_open":
+                styles.append(styles[-1] + Style.from_meta({"@click": f"link({child.attrs.get('href', '')!r})"}))
+            elif child.type == "image":
+                style = styles[-1] + Style.from_meta({"@click": f"link({child.attrs.get('src', '')!r})"})
+                text.append("🖼  ", style)
+                if child.attrs.get("alt"):
+                    text.append(f"({child.attrs['alt']})", style)
+                for grandchild in child.children or ():
+                    text.append(grandchild.content, style)
+            elif child.type.endswith("_close"):
+                styles.pop()
+        return text
+
+
+class PreviewDocument(Widget):
+    """Markdown shown as one PreviewBlock per top level block, an update only replaces the blocks that changed.
+
+    Textual's Markdown removes and mounts all of its widgets on every update, which is what makes stepping
+    through recipients slow. Between two recipients usually only the blocks with placeholders differ, and
+    only in their text, which is set on the widgets that are there. While editing, only the block under the
+    cursor changes. Updates that come in while one is being mounted are skipped but for the latest.
+    """
+
+    DEFAULT_CSS = """
+    PreviewDocument {
+        height: auto;
+        layout: vertical;
+    }
+    """
+
+    def __init__(self, markdown: str = None, *, id: str = None, classes: str = None):
+        super().__init__(id=id, classes=classes)
+        self.wanted = None if markdown is None else split_blocks(markdown)
+        self.updating = False
+        self.mounted = False
+
+    def on_mount(self):
+        self.mounted = True
+        if self.wanted is not None:
+            self.show(self.wanted)
+
+    def update(self, markdown: str):
+        self.show(split_blocks(markdown))
+
+    def show(self, blocks: list):
+        self.wanted = blocks
+        if self.mounted and not self.updating:
+            self.updating = True
+            self.run_worker(self.show_latest(), group="preview_document")
+
+    async def show_latest(self):
+        try:
+            while self.wanted is not None:
+                blocks, self.wanted = self.wanted, None
+                await self.replace(blocks)
+        finally:
+            self.updating = False
+
+    async def replace(self, blocks: list):
+        children = list(self.children)
+        old = [child.block.source for child in children]
+        new = [block.source for block in blocks]
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]:
+            start += 1
+        end = 0
+        while end < min(len(old), len(new)) - start and old[-1 - end] == new[-1 - end]:
+            end += 1
+        changed = children[start:len(children) - end]
+        replacements = blocks[start:len(blocks) - end]
+        with self.app.batch_update():
+            waiting = [child.show(block) for child, block in zip(changed, replacements)]
+            waiting += [child.remove() for child in changed[len(replacements):]]
+            added = [PreviewBlock(block) for block in replacements[len(changed):]]
+            if added:
+                position = start + len(changed)
+                waiting.append(self.mount_all(added, before=position) if position < len(children)
+                               else self.mount_all(added))
+        for awaitable in waiting:
+            if awaitable is not None:
+                await awaitable
@@ -0,0 +1,108 @@
+import re
+import threading
+from functools import lru_cache
+
+from lazy import LazyModule
+from stats import timed
+from template import CompiledTemplate
+
+markdown = LazyModule("markdown")
+
+# values made of words joined by single harmless characters render to themselves in markdown
+SAFE_VALUE = re.compile(r"[^\W_]+(?:[ @.,'/:-][^\W_]+)*")
+
+
+class MarkdownRenderer:
+    """One configured Markdown instance, reset between documents, with an LRU cache of converted texts."""
+
+    def __init__(self, cache_size: int = 512):
+        self.md = markdown.Markdown(extensions=["tables"])
+        self.lock = threading.Lock()
+        self.convert = lru_cache(maxsize=cache_size)(self._convert)
+
+    def _convert(self, text: str) -> str:
+        with self.lock, timed("markdown"):
+            return self.md.reset().convert(text)
+
+
+_renderer = None
+
+
+def get_renderer() -> MarkdownRenderer:
+    global _renderer
+    if _renderer is None:
+        _renderer = MarkdownRenderer()
+    return _renderer
+
+
+def markdown_to_html(message: str) -> str:
+    return get_renderer().convert(message)
+
+
+class HtmlTemplate:
+    """Renders a CompiledTemplate straight to HTML.
+
+    The template is converted once with a placeholder word in every slot. Rows whose values are plain
+    words (see SAFE_VALUE) are substituted into that HTML directly, everything else goes through markdown.
+    Rows with the same values in the fields the template uses get the same body, the last `cache_size`
+    bodies are kept by those values (see `key`), so every body is rendered once and shared by its rows.
+    """
+
+    def __init__(self, compiled: CompiledTemplate, renderer: MarkdownRenderer = None, cache_size: int = 4096):
+        self.compiled = compiled
+        self.renderer = renderer or get_renderer()
+        self.segments = None
+        self.slots = []
+        self.line_start = set()
+        self.rendered = 0  # bodies rendered, the other rows shared one of them
+        self.body = lru_cache(maxsize=cache_size)(self._body)
+        self.prepare()
+
+    def prepare(self):
+        compiled = self.compiled
+        placeholders = {index: f"bulkmailslot{index}x" for index in compiled.fields}
+        html = self.renderer.convert(compiled.render(placeholders))
+        for position, index in compiled.slots:
+            before = "".join(compiled.segments[:position]).rsplit("\n", 1)[-1]
+            if before.strip() == "":
+                # a value at the start of a line could start a list or heading
+                self.line_start.add(index)
+        pattern = re.compile("|".join(placeholders.values()))
+        if not placeholders or len(pattern.findall(html)) != len(compiled.slots):
+            # markdown moved or dropped a placeholder, never use the shortcut for this template
+            self.segments = [html] if not placeholders else None
+            return
+        self.segments = []
+        position = 0
+        for match in pattern.finditer(html):
+            self.segments.append(html[position:match.start()])
+            self.slots.append((len(self.segments), int(match.group(0)[12:-1])))
+            self.segments.append("")
+            position = match.end()
+        self.segments.append(html[position:])
+
+    def is_safe(self, values) -> bool:
+        for index in self.compiled.fields:
+            value = str(values[index])
+            if not SAFE_VALUE.fullmatch(value):
+                return False
+            if index in self.line_start and not value[0].isalpha():
+                return False
+        return True
+
+    def key(self, values) -> tuple:
+        """The values of the fields the template uses as they are rendered, rows with the same key get the same body."""
+        return tuple(str(values[index]) for index in self.compiled.fields)
+
+    def render(self, values) -> str:
+        return self.body(self.key(values))
+
+    def _body(self, key: tuple) -> str:
+        self.rendered += 1
+        values = dict(zip(self.compiled.fields, key))
+        if self.segments is None or not self.is_safe(values):
+            return self.renderer.convert(self.compiled.render(values))
+        parts = self.segments.copy()
+        for position, index in self.slots:
+            parts[position] = str(values[index])
+        return "".join(parts)
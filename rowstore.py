@@ -0,0 +1,185 @@
+import numpy as np
+
+from lazy import LazyModule
+from mailing import AddressCheck
+
+pd = LazyModule("pandas")
+
+
+class TableSchema:
+    """Header and column keys of a table, shared by all of its rows."""
+
+    __slots__ = ("header", "column_keys", "header_index", "key_index")
+
+    def __init__(self, header, column_keys=None):
+        self.header = list(header)
+        self.column_keys = list(column_keys) if column_keys is not None else []
+        self.header_index = {h: i for i, h in enumerate(self.header)}
+        self.key_index = {k: i for i, k in enumerate(self.column_keys)}
+
+    def __len__(self):
+        return len(self.header)
+
+
+class RowStore:
+    """The rows of a DataFrame, kept as one array per column plus one hidden flag and address status per row."""
+
+    def __init__(self, df: "pd.DataFrame" = None, schema: TableSchema = None):
+        # an empty store has no DataFrame, so creating one does not import pandas
+        self.df = None if df is None else df.reset_index(drop=True)
+        self.schema = TableSchema([] if df is None else df.columns) if schema is None else schema
+        self.column_data = [] if df is None else [self.df.iloc[:, i].to_numpy() for i in range(len(df.columns))]
+        self.hidden = np.zeros(0 if df is None else len(df), dtype=bool)
+        self.status = np.zeros(len(self.hidden), dtype=np.int8)
+        self.email_column = None
+        self.address_check = None
+
+    def __len__(self):
+        return len(self.hidden)
+
+    def append(self, df: "pd.DataFrame") -> np.ndarray:
+        """Add the rows of `df`, which must have the same columns, as shown rows, returns the indices whose
+        address status changed."""
+        if self.df is None or not len(self.df):
+            self.df = df.reset_index(drop=True)
+        else:
+            self.df = pd.concat([self.df, df], ignore_index=True)
+        self.column_data = [self.df.iloc[:, i].to_numpy() for i in range(len(self.df.columns))]
+        start = len(self.hidden)
+        self.hidden = np.concatenate([self.hidden, np.zeros(len(df), dtype=bool)])
+        return self.check_emails(self.email_column, self.address_check, start)
+
+    def __getitem__(self, index: int) -> "DataRow":
+        if index >= len(self):
+            raise ValueError(f"Index {index} out of bounds for {len(self)} rows")
+        return DataRow(self, index)
+
+    def row_values(self, index: int) -> list:
+        return [column[index] for column in self.column_data]
+
+    def rows(self):
+        for index in range(len(self)):
+            yield DataRow(self, index)
+
+    def visible_rows(self):
+        for index in np.flatnonzero(~self.hidden):
+            yield DataRow(self, int(index))
+
+    def count_non_hidden(self) -> int:
+        return int(np.count_nonzero(~self.hidden))
+
+    def check_emails(self, column: int | None, check: AddressCheck = None, start: int = 0) -> np.ndarray:
+        """Set the address status of every row from `column`, None for no email column.
+
+        `check` may already cover the first rows, e.g. prepared in another thread, it is extended by the rest.
+        Rows before `start` keep their status, they were checked with the same `check` before rows were appended.
+        Returns the indices whose status changed.
+        """
+        if column is None:
+            self.email_column = self.address_check = None
+        else:
+            check = check or AddressCheck()
+            if len(check) < len(self):
+                check.extend(self.column_data[column][len(check):])
+            self.email_column = column
+            self.address_check = check
+        return self.update_status(start)
+
+    def update_status(self, start: int = 0) -> np.ndarray:
+        """Work out the address status again after rows were hidden or shown, duplicates are only counted among
+        the shown rows. Only rows from `start` on are looked at. Returns the indices whose status changed."""
+        if self.address_check is None:
+            status = np.zeros(len(self), dtype=np.int8)
+        else:
+            status = np.concatenate([self.status[:start], self.address_check.status(self.hidden, start)])
+        # appended rows have no status yet
+        old = np.zeros(len(self), dtype=np.int8)
+        old[:len(self.status)] = self.status
+        self.status = status
+        return np.flatnonzero(old != status)
+
+    def sendable(self) -> np.ndarray:
+        """Indices of the shown rows with a valid address, only the first shown row of every address."""
+        shown = np.flatnonzero(~self.hidden)
+        return shown if self.address_check is None else self.address_check.first_valid(shown)
+
+    def grouped(self, indices: np.ndarray, columns: list) -> np.ndarray:
+        """`indices` reordered so rows with the same values in `columns` are next to each other, groups in
+        order of their first row and rows in their order within a group."""
+        if not columns or len(indices) < 2:
+            return indices
+        values = pd.DataFrame({c: self.column_data[c][indices].astype(str) for c in columns})
+        groups = values.groupby(list(values.columns), sort=False).ngroup().to_numpy()
+        return indices[np.argsort(groups, kind="stable")]
+
+    def set_hidden(self, indices, hidden: bool) -> np.ndarray:
+        """Returns the indices whose flag actually changed."""
+        indices = np.asarray(indices, dtype=int)
+        changed = indices[self.hidden[indices] != hidden]
+        self.hidden[changed] = hidden
+        return changed
+
+    def apply_mask(self, shown: np.ndarray) -> np.ndarray:
+        """Hide every row that is not `shown`, returns the indices whose flag actually changed."""
+        # a row changes where it is hidden now and should be shown, or the other way round
+        changed = np.flatnonzero(self.hidden == shown)
+        self.hidden[changed] = ~shown[changed]
+        return changed
+
+
+class DataRow:
+    """A view of one row in a RowStore, reading values and the hidden flag from the store."""
+
+    __slots__ = ("store", "row_index", "row_key")
+
+    def __init__(self, store: RowStore, row_index: int, row_key=None):
+        self.store = store
+        self.row_index = row_index
+        self.row_key = row_key
+
+    @property
+    def values(self) -> list:
+        return self.store.row_values(self.row_index)
+
+    @property
+    def hidden(self) -> bool:
+        return bool(self.store.hidden[self.row_index])
+
+    @property
+    def header(self) -> list:
+        return self.store.schema.header
+
+    @property
+    def column_keys(self) -> list:
+        return self.store.schema.column_keys
+
+    def get_by_header(self, header: str):
+        if header not in self.store.schema.header_index:
+            raise ValueError(f"Header {header} not found in {self.header}")
+        return self.store.column_data[self.store.schema.header_index[header]][self.row_index]
+
+    def get_by_index(self, index: int):
+        if index >= len(self):
+            raise ValueError(f"Index {index} out of bounds for {self.values}")
+        return self.store.column_data[index][self.row_index]
+
+    def get_by_key(self, key):
+        if key not in self.store.schema.key_index:
+            raise ValueError(f"Key {key} not found in {self.column_keys}")
+        return self.store.column_data[self.store.schema.key_index[key]][self.row_index]
+
+    def __getitem__(self, item):
+        if isinstance(item, int):
+            return self.get_by_index(item)
+        elif item in self.store.schema.key_index:
+            return self.get_by_key(item)
+        return self.get_by_header(item)
+
+    def __len__(self):
+        return len(self.store.schema)
+
+    def __eq__(self, other):
+        return isinstance(other, DataRow) and self.store is other.store and self.row_index == other.row_index
+
+    def __repr__(self):
+        return f"DataRow(row_index={self.row_index}, values={self.values}, hidden={self.hidden})"
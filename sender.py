@@ -0,0 +1,236 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+
+from journal import SENT, FAILED, SendJournal, journal_from_config
+from stats import record
+from throttle import AdaptiveThrottle, back_off_hint, throttle_from_config
+from transports import Transport, transport_from_config
+
+
+@dataclass
+class Email:
+    address: str
+    subject: str
+    message: str
+    key: str = None  # row identity for the send journal
+
+
+@dataclass
+class ChunkResult:
+    index: int
+    emails: list
+    attempt: int = 0
+    sent: int = 0
+    errors: list = field(default_factory=list)
+    failures: list = field(default_factory=list)  # (email, error) of every email that was not sent
+    cancelled: bool = False
+    latency: float = 0.0
+
+    @property
+    def failed(self) -> int:
+        return len(self.emails) - self.sent
+
+    def fail(self, email: Email, error):
+        self.errors.append(error)
+        self.failures.append((email, error))
+
+
+class Sender:
+    """Sends emails through a transport in chunks, one chunk per worker.
+
+    `progress` is called in the calling thread with (chunk result, emails done, emails total) after every chunk.
+    `cancel()` lets chunks that are already running finish and skips all others.
+
+    The `throttle` sizes the chunks, limits how many run at once and delays them for server back-off hints
+    and the rate cap. Without one, `batch_size` and `workers` stay fixed. Emails the server throttled are
+    queued again at once, other failures are sent again, re-batched among themselves, up to `retries` times
+    with exponential backoff. With a `journal`, every sent and failed email is recorded and emails the
+    journal knows as sent are skipped.
+    """
+
+    THROTTLED_REQUEUES = 5  # after that a throttled email counts as failed and waits for the next round
+
+    def __init__(self, transport: Transport, batch_size: int = 50, workers: int = 4, progress=None,
+                 journal: SendJournal = None, retries: int = 3, backoff: float = 2.0, max_backoff: float = 60.0,
+                 throttle: AdaptiveThrottle = None):
+        if batch_size < 1:
+            raise ValueError(f"Batch size must be at least 1, got {batch_size}")
+        if workers < 1:
+            raise ValueError(f"Workers must be at least 1, got {workers}")
+        self.transport = transport
+        self.throttle = throttle or AdaptiveThrottle(batch_size, workers, max_workers=workers, adaptive=False)
+        self.progress = progress
+        self.journal = journal
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.results = []
+        self.skipped = 0
+        self.done = 0
+        self.requeued = {}  # id(email) -> how often a throttled email was queued again in this round
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    @property
+    def errors(self) -> list:
+        return [e for r in self.results for e in r.errors]
+
+    def send_chunk(self, index: int, emails: list, attempt: int = 0) -> ChunkResult:
+        result = ChunkResult(index, emails, attempt)
+        if self.cancelled.is_set():
+            result.cancelled = True
+            return result
+        start = time.monotonic()
+        try:
+            statuses = self.transport.send(emails)
+        except Exception as e:
+            statuses = [e] * len(emails)
+        result.latency = time.monotonic() - start
+        record("send batch", result.latency, len(emails))
+        entries = []
+        for email, status in zip(emails, statuses):
+            if status is True:
+                result.sent += 1
+                entries.append((email.key, SENT, email.address, {}))
+            else:
+                result.fail(email, status)
+                entries.append((email.key, FAILED, email.address, {"error": str(status)}))
+        if self.journal is not None:
+            self.journal.record([e for e in entries if e[0] is not None])
+        return result
+
+    def send(self, emails: list) -> int:
+        self.begin()
+        pending = self.unsent(emails)
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt and not self.wait(attempt):
+                    break
+                pending = self.send_round(pending, attempt, len(emails))
+                if not pending:
+                    break
+        finally:
+            self.end()
+        return self.sent
+
+    def begin(self):
+        self.results = []
+        self.skipped = 0
+        self.done = 0
+        self.transport.open()
+
+    def end(self):
+        self.transport.close()
+        self.results.sort(key=lambda r: (r.attempt, r.index))
+
+    def unsent(self, emails: list) -> list:
+        """`emails` without those the journal has as sent, which count as skipped and done."""
+        pending = emails
+        if self.journal is not None:
+            pending = [e for e in emails if e.key is None or not self.journal.is_sent(e.key)]
+        self.skipped += len(emails) - len(pending)
+        self.done += len(emails) - len(pending)
+        return pending
+
+    @property
+    def sent(self) -> int:
+        return sum(r.sent for r in self.results)
+
+    def send_round(self, emails: list, attempt: int, total: int) -> list:
+        """Send `emails` in chunks as the throttle allows, returns the emails for the next round."""
+        queue = deque(emails)
+        running = set()
+        retry = []
+        self.requeued = {}
+        index = 0
+        with ThreadPoolExecutor(max_workers=self.throttle.max_workers) as executor:
+            while queue or running:
+                while queue and len(running) < self.throttle.workers:
+                    chunk = [queue.popleft() for _ in range(min(self.throttle.batch_size, len(queue)))]
+                    if not self.throttle.acquire(len(chunk), self.cancelled):
+                        queue.extendleft(reversed(chunk))
+                        break
+                    running.add(executor.submit(self.send_chunk, index, chunk, attempt))
+                    index += 1
+                if self.cancelled.is_set() and queue:
+                    self.collect(ChunkResult(index, list(queue), attempt, cancelled=True), total)
+                    index += 1
+                    queue.clear()
+                if not running:
+                    continue
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.chunk_done(future.result(), queue, retry, total)
+        return self.next_round(emails, retry, attempt)
+
+    def chunk_done(self, result: ChunkResult, queue: deque, retry: list, total: int):
+        """Tell the throttle how a chunk went, queue its throttled emails again and its failed ones in `retry`."""
+        hints = [back_off_hint(error) for _, error in result.failures]
+        throttled = [h for h in hints if h is not None]
+        if throttled:
+            self.throttle.throttled(max(throttled))
+        elif not result.cancelled:
+            self.throttle.success(result.latency)
+        again = []
+        for (email, _), hint in zip(result.failures, hints):
+            if hint is not None and self.requeued.get(id(email), 0) < self.THROTTLED_REQUEUES:
+                self.requeued[id(email)] = self.requeued.get(id(email), 0) + 1
+                again.append(email)
+            else:
+                retry.append(email)
+        # throttled emails did not really fail, they go first into the next chunk
+        queue.extendleft(reversed(again))
+        final = 0 if result.attempt < self.retries else len(result.failures) - len(again)
+        self.collect(result, total, len(result.emails) if result.cancelled else result.sent + final)
+
+    def next_round(self, emails: list, retry: list, attempt: int) -> list:
+        if attempt == self.retries:
+            return []
+        # only the emails that failed go into the next round, in their original order
+        order = {id(e): i for i, e in enumerate(emails)}
+        return sorted(retry, key=lambda e: order[id(e)])
+
+    def collect(self, result: ChunkResult, total: int, done: int = None):
+        self.results.append(result)
+        self.done += len(result.emails) if done is None else done
+        if self.progress is not None:
+            self.progress(result, self.done, total)
+
+    def retry_delay(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** (attempt - 1), self.max_backoff) * random.uniform(0.5, 1.0)
+
+    def wait(self, attempt: int) -> bool:
+        """Back off before a retry, returns False if the send was cancelled meanwhile."""
+        return not self.cancelled.wait(self.retry_delay(attempt))
+
+    @property
+    def failures(self) -> list:
+        """(email, error) of every email that was not sent in the end, cancelled emails are not included."""
+        final = {}
+        for result in self.results:
+            if result.cancelled:
+                continue
+            errors = {id(email): (email, error) for email, error in result.failures}
+            for email in result.emails:
+                final[id(email)] = errors.get(id(email))
+        return [failure for failure in final.values() if failure is not None]
+
+
+def sender_from_config(config, email: str, password: str, get_account, progress=None) -> Sender:
+    """A Sender over the transport, journal and throttle the [sending] section of a settings ConfigParser describes."""
+    journal = journal_from_config(config)
+    return Sender(
+        transport_from_config(config, email, password, get_account, journal),
+        progress=progress,
+        journal=journal,
+        retries=config.getint("sending", "retries", fallback=3),
+        backoff=config.getfloat("sending", "backoff", fallback=2.0),
+        throttle=throttle_from_config(config),
+    )
+
@@ -0,0 +1,99 @@
+import configparser
+import threading
+
+from lazy import LazyModule
+from throttle import back_off_hint
+
+exchangelib = LazyModule("exchangelib")
+exchange_errors = LazyModule("exchangelib.errors")
+protocols = LazyModule("exchangelib.protocol")
+
+
+class AccountManager:
+    """Creates one Exchange Account per set of credentials and keeps it, and its connection pool, alive.
+
+    The EWS endpoint found by autodiscover is written to `cache_file`, so later runs connect directly.
+    """
+
+    def __init__(self, cache_file: str = ".exchange_cache.ini", max_connections: int = 4):
+        self.cache_file = cache_file
+        self.max_connections = max_connections
+        self.accounts = {}
+        self.endpoints = configparser.ConfigParser(interpolation=None)
+        self.endpoints.read(cache_file)
+        self.lock = threading.Lock()
+
+    def get_account(self, email: str, password: str) -> "exchangelib.Account":
+        with self.lock:
+            account = self.accounts.get((email, password))
+            if account is None:
+                try:
+                    account = self.create_account(email, password)
+                except (exchange_errors.UnauthorizedError, exchange_errors.TransportError):
+                    self.forget_endpoint(email)
+                    raise
+                self.accounts[(email, password)] = account
+            return account
+
+    def create_account(self, email: str, password: str) -> "exchangelib.Account":
+        credentials = exchangelib.Credentials(username=email, password=password)
+        if not self.endpoints.has_section(email):
+            self.discover(email, credentials)
+        endpoint = self.endpoints[email]
+        build = exchangelib.Build(*map(int, endpoint["build"].split(".")))
+        config = exchangelib.Configuration(
+            service_endpoint=endpoint["service_endpoint"],
+            credentials=credentials,
+            auth_type=endpoint["auth_type"],
+            version=exchangelib.Version(build, endpoint["api_version"]),
+            max_connections=self.max_connections,
+        )
+        return exchangelib.Account(
+            primary_smtp_address=endpoint["primary_smtp_address"], config=config,
+            autodiscover=False, access_type=exchangelib.DELEGATE
+        )
+
+    def discover(self, email: str, credentials: "exchangelib.Credentials"):
+        account = exchangelib.Account(
+            primary_smtp_address=email, credentials=credentials, autodiscover=True, access_type=exchangelib.DELEGATE
+        )
+        protocol = account.protocol
+        self.endpoints[email] = {
+            "primary_smtp_address": account.primary_smtp_address,
+            "service_endpoint": protocol.service_endpoint,
+            "auth_type": protocol.auth_type,
+            "build": str(protocol.version.build),
+            "api_version": protocol.version.api_version,
+        }
+        self.write()
+        # autodiscover caches its protocol with a single session, drop it so ours gets max_connections
+        del protocols.Protocol[protocol.config]
+
+    def invalidate(self, email: str, forget_endpoint: bool = False):
+        with self.lock:
+            for key in [k for k in self.accounts if k[0] == email]:
+                del self.accounts[key]
+        if forget_endpoint:
+            self.forget_endpoint(email)
+
+    def forget_endpoint(self, email: str):
+        if self.endpoints.remove_section(email):
+            self.write()
+
+    def check_errors(self, email: str, errors: list):
+        """Drop the cached account and endpoint if sending failed because of authentication or the connection."""
+        if any(self.is_account_error(e) for e in errors):
+            self.invalidate(email, forget_endpoint=True)
+
+    @staticmethod
+    def is_account_error(error) -> bool:
+        if isinstance(error, (exchange_errors.UnauthorizedError, exchange_errors.ErrorAccessDenied)):
+            return True
+        # errors in a response (invalid recipient, missing draft, busy server) come from an endpoint that works,
+        # throttling errors are TransportErrors as well, but say nothing about the endpoint
+        return (isinstance(error, exchange_errors.TransportError)
+                and not isinstance(error, exchange_errors.ResponseMessageError) and back_off_hint(error) is None)
+
+    def write(self):
+        with open(self.cache_file, "w") as f:
+            self.endpoints.write(f)
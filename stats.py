@@ -0,0 +1,242 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+def memory_usage() -> tuple[int | None, int | None]:
+    """Resident memory of this process in bytes, now and its peak so far, None where the OS does not tell."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None, None
+        return counters.WorkingSetSize, counters.PeakWorkingSetSize
+    try:
+        with open("/proc/self/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # bytes on macOS, kilobytes elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None, peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageStats:
+    """Calls, items and time spent in one stage, e.g. reading the table or sending batches."""
+
+    __slots__ = ("calls", "items", "seconds", "max_seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float, items: int = 1, calls: int = 1, max_seconds: float = None):
+        self.calls += calls
+        self.items += items
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds if max_seconds is None else max_seconds)
+
+    @property
+    def rate(self) -> float:
+        """Items per second spent in the stage."""
+        return self.items / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {"calls": self.calls, "items": self.items, "seconds": round(self.seconds, 6),
+                "mean_ms": round(self.seconds / self.calls * 1000, 3) if self.calls else 0.0,
+                "max_ms": round(self.max_seconds * 1000, 3), "items_per_s": round(self.rate, 1)}
+
+
+class Stats:
+    """Timings per stage, counts and peak memory of a job, or of the whole session.
+
+    Stages are timed wherever the work happens, in any thread, and recorded into every active Stats (see
+    `activate`). Stages can nest, rendering includes the markdown conversions it needs, so their times do
+    not add up to the elapsed time. Memory is sampled at most every `sample_interval` seconds while
+    stages are recorded.
+    """
+
+    COLUMNS = ("Stage", "Calls", "Items", "Seconds", "Mean ms", "Max ms", "Items/s")
+
+    def __init__(self, name: str = "session", sample_interval: float = 0.1):
+        self.name = name
+        self.sample_interval = sample_interval
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counts = {}
+        self.info = {}
+        self.report_path = None
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.end = None
+        self.start_memory = memory_usage()[0]
+        self.peak_memory = self.start_memory
+        self.worker_peak_memory = None
+        self.last_sample = self.start
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def add(self, stage: str, seconds: float, items: int = 1):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = StageStats()
+            self.stages[stage].add(seconds, items)
+        now = time.perf_counter()
+        if now - self.last_sample >= self.sample_interval:
+            self.last_sample = now
+            self.sample_memory()
+
+    def __str__(self):
+        state = "running" if self.end is None else "done"
+        memory = "" if self.peak_memory is None else f", {self.peak_memory / 2 ** 20:.0f} MB peak memory"
+        counts = ", ".join(f"{name} {value}" for name, value in self.counts.items())
+        return f"{self.name} {state} in {self.elapsed:.1f}s{memory}" + (f" · {counts}" if counts else "")
+
+    def rows(self) -> list:
+        """One row per stage for a table with COLUMNS, the slowest stage first."""
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1].seconds)
+            return [(stage, s.calls, s.items, f"{s.seconds:.2f}", f"{s.seconds / s.calls * 1000:.1f}",
+                     f"{s.max_seconds * 1000:.1f}", f"{s.rate:.0f}") for stage, s in stages]
+
+    def count(self, name: str, value: int = 1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def set_counts(self, **counts):
+        with self.lock:
+            self.counts.update(counts)
+
+    def sample_memory(self):
+        current = memory_usage()[0]
+        if current is not None:
+            self.peak_memory = max(self.peak_memory or 0, current)
+
+    def merge(self, recorded: dict):
+        """Add the stages another process recorded, see `run_recorded`."""
+        with self.lock:
+            for stage, (calls, items, seconds, max_seconds) in recorded["stages"].items():
+                if stage not in self.stages:
+                    self.stages[stage] = StageStats()
+                self.stages[stage].add(seconds, items, calls, max_seconds)
+            if recorded["peak_memory"] is not None:
+                self.worker_peak_memory = max(self.worker_peak_memory or 0, recorded["peak_memory"])
+
+    def finish(self, **counts) -> "Stats":
+        self.set_counts(**counts)
+        self.sample_memory()
+        self.end = time.perf_counter()
+        return self
+
+    def report(self, settings: dict = None) -> dict:
+        """The stats as a JSON compatible dict, `settings` are included to tell runs apart."""
+        with self.lock:
+            stages = {stage: stats.to_dict() for stage, stats in self.stages.items()}
+            counts = dict(self.counts)
+        current, process_peak = memory_usage()
+        megabytes = (lambda value: None if value is None else round(value / 2 ** 20, 1))
+        return {
+            "job": self.name,
+            "started": self.started.isoformat(timespec="seconds"),
+            "elapsed": round(self.elapsed, 3),
+            "info": self.info,
+            "counts": counts,
+            "stages": stages,
+            "memory_mb": {"start": megabytes(self.start_memory), "peak": megabytes(self.peak_memory),
+                          "now": megabytes(current), "process_peak": megabytes(process_peak),
+                          "worker_peak": megabytes(self.worker_peak_memory)},
+            "settings": settings or {},
+        }
+
+    def write(self, directory: str, settings: dict = None) -> str:
+        """Write the report to a new JSON file in `directory`, returns its path."""
+        os.makedirs(directory, exist_ok=True)
+        filename = os.path.join(directory, self.started.strftime("%Y%m%d-%H%M%S_") + self.name + ".json")
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.report(settings), f, indent=2, default=str)
+        self.report_path = filename
+        return filename
+
+
+# the stats stages are recorded into, the session's and those of the jobs running, replaced on every change
+# so recording threads can iterate over it without a lock
+_active = ()
+_active_lock = threading.Lock()
+
+
+def activate(stats: Stats) -> Stats:
+    global _active
+    with _active_lock:
+        _active = _active + (stats,)
+    return stats
+
+
+def deactivate(stats: Stats):
+    global _active
+    with _active_lock:
+        _active = tuple(s for s in _active if s is not stats)
+
+
+def record(stage: str, seconds: float, items: int = 1):
+    for stats in _active:
+        stats.add(stage, seconds, items)
+
+
+@contextmanager
+def timed(stage: str, items: int = 1):
+    """Time the block as one call of `stage` that handled `items` items."""
+    if not _active:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, items)
+
+
+def run_recorded(function, *args) -> tuple:
+    """Run `function` in a worker process with its own Stats, returns its result and the recorded stages.
+
+    A worker process does not share the parent's Stats, the parent merges what is returned.
+    """
+    stats = activate(Stats("worker"))
+    try:
+        result = function(*args)
+    finally:
+        deactivate(stats)
+    stages = {stage: (s.calls, s.items, s.seconds, s.max_seconds) for stage, s in stats.stages.items()}
+    return result, {"stages": stages, "peak_memory": memory_usage()[1]}
+
+
+def merge(recorded: dict):
+    for stats in _active:
+        stats.merge(recorded)
+
+
+def settings_report(config, sections=("sending", "export", "loading", "cache")) -> dict:
+    """The settings that change how fast a job runs, never the credentials."""
+    return {section: dict(config[section]) for section in sections if config.has_section(section)}
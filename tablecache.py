@@ -0,0 +1,135 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from typing import Iterator
+
+from ingest import read_batches, pd
+from stats import record, timed
+
+
+def has_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TableCache:
+    """Parsed tables on disk, keyed by the source's path, mtime and size and the columns read.
+
+    Tables are stored as Feather files (memory mapped when read back) if pyarrow is installed, as pickles
+    otherwise. Every hit touches the file, the least recently used files are deleted once the cache holds
+    more than `max_entries` files or `max_bytes` bytes.
+    """
+
+    SUFFIXES = (".feather", ".pkl")
+
+    def __init__(self, directory: str = ".table_cache", max_bytes: int = 512 * 2 ** 20, max_entries: int = 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def key(self, path, columns: list = None) -> str:
+        stat = os.stat(path)
+        source = f"{os.path.realpath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{columns!r}"
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def lookup(self, path, columns: list = None) -> str | None:
+        key = self.key(path, columns)
+        for suffix in self.SUFFIXES:
+            filename = os.path.join(self.directory, key + suffix)
+            if os.path.exists(filename):
+                os.utime(filename)
+                return filename
+        return None
+
+    def load(self, filename: str) -> "pd.DataFrame":
+        if filename.endswith(".feather"):
+            import pyarrow.feather
+            return pyarrow.feather.read_table(filename, memory_map=True).to_pandas()
+        return pd.read_pickle(filename)
+
+    def store(self, path, columns: list, df: "pd.DataFrame") -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(path, columns)
+        # written to a temporary file first, a half written table is never picked up
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            suffix = self.write(df, temporary)
+            filename = os.path.join(self.directory, key + suffix)
+            os.replace(temporary, filename)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.evict()
+        return filename
+
+    def write(self, df: "pd.DataFrame", filename: str) -> str:
+        if has_pyarrow() and all(isinstance(c, str) for c in df.columns):
+            import pyarrow
+            import pyarrow.feather
+            try:
+                pyarrow.feather.write_feather(df.reset_index(drop=True), filename, compression="uncompressed")
+                return ".feather"
+            except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+                # columns mixing numbers and text have no arrow type
+                pass
+        df.to_pickle(filename, protocol=pickle.HIGHEST_PROTOCOL)
+        return ".pkl"
+
+    def entries(self) -> list:
+        """(last used, size, filename) of every cached table, least recently used first."""
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(self.SUFFIXES):
+                filename = os.path.join(self.directory, name)
+                stat = os.stat(filename)
+                entries.append((stat.st_mtime, stat.st_size, filename))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, filename = entries.pop(0)
+            os.remove(filename)
+            total -= size
+
+    def clear(self):
+        for _, _, filename in self.entries():
+            os.remove(filename)
+
+    def read_batches(self, path, columns: list = None, **kwargs) -> Iterator["pd.DataFrame"]:
+        """Like ingest.read_batches, served from the cache when the source has not changed."""
+        if filename := self.lookup(path, columns):
+            start = time.perf_counter()
+            try:
+                df = self.load(filename)
+            except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+                os.remove(filename)
+            else:
+                record("read cache", time.perf_counter() - start, len(df))
+                yield df
+                return
+        batches = []
+        for batch in read_batches(path, columns, **kwargs):
+            batches.append(batch)
+            yield batch
+        df = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+        with timed("write cache", len(df)):
+            self.store(path, columns, df)
+
+
+def table_cache_from_config(config) -> TableCache:
+    """The cache described by the [cache] section of a settings ConfigParser."""
+    return TableCache(
+        directory=config.get("cache", "directory", fallback=".table_cache"),
+        max_bytes=config.getint("cache", "max_mb", fallback=512) * 2 ** 20,
+        max_entries=config.getint("cache", "max_entries", fallback=20),
+    )
@@ -1,46 +1,18 @@
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 
-from pandas import DataFrame
+import numpy as np
 from rich.text import Text
 from textual.widgets.data_table import ColumnKey, RowKey
-from textual.coordinate import Coordinate
 
 from textual.widgets import DataTable
 
+from filters import build_mask
+from mailing import AddressCheck, STATUS_LABELS, INVALID, DUPLICATE
+from rowstore import DataRow, RowStore, TableSchema, pd
+from stats import timed
 
-@dataclass
-class DataRow:
-    values: list
-    header: list = field(default_factory=list)
-    column_keys: list[ColumnKey] = field(default_factory=list)
-    row_key: RowKey = None
-    row_index: int = None
-    hidden: bool = False
-
-    def get_by_header(self, header: str):
-        if header not in self.header:
-            raise ValueError(f"Header {header} not found in {self.header}")
-        return self.values[self.header.index(header)]
-
-    def get_by_index(self, index: int):
-        if index >= len(self.values):
-            raise ValueError(f"Index {index} out of bounds for {self.values}")
-        return self.values[index]
-
-    def get_by_key(self, key: ColumnKey):
-        if key not in self.column_keys:
-            raise ValueError(f"Key {key} not found in {self.column_keys}")
-        return self.values[self.column_keys.index(key)]
-
-    def __getitem__(self, item):
-        if isinstance(item, int):
-            return self.get_by_index(item)
-        elif isinstance(item, ColumnKey):
-            return self.get_by_key(item)
-        return self.get_by_header(item)
-
-    def __len__(self):
-        return len(self.values)
+HIDDEN_STYLE = "red strike"
+STATUS_STYLES = {INVALID: "bold red", DUPLICATE: "yellow"}
 
 
 @dataclass()
@@ -52,20 +24,34 @@ class DataColumn:
 
 
 class TableWrapper(DataTable):
-    def __init__(self, *args, **kwargs):
+    """DataTable backed by a DataFrame.
+
+    A RowStore (the DataFrame's columns and a boolean array of hidden flags) is the single source of truth.
+    Rows are only materialized as DataTable rows `page_size` at a time, when the user scrolls or moves the
+    cursor close to the last materialized row. A `page_size` of 0 materializes everything up front.
+    DataRow objects are views into the store, change them through the table's methods.
+    The first column shows the status of every row's address once an email column is set.
+    """
+
+    def __init__(self, *args, page_size: int = 500, **kwargs):
         super().__init__(*args, **kwargs)
+        self.page_size = page_size
+        self.materializing = False
         self.width = None
-        self.row_list = []
         self.column_list = []
+        self.status_key = None
+        self.schema = TableSchema([])
+        self.clear_rows()
+
+    def clear_rows(self):
+        self.store = RowStore(schema=self.schema)
+        self.row_keys = []  # RowKey of every materialized row, by row index
+        self.row_lookup = {}  # RowKey -> row index
 
     @property
     def column_keys(self):
         return [c.column_key for c in self.column_list]
 
-    @property
-    def row_keys(self):
-        return [p.row_key for p in self.row_list]
-
     @property
     def header(self):
         return [c.header for c in self.column_list]
@@ -74,28 +60,73 @@ class TableWrapper(DataTable):
     def header(self, headers: list, clear: bool = False):
         if self.width is not None:
             raise ValueError(f"Header already set to {self.header}")
+        # the labels are written to the cells directly, which does not widen the column
+        self.status_key = self.add_column("Status", width=max(map(len, STATUS_LABELS)), key="bulkmail-status")
         keys = self.add_columns(*headers)
         self.column_list = [
             DataColumn(k, h, i) for k, h, i in zip(keys, headers, range(len(headers)))
         ]
+        # shared with the store and every DataRow, so lookups by header or key are O(1)
+        self.schema = TableSchema(headers, keys)
         self.width = len(self.header)
 
-    def add_data_rows(self, row: DataRow):
-        if len(row) != self.width:
-            raise ValueError(
-                f"Person {row} has {len(row)} values, but table has {self.width} columns"
-            )
-        row.row_index = len(self.row_list)
-        self.row_list.append(row)
-        row.column_keys = self.column_keys
-        row.header = self.header
-        row.row_key = self.add_row(*row.values)
-        self.row_keys.append(row.row_key)
+    @property
+    def header_index(self) -> dict:
+        return self.schema.header_index
+
+    @property
+    def key_index(self) -> dict:
+        return self.schema.key_index
+
+    @property
+    def df(self) -> "pd.DataFrame":
+        return self.store.df
+
+    @property
+    def materialized(self) -> int:
+        return len(self.row_keys)
+
+    def cell(self, index: int, column: DataColumn):
+        value = self.store.column_data[column.column_index][index]
+        style = HIDDEN_STYLE if self.store.hidden[index] else column.style
+        return value if style is None else Text(str(value), style=style)
+
+    def status_cell(self, index: int):
+        status = self.store.status[index]
+        style = STATUS_STYLES.get(status)
+        return STATUS_LABELS[status] if style is None else Text(STATUS_LABELS[status], style=style)
+
+    def materialize(self, until: int):
+        """Add DataTable rows up to (not including) row index `until`."""
+        self.materializing = True
+        try:
+            for index in range(self.materialized, min(until, len(self))):
+                row_key = self.add_row(self.status_cell(index),
+                                       *(self.cell(index, column) for column in self.column_list))
+                self.row_keys.append(row_key)
+                self.row_lookup[row_key] = index
+        finally:
+            self.materializing = False
+
+    def materialize_next_page(self):
+        # add_row moves the cursor, which would call back in here while the rows are being added
+        if self.materialized < len(self) and not self.materializing:
+            self.materialize(self.materialized + (self.page_size or len(self)))
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        if new_value + 2 * self.size.height >= self.virtual_size.height:
+            self.materialize_next_page()
+
+    def watch_cursor_coordinate(self, old_coordinate, new_coordinate) -> None:
+        super().watch_cursor_coordinate(old_coordinate, new_coordinate)
+        if new_coordinate.row + self.size.height >= self.materialized:
+            self.materialize_next_page()
 
     def get_by_index(self, index: int) -> DataRow:
-        if index >= len(self.row_list):
-            raise ValueError(f"Index {index} out of bounds for {self.row_list}")
-        return self.row_list[index]
+        if index >= len(self):
+            raise ValueError(f"Index {index} out of bounds for {len(self)} rows")
+        return DataRow(self.store, index, self.row_keys[index] if index < self.materialized else None)
 
     def get_column_by_index(self, index: int) -> DataColumn:
         if index >= len(self.column_list):
@@ -103,17 +134,17 @@ class TableWrapper(DataTable):
         return self.column_list[index]
 
     def get_by_key(self, key: RowKey) -> DataRow:
-        if key not in self.row_keys:
-            raise ValueError(f"Key {key} not found in {self.row_keys}")
-        return self.row_list[self.row_keys.index(key)]
+        if key not in self.row_lookup:
+            raise ValueError(f"Key {key} not found in {len(self.row_lookup)} rows")
+        return self.get_by_index(self.row_lookup[key])
 
     def get_by_header(self, header: str) -> DataRow:
-        if header not in self.header:
+        if header not in self.header_index:
             raise ValueError(f"Header {header} not found in {self.header}")
-        return self.row_list[self.header.index(header)]
+        return self.get_by_index(self.header_index[header])
 
     def __len__(self):
-        return len(self.row_list)
+        return len(self.store)
 
     def __getitem__(self, item) -> DataRow:
         if isinstance(item, int):
@@ -122,94 +153,126 @@ class TableWrapper(DataTable):
             return self.get_by_key(item)
         return self.get_by_header(item)
 
+    def visible_rows(self):
+        for index in np.flatnonzero(~self.store.hidden):
+            yield self.get_by_index(int(index))
+
+    def restyle(self, indices, columns: list = None):
+        """Bring the materialized cells of the rows at `indices` in line with the hidden flags and column
+        styles, refreshing once.
+
+        Cells that already have the wanted style are skipped. The cells are written to the DataTable's
+        storage directly, update_cell would refresh the widget for every single cell.
+        """
+        # a column of a table that was cleared since has no cells here
+        columns = self.column_list if columns is None else [c for c in columns if c in self.column_list]
+        changed = False
+        for index in indices:
+            if index >= self.materialized:
+                continue
+            cells = self._data[self.row_keys[index]]
+            for column in columns:
+                style = HIDDEN_STYLE if self.store.hidden[index] else column.style
+                cell = cells[column.column_key]
+                if (cell.style if isinstance(cell, Text) else None) == style:
+                    continue
+                value = str(self.store.column_data[column.column_index][index])
+                cells[column.column_key] = value if style is None else Text(value, style=style)
+                changed = True
+        if changed:
+            # the render caches are keyed by the update count
+            self._update_count += 1
+            self.refresh()
+
+    def restatus(self, indices):
+        """Show the address status of the materialized rows at `indices`, refreshing once."""
+        indices = [index for index in indices if index < self.materialized]
+        for index in indices:
+            self._data[self.row_keys[index]][self.status_key] = self.status_cell(index)
+        if indices:
+            self._update_count += 1
+            self.refresh()
+
+    @property
+    def email_column(self) -> str | None:
+        column = self.store.email_column
+        return None if column is None else self.header[column]
+
+    def set_email_column(self, header: str | None, check: AddressCheck = None):
+        """Check the addresses in column `header`, `check` may cover the first rows already."""
+        if header is not None and header not in self.header_index:
+            raise ValueError(f"Column {header} not found in {self.header}")
+        column = None if header is None else self.header_index[header]
+        self.restatus(self.store.check_emails(column, check))
+
+    def status_counts(self) -> dict:
+        """Number of shown rows by address status."""
+        counts = np.bincount(self.store.status[~self.store.hidden], minlength=len(STATUS_LABELS))
+        return dict(zip(STATUS_LABELS, counts.tolist()))
+
     def style_row(self, row_index, style=None):
-        row = self.get_row_at(row_index)
-        for i, cell in enumerate(row):
-            if style is None:
-                column = self.get_column_by_index(i)
-                if column.style is None:
-                    self.update_cell_at(Coordinate(row_index, i), str(cell))
-                else:
-                    self.update_cell_at(
-                        Coordinate(row_index, i), Text(str(cell), style=column.style)
-                    )
-            else:
-                self.update_cell_at(
-                    Coordinate(row_index, i), Text(str(cell), style="red strike")
-                )
+        self.set_hidden_indices([row_index], style is not None)
 
     def style_column(self, column: DataColumn, style=None):
         column.style = style
-        for row in self.row_list:
-            if row.hidden is False:
-                if style is None:
-                    self.update_cell_at(
-                        Coordinate(row.row_index, column.column_index),
-                        str(row.get_by_index(column.column_index)),
-                    )
-                else:
-                    self.update_cell_at(
-                        Coordinate(row.row_index, column.column_index),
-                        Text(str(row.get_by_index(column.column_index)), style=style),
-                    )
+        self.restyle(range(self.materialized), [column])
 
     def toggle_hide_row(self, row: DataRow):
-        row.hidden = not row.hidden
-        if row.hidden:
-            self.hide_row(row)
-        else:
-            self.show_row(row)
+        self.set_hidden([row], not row.hidden)
 
     def hide_row(self, row: DataRow):
-        row.hidden = True
-        self.style_row(row.row_index, style="red strike")
+        self.set_hidden([row], True)
 
     def show_row(self, row: DataRow):
-        row.hidden = False
-        self.style_row(row.row_index, style=None)
+        self.set_hidden([row], False)
 
     def show_hide_row(self, row: DataRow, show: bool):
-        if show:
-            self.show_row(row)
-        else:
-            self.hide_row(row)
+        self.set_hidden([row], not show)
+
+    def set_hidden(self, rows: list, hidden: bool):
+        self.set_hidden_indices([row.row_index for row in rows], hidden)
+
+    def set_hidden_indices(self, indices, hidden: bool):
+        self.restyle(self.store.set_hidden(indices, hidden))
+        self.restatus(self.store.update_status())
+
+    def set_all_hidden(self, hidden: bool):
+        self.set_hidden_indices(np.arange(len(self)), hidden)
 
     def filter(self, column: str, text: str):
-        if column not in self.header:
+        if column not in self.header_index:
             raise ValueError(f"Column {column} not found in {self.header}")
-        column_key = self.column_keys[self.header.index(column)]
-        if text.startswith("<") or text.startswith(">"):
-            if text[1:].isnumeric():
-                n = float(text[1:])
-                for row in self.row_list:
-                    if text[0] == "<":
-                        self.show_hide_row(row, float(row.get_by_key(column_key)) < n)
-                    elif text[0] == ">":
-                        self.show_hide_row(row, float(row.get_by_key(column_key)) > n)
-        else:
-            for row in self.row_list:
-                if text != str(row.get_by_key(column_key)):
-                    self.hide_row(row)
-                else:
-                    self.show_row(row)
+        self.restyle(self.store.apply_mask(build_mask(self.df, text, column)))
+        self.restatus(self.store.update_status())
 
     def clear(self, columns: bool = False):
         super().clear(columns=columns)
         if columns:
             self.column_list = []
+            self.status_key = None
+            self.schema = TableSchema([])
             self.width = None
-        self.row_list = []
+        self.clear_rows()
         return self
 
     def load_array(self, array: list):
-        self.header = array[0]
-        for row in array[1:]:
-            self.add_data_rows(DataRow(row))
-
-    def load_dataframe(self, df: DataFrame):
-        self.header = df.columns
-        for row in df.values:
-            self.add_data_rows(DataRow(row))
+        self.load_dataframe(pd.DataFrame(array[1:], columns=array[0]))
+
+    def load_dataframe(self, df: "pd.DataFrame"):
+        with timed("load table", len(df)):
+            self.header = df.columns
+            self.store = RowStore(df, self.schema)
+            self.materialize(self.page_size or len(self))
+
+    def append_dataframe(self, df: "pd.DataFrame"):
+        """Add rows while a table is loading, setting the header with the first batch."""
+        with timed("load table", len(df)):
+            if self.width is None:
+                self.header = df.columns
+                self.store = RowStore(schema=self.schema)
+            self.restatus(self.store.append(df))
+            if self.materialized < self.page_size or not self.page_size:
+                self.materialize(self.page_size or len(self))
 
     def count_non_hidden(self):
-        return len([r for r in self.row_list if not r.hidden])
+        return self.store.count_non_hidden()
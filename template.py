@@ -0,0 +1,47 @@
+import re
+
+FIELD_PATTERN = re.compile(r"\[\[([^\[\]]+)]]")
+
+
+class CompiledTemplate:
+    """A template split once into literal text and [[field]] slots.
+
+    Only fields that exist in the header become slots, any other [[...]] stays literal text,
+    so rendering a row is a single join over the referenced columns.
+    """
+
+    def __init__(self, source: str, header: list):
+        self.source = source
+        self.header = [str(h) for h in header]
+        header_index = {h: i for i, h in enumerate(self.header)}
+        self.segments = []  # literal strings, with an empty placeholder for every slot
+        self.slots = []  # (position in segments, column index)
+        self.fields = []  # column indices referenced by the template
+        literal = ""
+        position = 0
+        for match in FIELD_PATTERN.finditer(source):
+            literal += source[position:match.start()]
+            position = match.end()
+            index = header_index.get(match.group(1))
+            if index is None:
+                literal += match.group(0)
+                continue
+            if literal:
+                self.segments.append(literal)
+                literal = ""
+            self.slots.append((len(self.segments), index))
+            self.segments.append("")
+            if index not in self.fields:
+                self.fields.append(index)
+        literal += source[position:]
+        if literal:
+            self.segments.append(literal)
+
+    def render(self, values) -> str:
+        parts = self.segments.copy()
+        for position, index in self.slots:
+            parts[position] = str(values[index])
+        return "".join(parts)
+
+    def __repr__(self):
+        return f"CompiledTemplate({len(self.slots)} slots, fields={[self.header[i] for i in self.fields]})"
@@ -0,0 +1,62 @@
+"""Filter expressions, on a table with empty cells like pandas reads them from CSV."""
+import io
+
+import pandas as pd
+import pytest
+
+from filters import build_mask
+
+CSV = """Name,Grade,Note
+Anna,1,well done
+Ben,4,
+Clara,2.5,banana
+David,,see me
+"""
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    return pd.read_csv(io.StringIO(CSV))
+
+
+def shown(df: pd.DataFrame, expression: str, column: str = "Name") -> list:
+    return df["Name"][build_mask(df, expression, column)].tolist()
+
+
+def test_exact_match_and_not_equal(df):
+    assert shown(df, "Ben") == ["Ben"]
+    assert shown(df, "==Ben") == ["Ben"]
+    assert shown(df, "!=Ben") == ["Anna", "Clara", "David"]
+
+
+def test_empty_cells_are_empty_strings(df):
+    assert shown(df, "Note:") == ["Ben"]
+    assert shown(df, "Note:~an") == ["Clara"]
+    assert shown(df, "Note:/n/") == ["Anna", "Clara"]
+    assert shown(df, "Note:!=") == ["Anna", "Clara", "David"]
+
+
+def test_numbers_and_ranges(df):
+    assert shown(df, "Grade:<3") == ["Anna", "Clara"]
+    assert shown(df, "Grade:>=2,5") == ["Ben", "Clara"]
+    assert shown(df, "Grade:1..2") == ["Anna"]
+
+
+def test_and_binds_tighter_than_or(df):
+    assert shown(df, "Grade:<3 & Note:~well | Name:David") == ["Anna", "David"]
+
+
+def test_empty_expression_shows_every_row(df):
+    assert shown(df, " ") == ["Anna", "Ben", "Clara", "David"]
+
+
+@pytest.mark.parametrize("expression, column, error", [
+    ("3 &", "Name", "Empty filter term"),
+    ("| Anna", "Name", "Empty filter term"),
+    ("<x", "Name", "Invalid number comparison"),
+    ("/(/", "Name", "Invalid regular expression"),
+    ("Anna", "Missing", "Column Missing not found"),
+])
+def test_invalid_expressions(df, expression, column, error):
+    with pytest.raises(ValueError, match=error):
+        build_mask(df, expression, column)
@@ -0,0 +1,115 @@
+"""Retries, the send journal and resuming, and drafts shared by Bcc recipients."""
+import os
+
+from fake_exchange import FakeAccount
+from journal import DRAFT, FAILED, SENT, SendJournal
+from sender import Email, Sender
+from transports import EwsTransport, FileTransport
+
+
+def emails(count: int, bodies: int = None) -> list:
+    return [Email(address=f"user{i}@example.org", subject="Report", message=f"body {i % (bodies or count)}",
+                  key=f"key{i}") for i in range(count)]
+
+
+def account(**kwargs) -> FakeAccount:
+    return FakeAccount(round_trip=0, per_item=0, **kwargs)
+
+
+def sender(transport, journal: SendJournal = None, **kwargs) -> Sender:
+    return Sender(transport, batch_size=kwargs.pop("batch_size", 50), workers=1, journal=journal, backoff=0,
+                  **kwargs)
+
+
+def test_rows_the_journal_has_as_sent_are_skipped(tmp_path):
+    journal = SendJournal(str(tmp_path / "journal.jsonl"))
+    mails = emails(3)
+    journal.record([(mails[1].key, SENT, mails[1].address, {})])
+    outbox = tmp_path / "outbox"
+    send = sender(FileTransport(str(outbox)), journal)
+    assert send.send(mails) == 2
+    assert send.skipped == 1
+    assert len(os.listdir(outbox)) == 2
+    assert all(journal.is_sent(e.key) for e in mails)
+
+
+def test_a_second_run_sends_nothing_again(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    outbox = tmp_path / "outbox"
+    mails = emails(4)
+    sender(FileTransport(str(outbox)), SendJournal(path)).send(mails)
+    again = sender(FileTransport(str(outbox)), SendJournal(path))
+    assert again.send(mails) == 0
+    assert again.skipped == 4
+    assert len(os.listdir(outbox)) == 4
+
+
+def test_failures_are_recorded_with_their_error(tmp_path):
+    journal = SendJournal(str(tmp_path / "journal.jsonl"))
+    mails = emails(4)
+    send = sender(EwsTransport(account(fail_every=2), journal), journal, retries=0)
+    assert send.send(mails) == 2
+    failed = [e for e, _ in send.failures]
+    assert failed == [mails[1], mails[3]]
+    for email in failed:
+        assert journal.state(email.key) == FAILED
+        assert "Fake failure" in journal.states[email.key]["error"]
+    assert journal.is_sent(mails[0].key) and journal.is_sent(mails[2].key)
+
+
+def test_failed_emails_are_retried(tmp_path):
+    journal = SendJournal(str(tmp_path / "journal.jsonl"))
+    fake = account(fail_every=3)
+    send = sender(EwsTransport(fake, journal), journal, retries=1)
+    assert send.send(emails(6)) == 6
+    assert not send.failures
+    assert len(fake.sent_items) == 6
+
+
+def test_a_journalled_draft_is_sent_instead_of_created_again(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    fake = account()
+    mail = emails(1)[0]
+    draft, = fake.bulk_create(folder=fake.drafts, items=[EwsTransport.build_message([mail])])
+    SendJournal(path).record([(mail.key, DRAFT, mail.address, {"id": draft.id, "changekey": draft.changekey})])
+    journal = SendJournal(path)
+    fake.calls = 0
+    assert sender(EwsTransport(fake, journal), journal).send([mail]) == 1
+    # only bulk_send, no new draft
+    assert fake.calls == 1
+    assert not fake.draft_items and len(fake.sent_items) == 1
+    assert journal.is_sent(mail.key)
+
+
+def test_emails_with_the_same_body_share_one_draft_in_bcc(tmp_path):
+    journal = SendJournal(str(tmp_path / "journal.jsonl"))
+    fake = account()
+    mails = emails(6, bodies=2)
+    assert sender(EwsTransport(fake, journal, bcc=10), journal).send(mails) == 6
+    assert len(fake.sent_items) == 2
+    for message, group in zip(fake.sent_items, (mails[0::2], mails[1::2])):
+        assert message.to_recipients is None
+        assert message.bcc_recipients == [e.address for e in group]
+    assert all(journal.is_sent(e.key) for e in mails)
+
+
+def test_bcc_messages_have_at_most_bcc_recipients(tmp_path):
+    fake = account()
+    assert sender(EwsTransport(fake, bcc=2)).send(emails(5, bodies=1)) == 5
+    assert [len(m.bcc_recipients or m.to_recipients) for m in fake.sent_items] == [2, 2, 1]
+
+
+def test_a_shared_draft_is_sent_once_for_all_its_recipients(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    fake = account()
+    mails = emails(3, bodies=1)
+    draft, = fake.bulk_create(folder=fake.drafts, items=[EwsTransport.build_message(mails)])
+    SendJournal(path).record([(e.key, DRAFT, e.address, {"id": draft.id, "changekey": draft.changekey})
+                              for e in mails])
+    journal = SendJournal(path)
+    fake.calls = 0
+    # one email per batch, the first sends the draft, the others find it sent
+    send = sender(EwsTransport(fake, journal, bcc=10), journal, batch_size=1)
+    assert send.send(mails) == 3
+    assert fake.calls == 1 and len(fake.sent_items) == 1
+    assert all(journal.is_sent(e.key) for e in mails)
@@ -0,0 +1,114 @@
+import math
+import smtplib
+import threading
+import time
+
+from lazy import LazyModule
+
+errors = LazyModule("exchangelib.errors")
+
+
+def back_off_hint(error) -> float | None:
+    """Seconds the server asked us to wait, 0 for a throttling error without a hint, None for other errors."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 421 closes the connection, 451 is a temporary refusal, both are how SMTP servers throttle
+        return 0 if error.smtp_code in (421, 451) else None
+    if isinstance(error, errors.ErrorServerBusy):
+        return error.back_off or 0
+    if isinstance(error, errors.RateLimitError):
+        return error.wait or 0
+    return None
+
+
+class AdaptiveThrottle:
+    """Decides how many emails go into a batch, how many batches run at once and when the next one may start.
+
+    Batch size and concurrency grow while batches come back faster than `target_latency` seconds and batches
+    shrink slightly when they are slower. When the server throttles, concurrency is halved, or the batch
+    size once a single worker is left (additive increase, multiplicative decrease). A throttling response
+    also pauses all new batches for the server's back-off hint, or `default_back_off` seconds without one.
+    `max_per_minute` caps the rate of emails started, 0 is no cap. With `adaptive` off, batch size and
+    concurrency stay fixed and only back-off and cap apply.
+    """
+
+    def __init__(self, batch_size: int = 50, workers: int = 4, max_batch: int = None, max_workers: int = None,
+                 min_batch: int = 5, target_latency: float = 10.0, max_per_minute: float = 0,
+                 default_back_off: float = 5.0, adaptive: bool = True):
+        self.batch = float(batch_size)
+        self.concurrency = float(workers)
+        self.min_batch = min(min_batch, batch_size)
+        self.max_batch = max_batch or max(batch_size, 100)
+        self.max_workers = max_workers or 2 * workers
+        self.target_latency = target_latency
+        self.max_per_minute = max_per_minute
+        self.default_back_off = default_back_off
+        self.adaptive = adaptive
+        self.next_start = 0.0  # rate cap: the earliest time the next batch may start
+        self.back_off_until = 0.0
+        self.throttled_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def batch_size(self) -> int:
+        return int(self.batch)
+
+    @property
+    def workers(self) -> int:
+        return int(self.concurrency)
+
+    def acquire(self, count: int, cancelled: threading.Event = None) -> bool:
+        """Wait until a batch of `count` emails may start, returns False if `cancelled` was set meanwhile."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            if self.max_per_minute:
+                self.next_start = start + count * 60 / self.max_per_minute
+        while True:
+            # a throttling response that arrives while we wait moves the start further out
+            delay = max(start, self.back_off_until) - time.monotonic()
+            if delay <= 0:
+                return cancelled is None or not cancelled.is_set()
+            if cancelled is not None and cancelled.wait(delay):
+                return False
+            if cancelled is None:
+                time.sleep(delay)
+
+    def success(self, latency: float):
+        if not self.adaptive:
+            return
+        with self.lock:
+            if latency <= self.target_latency:
+                # one more worker and a quarter more emails per batch for every round of fast batches
+                self.batch = min(self.max_batch, self.batch + math.ceil(self.batch / 4) / self.concurrency)
+                self.concurrency = min(self.max_workers, self.concurrency + 1 / self.concurrency)
+            else:
+                self.batch = max(self.min_batch, self.batch * 0.8)
+
+    def throttled(self, back_off: float = None):
+        with self.lock:
+            self.throttled_count += 1
+            pause = back_off if back_off else self.default_back_off
+            self.back_off_until = max(self.back_off_until, time.monotonic() + pause)
+            if self.adaptive:
+                # fewer requests at once first, smaller batches only once a single worker is throttled
+                if self.concurrency > 1:
+                    self.concurrency = max(1.0, self.concurrency / 2)
+                else:
+                    self.batch = max(self.min_batch, self.batch / 2)
+
+    def __str__(self):
+        return f"{self.batch_size} emails x {self.workers} workers"
+
+
+def throttle_from_config(config) -> AdaptiveThrottle:
+    """The throttle described by the [sending] section of a settings ConfigParser."""
+    workers = config.getint("sending", "workers", fallback=4)
+    return AdaptiveThrottle(
+        batch_size=config.getint("sending", "batch_size", fallback=50),
+        workers=workers,
+        max_batch=config.getint("sending", "max_batch_size", fallback=0) or None,
+        max_workers=config.getint("sending", "max_workers", fallback=2 * workers),
+        target_latency=config.getfloat("sending", "target_latency", fallback=10.0),
+        max_per_minute=config.getfloat("sending", "max_per_minute", fallback=0),
+        adaptive=config.getboolean("sending", "adaptive", fallback=True),
+    )
@@ -0,0 +1,402 @@
+import mailbox
+import os
+import re
+import smtplib
+import ssl
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from email.message import EmailMessage
+from email.policy import SMTP
+from email.utils import formatdate, make_msgid
+
+from journal import DRAFT, SendJournal
+from lazy import LazyModule
+from stats import timed
+
+exchangelib = LazyModule("exchangelib")
+
+TRANSPORTS = ("ews", "smtp", "file")
+
+
+# the To header of a message sent to its recipients in Bcc
+UNDISCLOSED = "undisclosed-recipients:;"
+
+
+def mime_message(email, sender: str = None, to: str = None) -> EmailMessage:
+    message = EmailMessage()
+    message["Subject"] = email.subject
+    message["To"] = to or str(email.address)
+    if sender:
+        message["From"] = sender
+    message["Date"] = formatdate(localtime=True)
+    # make_msgid looks up the host name on every call without a domain
+    domain = sender.rpartition("@")[2] if sender and "@" in sender else "bulkmail.local"
+    message["Message-ID"] = make_msgid(domain=domain)
+    message.set_content(email.message, subtype="html")
+    return message
+
+
+def shared_messages(emails: list, limit: int) -> list:
+    """The emails in groups of at most `limit` with the same subject and message, in order of appearance."""
+    groups = {}
+    for email in emails:
+        groups.setdefault((email.subject, email.message), []).append(email)
+    return [group[i:i + limit] for group in groups.values() for i in range(0, len(group), limit)]
+
+
+class Transport(ABC):
+    """Delivers batches of emails for a sender.
+
+    `send` returns True or the exception for every email, in order, and is called from several worker
+    threads at once. `open` and `close` are called once per job.
+    With `bcc` above 1, emails of a batch with the same subject and message go out as one message to up to
+    `bcc` recipients in Bcc, where the transport supports it. The recipients do not see each other.
+    """
+
+    name = ""
+    bcc = 0
+
+    def messages(self, emails: list) -> list:
+        """The emails grouped into the messages that are sent, one per email without `bcc`."""
+        if self.bcc > 1:
+            return shared_messages(emails, self.bcc)
+        return [[email] for email in emails]
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abstractmethod
+    def send(self, emails: list) -> list:
+        pass
+
+
+class EwsTransport(Transport):
+    """Creates drafts with bulk_create and sends them with bulk_send on an exchangelib Account.
+
+    Only `bulk_create`, `bulk_send` and `drafts` are used on the account, so any object providing them works.
+    Drafts whose sending failed are kept and sent again on a retry. With a `journal`, every draft is recorded
+    and drafts left over from an earlier run are sent instead of created again. A draft in Bcc is recorded
+    for each of its recipients and sent once.
+    """
+
+    name = "ews"
+
+    def __init__(self, account, journal: SendJournal = None, bcc: int = 0):
+        self.account = account
+        self.journal = journal
+        self.bcc = bcc
+        self.drafts = {}  # id(email) -> (id, changekey) of drafts that were created but not sent
+        self.sent_drafts = set()  # ids of drafts sent in this job, for recipients of one retried in another batch
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.drafts = {}
+        self.sent_drafts = set()
+
+    @staticmethod
+    def build_message(emails: list) -> "exchangelib.Message":
+        email = emails[0]
+        if len(emails) == 1:
+            return exchangelib.Message(
+                subject=email.subject, body=exchangelib.HTMLBody(email.message), to_recipients=[email.address]
+            )
+        return exchangelib.Message(
+            subject=email.subject, body=exchangelib.HTMLBody(email.message), bcc_recipients=[e.address for e in emails]
+        )
+
+    def existing_draft(self, email) -> tuple | None:
+        if id(email) in self.drafts:
+            return self.drafts[id(email)]
+        if self.journal is None or email.key is None:
+            return None
+        return self.journal.draft(email.key)
+
+    def send(self, emails: list) -> list:
+        statuses = {}
+        drafted = {}  # (id, changekey) -> the emails the draft is for
+        new = []
+        for email in emails:
+            draft = self.existing_draft(email)
+            if draft is None:
+                new.append(email)
+            elif draft[0] in self.sent_drafts:
+                statuses[id(email)] = True
+            else:
+                drafted.setdefault(draft, []).append(email)
+        if new:
+            messages = self.messages(new)
+            try:
+                with timed("create drafts", len(new)):
+                    drafts = self.account.bulk_create(
+                        folder=self.account.drafts, items=[self.build_message(m) for m in messages]
+                    )
+            except Exception as e:
+                drafts = [e] * len(messages)
+            entries = []
+            for message, draft in zip(messages, drafts):
+                if isinstance(draft, Exception):
+                    statuses.update((id(email), draft) for email in message)
+                else:
+                    drafted[(draft.id, draft.changekey)] = message
+                    entries += [(email.key, DRAFT, email.address, {"id": draft.id, "changekey": draft.changekey})
+                                for email in message]
+            if self.journal is not None:
+                self.journal.record([e for e in entries if e[0] is not None])
+        if drafted:
+            try:
+                with timed("send drafts", sum(map(len, drafted.values()))):
+                    results = self.account.bulk_send(ids=list(drafted))
+            except Exception as e:
+                results = [e] * len(drafted)
+            with self.lock:
+                for (draft, message), status in zip(drafted.items(), results):
+                    if status is True:
+                        self.sent_drafts.add(draft[0])
+                    for email in message:
+                        statuses[id(email)] = status
+                        if status is True:
+                            self.drafts.pop(id(email), None)
+                        else:
+                            # the draft exists, a retry sends it instead of creating another one
+                            self.drafts[id(email)] = draft
+        return [statuses[id(email)] for email in emails]
+
+
+class SmtpTransport(Transport):
+    """Sends over SMTP, keeping authenticated connections open for the whole job.
+
+    Every worker takes an idle connection or opens a new one and hands it back after its batch, so a job
+    connects, starts TLS and logs in once per worker instead of once per email. If the server offers
+    PIPELINING, MAIL, RCPT and DATA go out together, which saves two round trips per email.
+    `security` is "starttls", "ssl" or "none". A message in Bcc has a RCPT for every recipient and
+    "undisclosed-recipients" as To.
+    """
+
+    name = "smtp"
+
+    def __init__(self, host: str, port: int = 587, username: str = None, password: str = None,
+                 security: str = "starttls", sender: str = None, timeout: float = 60.0, bcc: int = 0):
+        if security not in ("starttls", "ssl", "none"):
+            raise ValueError(f"Unknown SMTP security {security!r}, use starttls, ssl or none")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.sender = sender or username
+        self.timeout = timeout
+        self.bcc = bcc
+        self.idle = []
+        self.connections = 0  # opened during this job, for benchmarks
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.connections = 0
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for smtp in idle:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                smtp.close()
+
+    def connect(self) -> smtplib.SMTP:
+        context = ssl.create_default_context()
+        if self.security == "ssl":
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=context)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.security == "starttls":
+                smtp.starttls(context=context)
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        with self.lock:
+            self.connections += 1
+        return smtp
+
+    def connection(self) -> smtplib.SMTP:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return self.connect()
+
+    def send(self, emails: list) -> list:
+        statuses = {}
+        error = None  # of everything not sent when the connection broke
+        smtp = None
+        try:
+            smtp = self.connection()
+            for message in self.messages(emails):
+                try:
+                    try:
+                        refused = self.deliver(smtp, message)
+                    except smtplib.SMTPServerDisconnected:
+                        # the server closed a connection that was idle for too long
+                        smtp.close()
+                        smtp = None
+                        smtp = self.connect()
+                        refused = self.deliver(smtp, message)
+                    for email in message:
+                        reply = refused.get(str(email.address))
+                        statuses[id(email)] = True if reply is None else smtplib.SMTPRecipientsRefused(
+                            {str(email.address): reply})
+                except smtplib.SMTPServerDisconnected:
+                    raise
+                except smtplib.SMTPResponseException as e:
+                    statuses.update((id(email), e) for email in message)
+                    if e.smtp_code == 421:
+                        # the server is closing the connection
+                        smtp.close()
+                        smtp = None
+                        error = e
+                        break
+                except smtplib.SMTPException as e:
+                    # refused recipients and the like, the connection is fine
+                    statuses.update((id(email), e) for email in message)
+        except OSError as e:
+            # no connection, or it broke: everything not sent yet failed with the same error
+            if smtp is not None:
+                smtp.close()
+                smtp = None
+            error = e
+        if smtp is not None:
+            with self.lock:
+                self.idle.append(smtp)
+        return [statuses.get(id(email), error) for email in emails]
+
+    def deliver(self, smtp: smtplib.SMTP, emails: list) -> dict:
+        """Send one message to all of `emails`, returns the refused recipients like smtplib's sendmail."""
+        message = mime_message(emails[0], self.sender, to=UNDISCLOSED if len(emails) > 1 else None)
+        addresses = [str(email.address) for email in emails]
+        with timed("smtp deliver", len(emails)):
+            if smtp.has_extn("pipelining") and all(a.isascii() for a in addresses) and (self.sender or "").isascii():
+                return self.pipelined(smtp, self.sender or "", addresses, message.as_bytes(policy=SMTP))
+            return smtp.send_message(message, from_addr=self.sender or "", to_addrs=addresses)
+
+    @staticmethod
+    def pipelined(smtp: smtplib.SMTP, sender: str, recipients: list, data: bytes) -> dict:
+        smtp.send(f"MAIL FROM:<{sender}>\r\n" + "".join(f"RCPT TO:<{r}>\r\n" for r in recipients) + "DATA\r\n")
+        mail = smtp.getreply()
+        refused = {recipient: reply for recipient in recipients
+                   if (reply := smtp.getreply())[0] not in (250, 251)}
+        start = smtp.getreply()
+        if start[0] == 354 and (mail[0] != 250 or len(refused) == len(recipients)):
+            # a server should refuse DATA without a recipient, end the empty message if it did not
+            smtp.send(b".\r\n")
+            smtp.getreply()
+        if mail[0] != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(mail[0], mail[1], sender)
+        if len(refused) == len(recipients):
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if start[0] != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(*start)
+        data = re.sub(rb"(?m)^\.", b"..", data)
+        if not data.endswith(b"\r\n"):
+            data += b"\r\n"
+        smtp.send(data + b".\r\n")
+        code, reply = smtp.getreply()
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, reply)
+        return refused
+
+
+class FileTransport(Transport):
+    """Writes every email to `path`, a directory of .eml files or with `format` "mbox" a single mbox file.
+
+    For trying templates and measuring everything but the server, nothing is sent.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str = "outbox", format: str = "eml", sender: str = None):
+        if format not in ("eml", "mbox"):
+            raise ValueError(f"Unknown file format {format!r}, use eml or mbox")
+        self.path = path
+        self.format = format
+        self.sender = sender
+        self.mbox = None
+        self.lock = threading.Lock()
+
+    def open(self):
+        if self.format == "mbox":
+            self.mbox = mailbox.mbox(self.path)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+
+    def close(self):
+        if self.mbox is not None:
+            self.mbox.close()
+            self.mbox = None
+
+    def send(self, emails: list) -> list:
+        with timed("write files", len(emails)):
+            return self.write(emails)
+
+    def write(self, emails: list) -> list:
+        messages = [mime_message(email, self.sender) for email in emails]
+        if self.format == "mbox":
+            try:
+                with self.lock:
+                    for message in messages:
+                        self.mbox.add(message)
+                    self.mbox.flush()
+            except OSError as e:
+                return [e] * len(emails)
+            return [True] * len(emails)
+        statuses = []
+        for email, message in zip(emails, messages):
+            # the row identity keeps a re-run from writing the same email twice
+            name = f"{email.key or uuid.uuid4().hex}.eml"
+            try:
+                with open(os.path.join(self.path, name), "wb") as f:
+                    f.write(message.as_bytes(policy=SMTP))
+                statuses.append(True)
+            except OSError as e:
+                statuses.append(e)
+        return statuses
+
+
+def transport_from_config(config, email: str, password: str, get_account, journal: SendJournal = None) -> Transport:
+    """The transport chosen by [sending] transport, set up from the [smtp] or [file] section.
+
+    `get_account(email, password)` is only called for EWS.
+    """
+    kind = config.get("sending", "transport", fallback="ews")
+    bcc = config.getint("sending", "bcc", fallback=0)
+    if kind == "ews":
+        return EwsTransport(get_account(email, password), journal, bcc)
+    if kind == "smtp":
+        security = config.get("smtp", "security", fallback="starttls")
+        return SmtpTransport(
+            host=config.get("smtp", "host", fallback="smtp.office365.com"),
+            port=config.getint("smtp", "port", fallback=465 if security == "ssl" else 587),
+            username=config.get("smtp", "username", fallback=email),
+            password=password,
+            security=security,
+            sender=config.get("smtp", "from", fallback=email),
+            timeout=config.getfloat("smtp", "timeout", fallback=60.0),
+            bcc=bcc,
+        )
+    if kind == "file":
+        return FileTransport(
+            path=config.get("file", "path", fallback="outbox"),
+            format=config.get("file", "format", fallback="eml"),
+            sender=email,
+        )
+    raise ValueError(f"Unknown transport {kind!r}, use {', '.join(TRANSPORTS)}")